@@ -1,12 +1,17 @@
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import Annotated
-from .database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+from functools import partial
+from .database import get_db, get_async_db
 from . import models, schemas
+from .services.writer import run_write, run_write_async
+from .services.auth_cache import auth_cache, CachedUser, TokenClaims
+from .services.password_hasher import get_password_hasher, PasswordHasherBusy
 from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
 
 
@@ -15,22 +20,60 @@ router = APIRouter(
     tags=["auth"],
 )
 
+# Same endpoints backed by AsyncSession, mounted instead of `router` when DB_MODE=async
+async_router = APIRouter(
+    prefix="/auth",
+    tags=["auth"],
+)
+
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
 # --- Helper Functions ---
 
-def verify_password(plain_password, hashed_password):
-    return bcrypt_context.verify(plain_password, hashed_password)
+def _hasher_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password operations in progress, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+def verify_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    """Returns whether the password matches, and a new hash if the stored one uses an outdated cost."""
+    try:
+        return get_password_hasher().verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def verify_password_async(plain_password, hashed_password) -> tuple[bool, str | None]:
+    try:
+        return await get_password_hasher().verify_and_update_async(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
 
 
 def get_password_hash(password):
-    return bcrypt_context.hash(password)
+    try:
+        return get_password_hasher().hash(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+
+
+async def get_password_hash_async(password):
+    try:
+        return await get_password_hasher().hash_async(password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
 
 
+# jose (and cryptography behind it) is imported on first use, to keep it out
+# of startup; after that the import is a dict lookup
 def create_access_token(data: dict, expires_delta: timedelta):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + expires_delta
     
@@ -39,28 +82,110 @@ def create_access_token(data: dict, expires_delta: timedelta):
     return encoded_jwt
 
 
+def _insert_user(db: Session, username: str, email: str, hashed_password: str) -> models.User:
+    new_user = models.User(
+        username=username,
+        email=email,
+        hashed_password=hashed_password,
+        profile_pic_pokemon_id=None # Default value
+    )
+    db.add(new_user)
+    db.flush()
+    return new_user
+
+
+def _rehash_password(db: Session, user_id: int, old_hash: str, new_hash: str):
+    # Skipped if the password was changed since the login read it
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id, models.User.hashed_password == old_hash)
+        .values(hashed_password=new_hash)
+    )
+
+
+def _login_query(username: str):
+    # Plain columns, so they stay readable after the read transaction ends
+    return select(models.User.id, models.User.username, models.User.hashed_password).where(
+        models.User.username == username
+    )
+
+
+def _registration_conflict():
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Username or Email already registered"
+    )
+
+
 # --- Dependencies ---
 
-def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _verified_claims(token: str) -> TokenClaims:
+    claims = auth_cache.get_claims(token)
+    if claims is not None:
+        return claims
+
+    from jose import JWTError, jwt
+
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
-    if user is None:
+    username = payload.get("sub")
+    user_id = payload.get("id")
+    if username is None or not isinstance(user_id, int):
         raise credentials_exception
+
+    claims = TokenClaims(username, user_id, payload.get("exp"))
+    # Tokens without an expiry would never leave the cache
+    if isinstance(claims.expires_at, int):
+        auth_cache.put_claims(token, claims)
+    return claims
+
+
+def decode_token_data(token: str) -> schemas.TokenData:
+    return schemas.TokenData(username=_verified_claims(token).username)
+
+
+def _authenticated_user(user: Optional[CachedUser], claims: TokenClaims) -> CachedUser:
+    # A token issued before a rename must not authenticate the renamed user
+    if user is None or user.username != claims.username:
+        raise _credentials_exception()
     return user
 
 
+def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], db: Session = Depends(get_db)) -> CachedUser:
+    """
+    The token's user as a `CachedUser` snapshot, not an ORM instance: no
+    password hash and no relationships. Load the row when a handler needs more.
+    """
+    claims = _verified_claims(token)
+    user = auth_cache.get_user(claims.user_id)
+    if user is None or user.username != claims.username:
+        generation = auth_cache.generation
+        row = db.get(models.User, claims.user_id)
+        user = auth_cache.put_user(row, generation) if row is not None else None
+    return _authenticated_user(user, claims)
+
+
+async def get_current_user_async(token: Annotated[str, Depends(oauth2_bearer)], db: AsyncSession = Depends(get_async_db)) -> CachedUser:
+    claims = _verified_claims(token)
+    user = auth_cache.get_user(claims.user_id)
+    if user is None or user.username != claims.username:
+        generation = auth_cache.generation
+        row = await db.get(models.User, claims.user_id)
+        user = auth_cache.put_user(row, generation) if row is not None else None
+    return _authenticated_user(user, claims)
+
+
 # --- Endpoints ---
 
 @router.post("/register", status_code=status.HTTP_201_CREATED, response_model=schemas.UserResponse)
@@ -71,28 +196,20 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     ).first()
     
     if user_exists:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Username or Email already registered"
-        )
+        raise _registration_conflict()
+    # Don't hold a pooled connection while bcrypt runs
+    db.rollback()
 
     # 2. Hash the password
     hashed_password = get_password_hash(user.password)
 
-    # 3. Create User Model
-    new_user = models.User(
-        username=user.username,
-        email=user.email,
-        hashed_password=hashed_password,
-        profile_pic_pokemon_id=None # Default value
-    )
-
-    # 4. Save to DB
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    return new_user
+    # 3. Save to DB (a concurrent registration can still win the race)
+    try:
+        return run_write(db, partial(
+            _insert_user, username=user.username, email=user.email, hashed_password=hashed_password
+        ))
+    except IntegrityError:
+        raise _registration_conflict()
 
 
 @router.post("/token", response_model=schemas.Token)
@@ -101,15 +218,20 @@ def login_for_access_token(
     db: Session = Depends(get_db)
 ):
     # 1. Find user by username
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
+    user = db.execute(_login_query(form_data.username)).first()
+    # Don't hold a pooled connection while bcrypt runs
+    db.rollback()
     
     # 2. Verify user and password
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = verify_password(form_data.password, user.hashed_password) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash is not None:
+        run_write(db, partial(_rehash_password, user_id=user.id, old_hash=user.hashed_password, new_hash=new_hash))
     
     # 3. Create JWT Token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -118,4 +240,51 @@ def login_for_access_token(
         expires_delta=access_token_expires
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@async_router.post("/register", status_code=status.HTTP_201_CREATED, response_model=schemas.UserResponse)
+async def create_user_async(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user_exists = (await db.execute(select(models.User).filter(
+        (models.User.username == user.username) | (models.User.email == user.email)
+    ))).scalars().first()
+
+    if user_exists:
+        raise _registration_conflict()
+    await db.rollback()
+
+    # bcrypt is CPU-bound; keep it off the event loop
+    hashed_password = await get_password_hash_async(user.password)
+
+    try:
+        return await run_write_async(db, partial(
+            _insert_user, username=user.username, email=user.email, hashed_password=hashed_password
+        ))
+    except IntegrityError:
+        raise _registration_conflict()
+
+
+@async_router.post("/token", response_model=schemas.Token)
+async def login_for_access_token_async(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    db: AsyncSession = Depends(get_async_db)
+):
+    user = (await db.execute(_login_query(form_data.username))).first()
+    await db.rollback()
+
+    verified, new_hash = await verify_password_async(form_data.password, user.hashed_password) if user else (False, None)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if new_hash is not None:
+        await run_write_async(db, partial(_rehash_password, user_id=user.id, old_hash=user.hashed_password, new_hash=new_hash))
+
+    access_token = create_access_token(
+        data={"sub": user.username, "id": user.id},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -7,3 +7,115 @@ LAST_POKEMON_ID = 1025
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-fallback-key-change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+# Directory of pokeparty.db (and the vote buffer by default)
+DB_DIR = os.getenv("DB_DIR")  # defaults to data/
+
+# Database access mode: "sync" (threadpool + SessionLocal) or "async" (aiosqlite + AsyncSession)
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+
+# SQLite connection profile applied to every pooled connection: "throughput" or "durable"
+DB_PROFILE = os.getenv("DB_PROFILE", "throughput").lower()
+
+# Mutation path: "direct" commits on the request session, "queue" funnels
+# every write through the single-writer thread (app/services/writer.py)
+WRITE_MODE = os.getenv("WRITE_MODE", "direct").lower()
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "64"))
+WRITE_QUEUE_MAX_DELAY_MS = float(os.getenv("WRITE_QUEUE_MAX_DELAY_MS", "0"))
+
+# Vote ingestion: "direct" applies each vote in the request, "buffered" appends
+# it to an on-disk log and a background flusher applies votes in batches
+VOTE_MODE = os.getenv("VOTE_MODE", "direct").lower()
+VOTE_BUFFER_DIR = os.getenv("VOTE_BUFFER_DIR")  # defaults to data/vote-buffer
+VOTE_FLUSH_INTERVAL_MS = int(os.getenv("VOTE_FLUSH_INTERVAL_MS", "500"))
+VOTE_FLUSH_MAX_VOTES = int(os.getenv("VOTE_FLUSH_MAX_VOTES", "500"))
+VOTE_BUFFER_MAX_SIZE = int(os.getenv("VOTE_BUFFER_MAX_SIZE", "10000"))
+VOTE_BUFFER_REPLAY_ON_STARTUP = os.getenv("VOTE_BUFFER_REPLAY_ON_STARTUP", "true").lower() == "true"
+VOTE_BUFFER_FSYNC = os.getenv("VOTE_BUFFER_FSYNC", "true").lower() == "true"
+
+# Battle sessions: "table" stores a ComparisonSession row per pair, "token"
+# hands out HMAC-signed stateless tokens (app/services/battle_tokens.py)
+SESSION_MODE = os.getenv("SESSION_MODE", "table").lower()
+BATTLE_TOKEN_TTL_SECONDS = int(os.getenv("BATTLE_TOKEN_TTL_SECONDS", "600"))
+
+# Expired ComparisonSession cleanup (app/services/session_reaper.py); an
+# interval of 0 disables the reaper
+SESSION_REAPER_INTERVAL_SECONDS = float(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "60"))
+SESSION_REAPER_BATCH_SIZE = int(os.getenv("SESSION_REAPER_BATCH_SIZE", "500"))
+
+# How often the server checks whether an offline job (the leaderboard
+# recompute, the favorite counter reconcile) rewrote a table it mirrors in
+# memory, and reloads the mirror (app/services/view_generations.py); an
+# interval of 0 disables the check
+VIEW_RELOAD_INTERVAL_SECONDS = float(os.getenv("VIEW_RELOAD_INTERVAL_SECONDS", "10"))
+
+# Pair selection for pair-to-battle: "uniform", "undervoted", "close" or
+# "balanced" (app/services/matchmaking.py)
+MATCHMAKING_STRATEGY = os.getenv("MATCHMAKING_STRATEGY", "uniform").lower()
+MATCHMAKING_ELO_WINDOW = int(os.getenv("MATCHMAKING_ELO_WINDOW", "64"))
+
+# Most pairs GET /popularity/pairs-to-battle hands out per request
+PAIRS_TO_BATTLE_MAX_COUNT = int(os.getenv("PAIRS_TO_BATTLE_MAX_COUNT", "50"))
+
+# Most votes POST /popularity/votes accepts per request
+VOTES_BATCH_MAX_SIZE = int(os.getenv("VOTES_BATCH_MAX_SIZE", "100"))
+
+# Leaderboard snapshots for GET /popularity/{id}/history (app/services/snapshots.py).
+# Snapshots older than the hourly window are thinned to one per day, and
+# those older than the daily window to one per week; an interval of 0
+# disables the job
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600"))
+SNAPSHOT_HOURLY_RETENTION_HOURS = int(os.getenv("SNAPSHOT_HOURLY_RETENTION_HOURS", "48"))
+SNAPSHOT_DAILY_RETENTION_DAYS = int(os.getenv("SNAPSHOT_DAILY_RETENTION_DAYS", "90"))
+
+# Authentication caches (app/services/auth_cache.py): verified tokens are kept
+# until they expire, user rows for the TTL; a size of 0 disables a cache
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "1024"))
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+
+# Favorites (app/services/favorites.py): per-user bitsets of favorite Pokemon
+# kept in memory for set operations; a size of 0 disables the cache
+FAVORITES_CACHE_SIZE = int(os.getenv("FAVORITES_CACHE_SIZE", "4096"))
+FAVORITES_CACHE_TTL_SECONDS = float(os.getenv("FAVORITES_CACHE_TTL_SECONDS", "60"))
+
+# Password hashing (app/services/password_hasher.py): bcrypt runs on its own
+# pool of PASSWORD_HASH_WORKERS threads (default: half the CPU cores) with at
+# most PASSWORD_HASH_QUEUE_SIZE jobs waiting; 0 workers hashes inline on the
+# request thread. Hashes with a different cost are upgraded on the next login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "16"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Pokemon of the day (app/services/pokemon_otd.py): a seeded schedule is
+# generated POTD_SCHEDULE_DAYS ahead, never repeating a Pokemon within
+# POTD_NO_REPEAT_DAYS. Days start at midnight in POTD_TIMEZONE unless the
+# request passes ?tz=
+POTD_TIMEZONE = os.getenv("POTD_TIMEZONE", "UTC")
+POTD_SEED = os.getenv("POTD_SEED", "pokeparty")
+POTD_SCHEDULE_DAYS = int(os.getenv("POTD_SCHEDULE_DAYS", "180"))
+POTD_NO_REPEAT_DAYS = int(os.getenv("POTD_NO_REPEAT_DAYS", "365"))
+
+# Pre-encoded responses for polled read endpoints (app/services/response_cache.py)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_MAX_AGE_SECONDS = int(os.getenv("RESPONSE_CACHE_MAX_AGE_SECONDS", "5"))
+
+# Keyset-paginated lists (GET /popularity/page, /users/favorite-pokemons/page)
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+
+# Metrics (app/services/metrics.py): per-route HTTP and per-statement SQL
+# latency histograms, served in the Prometheus text format at GET /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Query tracking (app/services/query_tracker.py): statements slower than
+# SLOW_QUERY_MS are logged with their parameters redacted, and one SQL string
+# run QUERY_REPEAT_THRESHOLD times in a request is logged as a likely N+1;
+# 0 disables either check
+QUERY_TRACKING_ENABLED = os.getenv("QUERY_TRACKING_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+
+# Startup (app/services/startup.py): open the pool's connections and encode
+# the most polled responses before the worker reports ready
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
@@ -1,28 +1,70 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import os
+from . import config
+from .config import DB_PROFILE, METRICS_ENABLED, QUERY_TRACKING_ENABLED
+from .db_profiles import get_profile, apply_connection_profile
+from .services.metrics import instrument_engine
+from .services.query_tracker import track_engine
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_DIR = os.path.join(BASE_DIR, 'data')
-os.makedirs(DB_DIR, exist_ok=True)
+DB_DIR = config.DB_DIR or os.path.join(BASE_DIR, 'data')
 
 DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'pokeparty.db')}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{os.path.join(DB_DIR, 'pokeparty.db')}"
 
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    **get_profile(DB_PROFILE)["pool"]
 )
+apply_connection_profile(engine, DB_PROFILE)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine is only connected when DB_MODE=async; creating it is cheap.
+# expire_on_commit=False keeps returned ORM objects readable after commit
+# without triggering implicit (blocking) lazy loads.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_profile(DB_PROFILE)["pool"])
+apply_connection_profile(async_engine.sync_engine, DB_PROFILE)
+
+
+# Creating the engines doesn't connect; the data directory is only needed
+# (and created) once the first connection is opened
+def _ensure_db_dir(dialect, conn_rec, cargs, cparams):
+    os.makedirs(DB_DIR, exist_ok=True)
+
+
+event.listen(engine, "do_connect", _ensure_db_dir)
+event.listen(async_engine.sync_engine, "do_connect", _ensure_db_dir)
+
+if METRICS_ENABLED:
+    instrument_engine(engine, "sync")
+    instrument_engine(async_engine.sync_engine, "async")
+if QUERY_TRACKING_ENABLED:
+    track_engine(engine)
+    track_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 
 def get_db():
     db = SessionLocal()
     try:
-        db.execute(text("PRAGMA foreign_keys = ON"))    
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,19 +1,135 @@
-from fastapi import FastAPI, Depends, status
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+import json
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from . import auth
 from .routers import users, popularity
-from .database import get_db, engine
-from .services.pokemon_otd import get_or_create_pokemon_of_the_day
-from . import models
+from .database import get_db, get_async_db, engine, async_engine, SessionLocal, DATABASE_URL, DB_DIR
+from .services.pokemon_otd import (
+    current_pokemon_of_the_day,
+    current_pokemon_of_the_day_async,
+    refresh_schedule,
+    potd_cache,
+    UnknownTimezone,
+)
+from .services.response_cache import get_response_cache
+from .services.metrics import MetricsMiddleware, get_metrics_registry
+from .services.query_tracker import QueryTrackingMiddleware
+from .services.auth_cache import get_auth_cache
+from .services.favorites import get_favorites_cache
+from .services.favorite_counts import favorite_count_index
+from .services.leaderboard_index import leaderboard_index
+from .services.matchmaking import matchmaker
+from .services.writer import start_writer, stop_writer
+from .services.vote_buffer import start_vote_buffer, stop_vote_buffer
+from .services.battle_tokens import start_battle_tokens, stop_battle_tokens
+from .services.session_reaper import get_session_reaper, start_session_reaper, stop_session_reaper
+from .services.snapshots import start_snapshot_job, stop_snapshot_job
+from .services.view_generations import (
+    FAVORITE_COUNTS,
+    LEADERBOARD,
+    get_generation_watcher,
+    start_generation_watcher,
+    stop_generation_watcher,
+)
+from .services.password_hasher import get_password_hasher, stop_password_hasher
+from .services.startup import get_startup, prepare_schema, warm_pool, warm_pool_async
+from .config import (
+    DB_MODE,
+    WRITE_MODE,
+    VOTE_MODE,
+    VOTE_BUFFER_DIR,
+    VOTE_BUFFER_REPLAY_ON_STARTUP,
+    SESSION_MODE,
+    SECRET_KEY,
+    SESSION_REAPER_INTERVAL_SECONDS,
+    SNAPSHOT_INTERVAL_SECONDS,
+    VIEW_RELOAD_INTERVAL_SECONDS,
+    METRICS_ENABLED,
+    QUERY_TRACKING_ENABLED,
+    STARTUP_WARMUP,
+)
+import os
+
+
+ASYNC_DB = DB_MODE == "async"
+
+# Phase timings for GET /health/ready, see services/startup.py
+startup = get_startup()
 
 
-models.Base.metadata.create_all(bind=engine)
+def _reload_leaderboard(db: Session):
+    leaderboard_index.reload(db)
+    matchmaker.reload(db)
 
-app = FastAPI(root_path="/api")
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(popularity.router)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup.phase("schema"):
+        prepare_schema(engine)
+    with startup.phase("load"):
+        with SessionLocal() as db:
+            _reload_leaderboard(db)
+            favorite_count_index.reload(db)
+            refresh_schedule(db)
+    with startup.phase("services"):
+        if WRITE_MODE == "queue":
+            start_writer(DATABASE_URL)
+        if VOTE_MODE == "buffered":
+            start_vote_buffer(
+                VOTE_BUFFER_DIR or os.path.join(DB_DIR, "vote-buffer"),
+                SessionLocal,
+                replay=VOTE_BUFFER_REPLAY_ON_STARTUP,
+            )
+        if SESSION_MODE == "token":
+            start_battle_tokens(SECRET_KEY)
+        if SESSION_REAPER_INTERVAL_SECONDS > 0:
+            start_session_reaper(SessionLocal)
+        if SNAPSHOT_INTERVAL_SECONDS > 0:
+            start_snapshot_job(SessionLocal)
+        if VIEW_RELOAD_INTERVAL_SECONDS > 0:
+            # Picks up `python -m app.services.recompute` and favorite_counts runs
+            start_generation_watcher(
+                SessionLocal, {LEADERBOARD: _reload_leaderboard, FAVORITE_COUNTS: favorite_count_index.reload}
+            )
+    if STARTUP_WARMUP:
+        with startup.phase("warmup"):
+            if ASYNC_DB:
+                await warm_pool_async(async_engine)
+            else:
+                warm_pool(engine)
+            with SessionLocal() as db:
+                popularity.warm_leaderboard_response(db)
+            _warm_potd_response()
+    startup.mark_ready()
+    yield
+    startup.mark_stopping()
+    stop_generation_watcher()
+    stop_snapshot_job()
+    stop_session_reaper()
+    stop_battle_tokens()
+    # Final flush goes through the writer, so stop the buffer first
+    stop_vote_buffer()
+    stop_writer()
+    stop_password_hasher()
+
+
+app = FastAPI(root_path="/api", lifespan=lifespan)
+if ASYNC_DB:
+    app.include_router(auth.async_router)
+    app.include_router(users.async_router)
+    app.include_router(popularity.async_router)
+else:
+    app.include_router(auth.router)
+    app.include_router(users.router)
+    app.include_router(popularity.router)
     
 # CORS middleware
 app.add_middleware( 
@@ -28,6 +144,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if QUERY_TRACKING_ENABLED:
+    app.add_middleware(QueryTrackingMiddleware)
+
+# Outermost, so the latency includes CORS handling
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    metrics = get_metrics_registry()
+    metrics.stats("auth_cache", lambda: get_auth_cache().stats())
+    metrics.stats("favorites_cache", lambda: get_favorites_cache().stats())
+    metrics.stats("response_cache", lambda: get_response_cache().stats())
+    metrics.stats("password_hasher", lambda: get_password_hasher().stats())
+    metrics.stats("session_reaper", lambda: reaper.stats() if (reaper := get_session_reaper()) else None)
+    metrics.stats("view_generations", lambda: watcher.stats() if (watcher := get_generation_watcher()) else None)
+    metrics.stats("startup", startup.stats)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def get_metrics():
+        # async, so the threadpool gauge is read on the event loop
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 # ROUTES
 @app.get("/")
@@ -35,9 +172,57 @@ def hello_world():
     return {"Hello, Worlddddddddddddddd!"}
 
 
+@app.get("/health/ready", include_in_schema=False)
+async def health_ready():
+    """503 until the lifespan has finished (and again once shutdown starts), with the startup breakdown."""
+    return JSONResponse(
+        {"status": startup.state, "startup": startup.stats()},
+        status_code=status.HTTP_200_OK if startup.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
 # pokemon of the day route
-@app.get("/pokemon-otd", status_code=status.HTTP_200_OK)
-def get_pokemon_of_the_day(db: Session = Depends(get_db)):
-    potd = get_or_create_pokemon_of_the_day(db)
-    
-    return {"pokemon_of_the_day": {"day_date": potd.day_date, "pokemon_id": potd.pokemon_id}}
\ No newline at end of file
+def _unknown_timezone(tz: str):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown timezone: {tz}")
+
+
+def _potd_json(potd) -> bytes:
+    return json.dumps({"pokemon_of_the_day": potd._asdict()}, separators=(",", ":")).encode()
+
+
+def _potd_response(request: Request, tz: Optional[str], potd):
+    # Shared caches may keep the answer until the day ends in that timezone
+    max_age = max(int(potd_cache.next_day_starts_at(potd, tz) - time.time()), 0)
+    return get_response_cache().serve(
+        request, ("pokemon-otd", tz), potd, lambda: _potd_json(potd), f"public, max-age={max_age}",
+    )
+
+
+def _warm_potd_response():
+    """Encodes `GET /pokemon-otd` (default timezone) ahead of the first request."""
+    potd = potd_cache.current()
+    if potd is not None:
+        get_response_cache().put(("pokemon-otd", None), potd, _potd_json(potd))
+
+
+if ASYNC_DB:
+    @app.get("/pokemon-otd", status_code=status.HTTP_200_OK)
+    async def get_pokemon_of_the_day(request: Request, tz: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+        try:
+            potd = await current_pokemon_of_the_day_async(db, tz)
+        except UnknownTimezone:
+            raise _unknown_timezone(tz)
+
+        return _potd_response(request, tz, potd)
+else:
+    @app.get("/pokemon-otd", status_code=status.HTTP_200_OK)
+    def get_pokemon_of_the_day(request: Request, tz: Optional[str] = None, db: Session = Depends(get_db)):
+        try:
+            potd = current_pokemon_of_the_day(db, tz)
+        except UnknownTimezone:
+            raise _unknown_timezone(tz)
+        
+        return _potd_response(request, tz, potd)
+
+
+startup.record("import", time.perf_counter() - _IMPORT_STARTED)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, SmallInteger, Boolean, String, ForeignKey, DateTime, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime, timezone
@@ -25,6 +25,17 @@ class favorite_pokemon(Base):
 
     user = relationship("User", back_populates="favorite_pokemons")
 
+    # A Pokemon is favorited at most once per user
+    __table_args__ = (Index("ux_favorite_pokemons_user_pokemon", user_id, pokemon_id, unique=True),)
+
+
+class FavoriteCount(Base):
+    """How many users have each Pokemon as a favorite, kept up to date by every favorites write."""
+    __tablename__ = "favorite_counts"
+
+    pokemon_id: int = Column(Integer, primary_key=True)
+    count: int = Column(Integer, nullable=False, default=0)
+
 
 class pokemon_of_the_day(Base):
     __tablename__ = 'pokemon_of_the_day'
@@ -38,9 +49,12 @@ class PopularityLeaderboard(Base):
     __tablename__ = "popularity_leaderboard"
 
     id: int = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    pokemon_id: int = Column(Integer, nullable=False, index=True)
+    pokemon_id: int = Column(Integer, unique=True, index=True, nullable=False)
     elo: int = Column(Integer, nullable=False)
 
+    # Rank order, for keyset pagination
+    __table_args__ = (Index("ix_popularity_leaderboard_rank", elo.desc(), pokemon_id),)
+
 
 class ComparisonSession(Base):
     __tablename__ = "comparison_sessions"
@@ -50,4 +64,45 @@ class ComparisonSession(Base):
     pokemon1_id: int = Column(Integer, nullable=False)
     pokemon2_id: int = Column(Integer, nullable=False)
     created_at: datetime = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
-    expires_at: datetime = Column(DateTime, nullable=False)
+    expires_at: datetime = Column(DateTime, index=True, nullable=False)
+
+
+class Vote(Base):
+    """Append-only log of every applied vote, used to rebuild the leaderboard."""
+    __tablename__ = "votes"
+
+    id: int = Column(Integer, primary_key=True, autoincrement=True)
+    pokemon1_id: int = Column(SmallInteger, nullable=False)
+    pokemon2_id: int = Column(SmallInteger, nullable=False)
+    pokemon1_won: bool = Column(Boolean, nullable=False)
+    created_at: int = Column(Integer, nullable=False)  # unix seconds
+
+
+class LeaderboardSnapshot(Base):
+    """
+    Whole leaderboard at one point in time: Elo and rank of every Pokemon as
+    little-endian int16 arrays indexed by pokemon_id - 1.
+    """
+    __tablename__ = "leaderboard_snapshots"
+
+    id: int = Column(Integer, primary_key=True, autoincrement=True)
+    taken_at: int = Column(Integer, index=True, nullable=False)  # unix seconds
+    resolution: str = Column(String, nullable=False)  # hourly, daily or weekly
+    elos: bytes = Column(LargeBinary, nullable=False)
+    ranks: bytes = Column(LargeBinary, nullable=False)
+
+
+class VoteBufferCheckpoint(Base):
+    """Highest buffered vote sequence number already applied to the leaderboard."""
+    __tablename__ = "vote_buffer_checkpoint"
+
+    id: int = Column(Integer, primary_key=True)
+    last_seq: int = Column(Integer, nullable=False)
+
+
+class ViewGeneration(Base):
+    """Bumped by offline jobs that rewrite a table the server mirrors in memory (services/view_generations.py)."""
+    __tablename__ = "view_generations"
+
+    name: str = Column(String, primary_key=True)
+    generation: int = Column(Integer, nullable=False)
@@ -1,15 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, insert, delete, or_
 from sqlalchemy.orm import Session
-from typing import List
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import orjson
+from ..config import (
+    LAST_POKEMON_ID,
+    PAIRS_TO_BATTLE_MAX_COUNT,
+    VOTES_BATCH_MAX_SIZE,
+    RESPONSE_CACHE_MAX_AGE_SECONDS,
+    PAGE_DEFAULT_LIMIT,
+    PAGE_MAX_LIMIT,
+)
+from ..database import get_db, get_async_db
 from ..models import PopularityLeaderboard, ComparisonSession
-from ..schemas import PopularityBattlePair, PopularityLeaderboard as PopularityLeaderboardSchema
-import random
-from ..config import LAST_POKEMON_ID
+from ..schemas import (
+    PopularityBattlePair,
+    PopularityHistory,
+    PopularityRank,
+    PopularityVote,
+    PopularityVoteResult,
+    PopularityLeaderboard as PopularityLeaderboardSchema,
+    PopularityLeaderboardPage,
+)
 import uuid
-from ..services.ranking import update_elo_and_save
+from functools import partial
+from ..services.ranking import apply_elo_update, apply_elo_updates
+from ..services.writer import run_write, run_write_async
+from ..services.leaderboard_index import leaderboard_index, get_leaderboard_index, get_leaderboard_index_async
+from ..services.response_cache import get_response_cache
+from ..services.fast_json import rows_json
+from ..services.pagination import (
+    STREAM_BATCH_SIZE, InvalidCursor, decode_cursor, page, ndjson_batches, ndjson_batches_async
+)
+from ..services.matchmaking import get_matchmaker
+from ..services.vote_buffer import get_vote_buffer, SessionAlreadyVoted, VoteBufferFull
+from ..services.snapshots import history, history_async
+from ..services.battle_tokens import get_battle_tokens, BattleTicket, InvalidBattleToken, ExpiredBattleToken
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta, timezone
-from ..services.ranking import update_elo_and_save
 
 
 router = APIRouter(
@@ -17,67 +47,589 @@ router = APIRouter(
     tags=["Popularity"]
 )
 
-@router.get("/", response_model=List[PopularityLeaderboardSchema])
-def get_all(db: Session = Depends(get_db)):
-    return db.query(PopularityLeaderboard).all()
+# Same endpoints backed by AsyncSession, mounted instead of `router` when DB_MODE=async
+async_router = APIRouter(
+    prefix="/popularity",
+    tags=["Popularity"]
+)
 
 
-@router.get("/pair-to-battle", response_model=PopularityBattlePair)
-def get_pair_to_battle(db: Session = Depends(get_db)):
-    random1 = random.randint(1, LAST_POKEMON_ID)
-    random2 = random.randint(1, LAST_POKEMON_ID)
-    while random2 == random1:
-        random2 = random.randint(1, LAST_POKEMON_ID)
+# --- Write operations (run via run_write, see services/writer.py) ---
 
+def _create_session(db: Session, pokemon1_id: int, pokemon2_id: int) -> str:
     session_id = str(uuid.uuid4())
+    db.add(ComparisonSession(
+        session_id=session_id,
+        pokemon1_id=pokemon1_id,
+        pokemon2_id=pokemon2_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(minutes=10)
+    ))
+    return session_id
+
+
+def _create_sessions(db: Session, pairs: list[tuple[int, int]]) -> list[str]:
+    """Creates one session per pair with a single bulk INSERT (executemany)."""
     expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
+    rows = [
+        {"session_id": str(uuid.uuid4()), "pokemon1_id": pokemon1_id, "pokemon2_id": pokemon2_id, "expires_at": expires_at}
+        for pokemon1_id, pokemon2_id in pairs
+    ]
+    db.execute(insert(ComparisonSession), rows)
+    return [row["session_id"] for row in rows]
+
+
+def _check_winner(pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int) -> tuple[int, int]:
+    if winner_pokemon_id not in [pokemon1_id, pokemon2_id]:
+        raise HTTPException(status_code=400, detail="Winner pokemon ID does not match the battle pair")
+
+    return pokemon1_id, pokemon2_id
+
+
+def _check_vote(session: ComparisonSession | None, winner_pokemon_id: int) -> tuple[int, int] | None:
+    """Returns the battle pair, or None if the session has expired."""
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    session = ComparisonSession(
-        session_id=session_id,
-        pokemon1_id=random1,
-        pokemon2_id=random2,
-        expires_at=expires_at
+    if datetime.now(timezone.utc).replace(tzinfo=None) > session.expires_at:
+        return None
+
+    return _check_winner(session.pokemon1_id, session.pokemon2_id, winner_pokemon_id)
+
+
+def _consume_vote(db: Session, session_id: str, winner_pokemon_id: int) -> tuple[int, int] | None:
+    """
+    Validates the session, applies the vote and deletes the session.
+    Returns None (after deleting it) if the session has expired.
+    """
+    session = db.query(ComparisonSession).filter_by(session_id=session_id).first()
+    pair = _check_vote(session, winner_pokemon_id)
+
+    if pair is not None:
+        apply_elo_update(db, pair[0], pair[1], winner_pokemon_id)
+    db.delete(session)
+
+    return pair
+
+
+def _vote_result(session_id: str, status: str, pair: tuple[int, int] | None = None) -> dict:
+    result = {"session_id": session_id, "status": status}
+    if pair is not None:
+        result["pokemon1_id"], result["pokemon2_id"] = pair
+    return result
+
+
+def _check_votes(sessions: dict[str, ComparisonSession], votes: list[tuple[str, int]]) -> list[dict]:
+    """
+    Per-item counterpart of `_check_vote` for a batch. A session can only be
+    used once per batch; later votes on it are reported as not found.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    used = set()
+    results = []
+    for session_id, winner_pokemon_id in votes:
+        session = sessions.get(session_id)
+        if session is None or session_id in used:
+            results.append(_vote_result(session_id, "not_found"))
+            continue
+
+        pair = session.pokemon1_id, session.pokemon2_id
+        if now > session.expires_at:
+            used.add(session_id)
+            results.append(_vote_result(session_id, "expired", pair))
+        elif winner_pokemon_id not in pair:
+            results.append(_vote_result(session_id, "invalid_winner", pair))
+        else:
+            used.add(session_id)
+            results.append(_vote_result(session_id, "applied", pair))
+    return results
+
+
+def _sessions_query(session_ids: set[str]):
+    return select(ComparisonSession).where(ComparisonSession.session_id.in_(session_ids))
+
+
+def _consume_votes(db: Session, votes: list[tuple[str, int]]) -> list[dict]:
+    """
+    Batch `_consume_vote`: loads every session with one IN query, applies the
+    valid votes in order (`apply_elo_updates`) and bulk-deletes the consumed
+    and expired sessions.
+    """
+    sessions = {
+        session.session_id: session
+        for session in db.execute(_sessions_query({session_id for session_id, _ in votes})).scalars()
+    }
+    results = _check_votes(sessions, votes)
+    apply_elo_updates(db, [
+        (result["pokemon1_id"], result["pokemon2_id"], winner_pokemon_id)
+        for result, (_, winner_pokemon_id) in zip(results, votes) if result["status"] == "applied"
+    ])
+
+    consumed = [result["session_id"] for result in results if result["status"] in ("applied", "expired")]
+    if consumed:
+        db.execute(
+            delete(ComparisonSession).where(ComparisonSession.session_id.in_(consumed)),
+            execution_options={"synchronize_session": False},
+        )
+    return results
+
+
+def _apply_votes(db: Session, votes: list[tuple[int, int, int]]):
+    """Applies (pokemon1_id, pokemon2_id, winner) votes that need no session, e.g. from battle tokens."""
+    apply_elo_updates(db, votes)
+
+
+def _append_vote(session_id: str | None, pair: tuple[int, int], winner_pokemon_id: int):
+    try:
+        get_vote_buffer().append(session_id, pair[0], pair[1], winner_pokemon_id)
+    except SessionAlreadyVoted:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except VoteBufferFull:
+        raise HTTPException(status_code=503, detail="Vote buffer is full, try again later")
+
+
+def _buffer_vote(session: ComparisonSession | None, session_id: str, winner_pokemon_id: int) -> tuple[int, int] | None:
+    """
+    VOTE_MODE=buffered: validates the session read from the pool and appends
+    the vote to the vote buffer; the flusher applies it and deletes the session.
+    """
+    pair = _check_vote(session, winner_pokemon_id)
+    if pair is None:
+        return None
+
+    _append_vote(session_id, pair, winner_pokemon_id)
+    return pair
+
+
+def _redeem_token(token: str, winner_pokemon_id: int) -> BattleTicket | None:
+    """
+    SESSION_MODE=token: verifies the battle token and spends its nonce.
+    Returns None if the token has expired.
+    """
+    tokens = get_battle_tokens()
+    try:
+        ticket = tokens.verify(token)
+    except InvalidBattleToken:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except ExpiredBattleToken:
+        return None
+
+    _check_winner(ticket.pokemon1_id, ticket.pokemon2_id, winner_pokemon_id)
+    if not tokens.replay_guard.claim(ticket.nonce, ticket.expires_at):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return ticket
+
+
+def _distinct_pairs(count: int) -> list[tuple[int, int]]:
+    """Draws `count` pairs from the matchmaker, skipping repeats of the same two Pokemon."""
+    matchmaker = get_matchmaker()
+    pairs, seen = [], set()
+    # Bounded in case a strategy keeps proposing the same pairs
+    for _ in range(count * 20):
+        pair = matchmaker.pair()
+        key = frozenset(pair)
+        if key not in seen:
+            seen.add(key)
+            pairs.append(pair)
+            if len(pairs) == count:
+                break
+    return pairs
+
+
+def _battle_pairs(pairs: list[tuple[int, int]], session_ids: list[str]) -> list[dict]:
+    return [
+        {"pokemon1_id": pokemon1_id, "pokemon2_id": pokemon2_id, "session_id": session_id}
+        for (pokemon1_id, pokemon2_id), session_id in zip(pairs, session_ids)
+    ]
+
+
+def _entry_or_404(entry: dict | None) -> dict:
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Pokemon not found in the leaderboard")
+    return entry
+
+
+def _history_range(pokemon_id: int, since: datetime | None, until: datetime | None) -> tuple[int | None, int | None]:
+    if not 1 <= pokemon_id <= LAST_POKEMON_ID:
+        raise HTTPException(status_code=404, detail="Pokemon not found")
+
+    def unix(moment: datetime | None) -> int | None:
+        if moment is None:
+            return None
+        # Naive datetimes are taken as UTC
+        return int((moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).timestamp())
+
+    return unix(since), unix(until)
+
+
+def _vote_response(session_id: str, pair: tuple[int, int] | None) -> dict:
+    if pair is None:
+        raise HTTPException(status_code=410, detail="Session expired")
+    return {"pokemon1_id": pair[0], "pokemon2_id": pair[1], "session_id": session_id}
+
+
+def _vote_with_token(db: Session, token: str, winner_pokemon_id: int) -> tuple[int, int] | None:
+    ticket = _redeem_token(token, winner_pokemon_id)
+    if ticket is None:
+        return None
+
+    pair = ticket.pokemon1_id, ticket.pokemon2_id
+    try:
+        if get_vote_buffer() is not None:
+            _append_vote(None, pair, winner_pokemon_id)
+        else:
+            run_write(db, partial(apply_elo_update, pokemon1_id=pair[0], pokemon2_id=pair[1], winner_pokemon_id=winner_pokemon_id))
+    except Exception:
+        # The vote was not recorded, so the token may be used again
+        get_battle_tokens().replay_guard.release(ticket.nonce)
+        raise
+    return pair
+
+
+async def _vote_with_token_async(db: AsyncSession, token: str, winner_pokemon_id: int) -> tuple[int, int] | None:
+    ticket = _redeem_token(token, winner_pokemon_id)
+    if ticket is None:
+        return None
+
+    pair = ticket.pokemon1_id, ticket.pokemon2_id
+    try:
+        if get_vote_buffer() is not None:
+            # The append may fsync; keep it off the event loop
+            await run_in_threadpool(_append_vote, None, pair, winner_pokemon_id)
+        else:
+            await run_write_async(db, partial(apply_elo_update, pokemon1_id=pair[0], pokemon2_id=pair[1], winner_pokemon_id=winner_pokemon_id))
+    except Exception:
+        get_battle_tokens().replay_guard.release(ticket.nonce)
+        raise
+    return pair
+
+
+def _buffer_votes(sessions: dict[str, ComparisonSession], votes: list[tuple[str, int]]) -> list[dict]:
+    """VOTE_MODE=buffered batch: checks every vote and appends the valid ones to the vote buffer."""
+    results = _check_votes(sessions, votes)
+    for result, (session_id, winner_pokemon_id) in zip(results, votes):
+        if result["status"] != "applied":
+            continue
+        try:
+            get_vote_buffer().append(session_id, result["pokemon1_id"], result["pokemon2_id"], winner_pokemon_id)
+        except SessionAlreadyVoted:
+            result.update(status="not_found", pokemon1_id=None, pokemon2_id=None)
+        except VoteBufferFull:
+            result["status"] = "buffer_full"
+    return results
+
+
+def _redeem_tokens(votes: list[tuple[str, int]]) -> tuple[list[dict], list[BattleTicket]]:
+    """SESSION_MODE=token batch: per-item `_redeem_token`. Returns the results and the spent tickets."""
+    results, tickets = [], []
+    for token, winner_pokemon_id in votes:
+        try:
+            ticket = _redeem_token(token, winner_pokemon_id)
+        except HTTPException as exc:
+            status = "invalid_winner" if exc.status_code == 400 else "not_found"
+            results.append(_vote_result(token, status))
+            continue
+        if ticket is None:
+            results.append(_vote_result(token, "expired"))
+        else:
+            tickets.append(ticket)
+            results.append(_vote_result(token, "applied", (ticket.pokemon1_id, ticket.pokemon2_id)))
+    return results, tickets
+
+
+def _token_votes(results: list[dict], votes: list[tuple[str, int]]) -> list[tuple[int, int, int]]:
+    return [
+        (result["pokemon1_id"], result["pokemon2_id"], winner_pokemon_id)
+        for result, (_, winner_pokemon_id) in zip(results, votes) if result["status"] == "applied"
+    ]
+
+
+def _append_token_votes(results: list[dict], votes: list[tuple[str, int]], tickets: list[BattleTicket]):
+    # `tickets` holds the ticket of every "applied" result, in order
+    applied = iter(tickets)
+    for result, (_, winner_pokemon_id) in zip(results, votes):
+        if result["status"] != "applied":
+            continue
+        ticket = next(applied)
+        try:
+            get_vote_buffer().append(None, result["pokemon1_id"], result["pokemon2_id"], winner_pokemon_id)
+        except VoteBufferFull:
+            result["status"] = "buffer_full"
+            # Not recorded, so the token may be used again
+            get_battle_tokens().replay_guard.release(ticket.nonce)
+
+
+def _release_tickets(tickets: list[BattleTicket]):
+    for ticket in tickets:
+        get_battle_tokens().replay_guard.release(ticket.nonce)
+
+
+# --- Cached responses (see services/response_cache.py) ---
+
+# Bodies are built from Core row tuples (or the index's dicts) with
+# orjson, see services/fast_json.py
+_LEADERBOARD_CACHE_CONTROL = f"public, max-age={RESPONSE_CACHE_MAX_AGE_SECONDS}"
+_LEADERBOARD_COLUMNS = (PopularityLeaderboard.id, PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+_LEADERBOARD_FIELDS = ("id", "pokemon_id", "elo")
+
+
+def _leaderboard_json(rows) -> bytes:
+    return rows_json(rows, _LEADERBOARD_FIELDS)
+
+
+def warm_leaderboard_response(db: Session):
+    """Encodes `GET /popularity/` ahead of the first request (startup warmup)."""
+    get_response_cache().put(
+        ("popularity",), leaderboard_index.version, _leaderboard_json(db.execute(select(*_LEADERBOARD_COLUMNS)).all())
+    )
+
+
+# --- Pagination (see services/pagination.py) ---
+
+_RANK_ORDER = (PopularityLeaderboard.elo.desc(), PopularityLeaderboard.pokemon_id)
+
+
+def _leaderboard_page_query(limit: int, cursor: Optional[str]):
+    try:
+        after = decode_cursor(cursor, 2)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    query = select(*_LEADERBOARD_COLUMNS).order_by(*_RANK_ORDER).limit(limit + 1)
+    if after is not None:
+        elo, pokemon_id = after
+        # The `elo <=` bound keeps this a range scan of the rank index
+        query = query.where(
+            PopularityLeaderboard.elo <= elo,
+            or_(PopularityLeaderboard.elo < elo, PopularityLeaderboard.pokemon_id > pokemon_id),
+        )
+    return query
+
+
+def _leaderboard_page(rows, limit: int) -> ORJSONResponse:
+    return ORJSONResponse(page(rows, limit, key=lambda row: (row.elo, row.pokemon_id), fields=_LEADERBOARD_FIELDS))
+
+
+def _leaderboard_stream_query():
+    return select(*_LEADERBOARD_COLUMNS).order_by(*_RANK_ORDER).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+
+@router.get("/", response_model=List[PopularityLeaderboardSchema])
+def get_all(request: Request, db: Session = Depends(get_db)):
+    return get_response_cache().serve(
+        request, ("popularity",), leaderboard_index.version,
+        lambda: _leaderboard_json(db.execute(select(*_LEADERBOARD_COLUMNS)).all()),
+        _LEADERBOARD_CACHE_CONTROL,
     )
-    db.add(session)
-    db.commit()
+
+
+@router.get("/page", response_model=PopularityLeaderboardPage)
+def get_leaderboard_page(
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    rows = db.execute(_leaderboard_page_query(limit, cursor)).all()
+    return _leaderboard_page(rows, limit)
+
+
+@router.get("/stream", response_class=StreamingResponse)
+def stream_leaderboard(db: Session = Depends(get_db)):
+    """The whole leaderboard in rank order as NDJSON, one row per line."""
+    result = db.execute(_leaderboard_stream_query())
+    return StreamingResponse(ndjson_batches(result.partitions(), _LEADERBOARD_FIELDS), media_type="application/x-ndjson")
+
+
+@router.get("/pair-to-battle", response_model=PopularityBattlePair)
+def get_pair_to_battle(db: Session = Depends(get_db)):
+    random1, random2 = get_matchmaker().pair()
+    if get_battle_tokens() is not None:
+        session_id = get_battle_tokens().issue(random1, random2)
+    else:
+        session_id = run_write(db, partial(_create_session, pokemon1_id=random1, pokemon2_id=random2))
 
     return {"pokemon1_id": random1, "pokemon2_id": random2, "session_id": session_id}
 
 
+@router.get("/pairs-to-battle", response_model=List[PopularityBattlePair])
+def get_pairs_to_battle(count: int = Query(10, ge=1, le=PAIRS_TO_BATTLE_MAX_COUNT), db: Session = Depends(get_db)):
+    pairs = _distinct_pairs(count)
+    if get_battle_tokens() is not None:
+        session_ids = [get_battle_tokens().issue(*pair) for pair in pairs]
+    else:
+        session_ids = run_write(db, partial(_create_sessions, pairs=pairs))
+
+    return _battle_pairs(pairs, session_ids)
+
+
 @router.get("/top/{n}", response_model=List[PopularityLeaderboardSchema])
-def get_top_n(n: int, db: Session = Depends(get_db)):
-    return db.query(PopularityLeaderboard).order_by(PopularityLeaderboard.elo.desc()).limit(n).all()
+def get_top_n(n: int, request: Request, db: Session = Depends(get_db)):
+    index = get_leaderboard_index(db)
+    return get_response_cache().serve(
+        request, ("popularity-top", n), index.version, lambda: orjson.dumps(index.top(n)), _LEADERBOARD_CACHE_CONTROL
+    )
+
+
+@router.get("/{pokemon_id}/rank", response_model=PopularityRank)
+def get_rank(pokemon_id: int, neighbors: int = Query(1, ge=0, le=25), db: Session = Depends(get_db)):
+    return _entry_or_404(get_leaderboard_index(db).rank(pokemon_id, neighbors))
+
+
+@router.get("/{pokemon_id}/history", response_model=PopularityHistory)
+def get_history(pokemon_id: int, since: datetime | None = None, until: datetime | None = None, db: Session = Depends(get_db)):
+    points = history(db, pokemon_id, *_history_range(pokemon_id, since, until))
+    return {"pokemon_id": pokemon_id, "points": points}
 
 
 @router.get("/{pokemon_id}", response_model=PopularityLeaderboardSchema)
 def get(pokemon_id: int, db: Session = Depends(get_db)):
-    obj = db.query(PopularityLeaderboard).filter_by(pokemon_id=pokemon_id).first()
-    if not obj:
-        raise HTTPException(status_code=404, detail="Pokemon not found in the leaderboard")
-    return obj
+    return _entry_or_404(get_leaderboard_index(db).get(pokemon_id))
 
 
 @router.post("/vote/{session_id}/{winner_pokemon_id}", response_model=PopularityBattlePair)
 def vote(session_id: str, winner_pokemon_id: int, db: Session = Depends(get_db)):
-    session = db.query(ComparisonSession).filter_by(session_id=session_id).first()
-    
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    if datetime.now(timezone.utc).replace(tzinfo=None) > session.expires_at:
-        db.delete(session)
-        db.commit()
-        raise HTTPException(status_code=410, detail="Session expired")
+    if get_battle_tokens() is not None:
+        return _vote_response(session_id, _vote_with_token(db, session_id, winner_pokemon_id))
+    if get_vote_buffer() is not None:
+        session = db.query(ComparisonSession).filter_by(session_id=session_id).first()
+        pair = _buffer_vote(session, session_id, winner_pokemon_id)
+    else:
+        pair = run_write(db, partial(_consume_vote, session_id=session_id, winner_pokemon_id=winner_pokemon_id))
+    return _vote_response(session_id, pair)
 
-    pokemon1_id = session.pokemon1_id
-    pokemon2_id = session.pokemon2_id
 
-    if winner_pokemon_id not in [pokemon1_id, pokemon2_id]:
-        raise HTTPException(status_code=400, detail="Winner pokemon ID does not match the battle pair")
+@router.post("/votes", response_model=List[PopularityVoteResult])
+def vote_batch(votes: List[PopularityVote] = Body(..., min_length=1, max_length=VOTES_BATCH_MAX_SIZE), db: Session = Depends(get_db)):
+    items = [(vote.session_id, vote.winner_pokemon_id) for vote in votes]
+    if get_battle_tokens() is not None:
+        results, tickets = _redeem_tokens(items)
+        try:
+            if get_vote_buffer() is not None:
+                _append_token_votes(results, items, tickets)
+            else:
+                run_write(db, partial(_apply_votes, votes=_token_votes(results, items)))
+        except Exception:
+            _release_tickets(tickets)
+            raise
+        return results
+    if get_vote_buffer() is not None:
+        sessions = {
+            session.session_id: session
+            for session in db.execute(_sessions_query({session_id for session_id, _ in items})).scalars()
+        }
+        return _buffer_votes(sessions, items)
+    return run_write(db, partial(_consume_votes, votes=items))
+
+
+# --- Async endpoints (DB_MODE=async) ---
+
+@async_router.get("/", response_model=List[PopularityLeaderboardSchema])
+async def get_all_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        return _leaderboard_json((await db.execute(select(*_LEADERBOARD_COLUMNS))).all())
+
+    return await get_response_cache().serve_async(
+        request, ("popularity",), leaderboard_index.version, build, _LEADERBOARD_CACHE_CONTROL
+    )
+
+
+@async_router.get("/page", response_model=PopularityLeaderboardPage)
+async def get_leaderboard_page_async(
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    rows = (await db.execute(_leaderboard_page_query(limit, cursor))).all()
+    return _leaderboard_page(rows, limit)
+
+
+@async_router.get("/stream", response_class=StreamingResponse)
+async def stream_leaderboard_async(db: AsyncSession = Depends(get_async_db)):
+    result = await db.stream(_leaderboard_stream_query())
+    return StreamingResponse(
+        ndjson_batches_async(result.partitions(), _LEADERBOARD_FIELDS), media_type="application/x-ndjson"
+    )
+
+
+@async_router.get("/pair-to-battle", response_model=PopularityBattlePair)
+async def get_pair_to_battle_async(db: AsyncSession = Depends(get_async_db)):
+    random1, random2 = get_matchmaker().pair()
+    if get_battle_tokens() is not None:
+        session_id = get_battle_tokens().issue(random1, random2)
+    else:
+        session_id = await run_write_async(db, partial(_create_session, pokemon1_id=random1, pokemon2_id=random2))
+
+    return {"pokemon1_id": random1, "pokemon2_id": random2, "session_id": session_id}
+
+
+@async_router.get("/pairs-to-battle", response_model=List[PopularityBattlePair])
+async def get_pairs_to_battle_async(count: int = Query(10, ge=1, le=PAIRS_TO_BATTLE_MAX_COUNT), db: AsyncSession = Depends(get_async_db)):
+    pairs = _distinct_pairs(count)
+    if get_battle_tokens() is not None:
+        session_ids = [get_battle_tokens().issue(*pair) for pair in pairs]
+    else:
+        session_ids = await run_write_async(db, partial(_create_sessions, pairs=pairs))
+
+    return _battle_pairs(pairs, session_ids)
+
+
+@async_router.get("/top/{n}", response_model=List[PopularityLeaderboardSchema])
+async def get_top_n_async(n: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    index = await get_leaderboard_index_async(db)
+    return get_response_cache().serve(
+        request, ("popularity-top", n), index.version, lambda: orjson.dumps(index.top(n)), _LEADERBOARD_CACHE_CONTROL
+    )
+
+
+@async_router.get("/{pokemon_id}/rank", response_model=PopularityRank)
+async def get_rank_async(pokemon_id: int, neighbors: int = Query(1, ge=0, le=25), db: AsyncSession = Depends(get_async_db)):
+    return _entry_or_404((await get_leaderboard_index_async(db)).rank(pokemon_id, neighbors))
+
+
+@async_router.get("/{pokemon_id}/history", response_model=PopularityHistory)
+async def get_history_async(pokemon_id: int, since: datetime | None = None, until: datetime | None = None, db: AsyncSession = Depends(get_async_db)):
+    points = await history_async(db, pokemon_id, *_history_range(pokemon_id, since, until))
+    return {"pokemon_id": pokemon_id, "points": points}
+
+
+@async_router.get("/{pokemon_id}", response_model=PopularityLeaderboardSchema)
+async def get_async(pokemon_id: int, db: AsyncSession = Depends(get_async_db)):
+    return _entry_or_404((await get_leaderboard_index_async(db)).get(pokemon_id))
+
+
+@async_router.post("/vote/{session_id}/{winner_pokemon_id}", response_model=PopularityBattlePair)
+async def vote_async(session_id: str, winner_pokemon_id: int, db: AsyncSession = Depends(get_async_db)):
+    if get_battle_tokens() is not None:
+        return _vote_response(session_id, await _vote_with_token_async(db, session_id, winner_pokemon_id))
+    if get_vote_buffer() is not None:
+        session = (await db.execute(
+            select(ComparisonSession).filter_by(session_id=session_id)
+        )).scalars().first()
+        # The append may fsync; keep it off the event loop
+        pair = await run_in_threadpool(_buffer_vote, session, session_id, winner_pokemon_id)
+    else:
+        pair = await run_write_async(db, partial(_consume_vote, session_id=session_id, winner_pokemon_id=winner_pokemon_id))
+    return _vote_response(session_id, pair)
 
-    update_elo_and_save(db, pokemon1_id, pokemon2_id, winner_pokemon_id)
-    
-    db.delete(session)
-    db.commit()
 
-    return {"pokemon1_id": pokemon1_id, "pokemon2_id": pokemon2_id, "session_id": session_id}
\ No newline at end of file
+@async_router.post("/votes", response_model=List[PopularityVoteResult])
+async def vote_batch_async(votes: List[PopularityVote] = Body(..., min_length=1, max_length=VOTES_BATCH_MAX_SIZE), db: AsyncSession = Depends(get_async_db)):
+    items = [(vote.session_id, vote.winner_pokemon_id) for vote in votes]
+    if get_battle_tokens() is not None:
+        results, tickets = _redeem_tokens(items)
+        try:
+            if get_vote_buffer() is not None:
+                await run_in_threadpool(_append_token_votes, results, items, tickets)
+            else:
+                await run_write_async(db, partial(_apply_votes, votes=_token_votes(results, items)))
+        except Exception:
+            _release_tickets(tickets)
+            raise
+        return results
+    if get_vote_buffer() is not None:
+        sessions = {
+            session.session_id: session
+            for session in (await db.execute(_sessions_query({session_id for session_id, _ in items}))).scalars()
+        }
+        # The appends may fsync; keep them off the event loop
+        return await run_in_threadpool(_buffer_votes, sessions, items)
+    return await run_write_async(db, partial(_consume_votes, votes=items))
@@ -1,9 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import Row, delete, or_, select, update
 from sqlalchemy.orm import Session
-from typing import Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional
+import orjson
+from functools import partial
 from .. import models, schemas
-from ..database import get_db
-from ..auth import get_current_user, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..database import get_db, get_async_db
+from ..auth import get_current_user, get_current_user_async, get_password_hash, get_password_hash_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..services.writer import run_write, run_write_async
+from ..services.auth_cache import CachedUser, forget_user
+from ..services.fast_json import rows_response
+from ..services.response_cache import get_response_cache
+from ..services.favorite_counts import get_favorite_count_index, get_favorite_count_index_async
+from ..services.favorites import (
+    add_favorites, remove_favorites, remove_all_favorites, replace_favorites, update_favorites,
+    favorite_bitset, favorite_bitset_async,
+)
+from ..services.pagination import (
+    STREAM_BATCH_SIZE, InvalidCursor, decode_cursor, page, ndjson_batches, ndjson_batches_async
+)
+from ..config import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT, RESPONSE_CACHE_MAX_AGE_SECONDS
 from datetime import timedelta
 
 router = APIRouter(
@@ -11,111 +29,390 @@ router = APIRouter(
     tags=["users"],
 )
 
-@router.patch("/update", response_model=schemas.UserUpdateResponse)
-def update_user_me(
-    user_update: schemas.UserUpdate,
-    current_user: Annotated[models.User, Depends(get_current_user)],
-    db: Session = Depends(get_db)
-    ):
-    # Update fields if provided
-    username_changed = False
-    
-    if user_update.username is not None:
-        # Check if username taken
-        existing_user = db.query(models.User).filter(models.User.username == user_update.username).first()
-        if existing_user and existing_user.id != current_user.id:
-             raise HTTPException(status_code=400, detail="Username already taken")
-        current_user.username = user_update.username
-        username_changed = True
-        
-    if user_update.email is not None:
-        # Check if email taken
-        existing_email = db.query(models.User).filter(models.User.email == user_update.email).first()
-        if existing_email and existing_email.id != current_user.id:
-             raise HTTPException(status_code=400, detail="Email already registered")
-        current_user.email = user_update.email
+# Same endpoints backed by AsyncSession, mounted instead of `router` when DB_MODE=async
+async_router = APIRouter(
+    prefix="/users",
+    tags=["users"],
+)
 
-    if user_update.password is not None:
-        current_user.hashed_password = get_password_hash(user_update.password)
-        username_changed = True # Force token regeneration on password change
 
-    if user_update.profile_pic_pokemon_id is not None:
-        current_user.profile_pic_pokemon_id = user_update.profile_pic_pokemon_id
+def _with_refreshed_token(user: Row, username_changed: bool) -> schemas.UserUpdateResponse:
+    response_data = schemas.UserUpdateResponse.model_validate(user)
 
-    db.commit()
-    db.refresh(current_user)
-    
-    # Prepare response
-    response_data = schemas.UserUpdateResponse.model_validate(current_user)
-    
     # If username changed, generate new token
     if username_changed:
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
-            data={"sub": current_user.username, "id": current_user.id},
+            data={"sub": user.username, "id": user.id},
             expires_delta=access_token_expires
         )
         response_data.access_token = access_token
         response_data.token_type = "bearer"
-        
+
     return response_data
 
 
+def _user_changes(user_update: schemas.UserUpdate, hashed_password: str | None) -> dict:
+    changes = user_update.model_dump(exclude_none=True, exclude={"password"})
+    if hashed_password is not None:
+        changes["hashed_password"] = hashed_password
+    return changes
+
+
+_FAVORITE_COLUMNS = (models.favorite_pokemon.id, models.favorite_pokemon.user_id, models.favorite_pokemon.pokemon_id)
+_FAVORITE_FIELDS = ("id", "user_id", "pokemon_id")
+
+
+def _favorites_query(user_id: int):
+    return select(*_FAVORITE_COLUMNS).where(models.favorite_pokemon.user_id == user_id)
+
+
+def _favorites_page_query(user_id: int, limit: int, cursor: Optional[str]):
+    try:
+        after = decode_cursor(cursor, 1)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    query = (
+        select(*_FAVORITE_COLUMNS)
+        .where(models.favorite_pokemon.user_id == user_id)
+        .order_by(models.favorite_pokemon.id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(models.favorite_pokemon.id > after[0])
+    return query
+
+
+def _favorites_stream_query(user_id: int):
+    return (
+        select(*_FAVORITE_COLUMNS)
+        .where(models.favorite_pokemon.user_id == user_id)
+        .order_by(models.favorite_pokemon.id)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+
+
+# --- Write operations (run via run_write, see services/writer.py) ---
+
+_USER_COLUMNS = tuple(models.User.__table__.columns)
+
+
+def _update_user(db: Session, user_id: int, changes: dict) -> Row:
+    # Username and email are checked with one query, as in registration
+    unique = [getattr(models.User, field) == changes[field] for field in ("username", "email") if field in changes]
+    if unique:
+        taken = db.execute(
+            select(models.User.username, models.User.email).where(or_(*unique), models.User.id != user_id)
+        ).all()
+        if any(row.username == changes.get("username") for row in taken):
+            raise HTTPException(status_code=400, detail="Username already taken")
+        if taken:
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+    if not changes:
+        return db.execute(select(*_USER_COLUMNS).where(models.User.id == user_id)).one()
+
+    # RETURNING hands back the updated row, so the response needs no reload after the commit
+    user = db.execute(
+        update(models.User).where(models.User.id == user_id).values(**changes)
+        .returning(*_USER_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).one()
+    forget_user(db, user_id)
+
+    return user
+
+
+def _delete_user(db: Session, user_id: int):
+    # Favorites go explicitly rather than by the ORM cascade (which loads
+    # them all first), so favorite_counts follows
+    remove_all_favorites(db, user_id)
+    db.execute(delete(models.User).where(models.User.id == user_id))
+    forget_user(db, user_id)
+
+
+def _add_favorite(db: Session, user_id: int, pokemon_id: int) -> models.favorite_pokemon:
+    # Favoriting the same Pokemon again returns the existing row
+    add_favorites(db, user_id, [pokemon_id])
+    return db.execute(
+        select(models.favorite_pokemon).where(
+            models.favorite_pokemon.user_id == user_id,
+            models.favorite_pokemon.pokemon_id == pokemon_id
+        )
+    ).scalar_one()
+
+
+def _delete_favorite(db: Session, user_id: int, pokemon_id: int):
+    if not remove_favorites(db, user_id, [pokemon_id]):
+        raise HTTPException(status_code=404, detail="Selected Pokemon is not in favorites")
+
+
+# Served from favorite_counts' in-memory mirror, see services/favorite_counts.py
+_FAVORITES_TOP_CACHE_CONTROL = f"public, max-age={RESPONSE_CACHE_MAX_AGE_SECONDS}"
+
+
+def _user_id_query(username: str):
+    return select(models.User.id).where(models.User.username == username)
+
+
+def _user_id_or_404(user_id: int | None) -> int:
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+
+@router.patch("/update", response_model=schemas.UserUpdateResponse)
+def update_user_me(
+    user_update: schemas.UserUpdate,
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+    ):
+    hashed_password = None
+    if user_update.password is not None:
+        hashed_password = get_password_hash(user_update.password)
+
+    user = run_write(db, partial(
+        _update_user, user_id=current_user.id, changes=_user_changes(user_update, hashed_password)
+    ))
+    
+    # Force token regeneration on username or password change
+    username_changed = user_update.username is not None or user_update.password is not None
+    return _with_refreshed_token(user, username_changed)
+
+
 @router.get("/current-user", response_model=schemas.UserResponse)
 def get_current_user_info(
-    current_user: Annotated[models.User, Depends(get_current_user)]
+    current_user: Annotated[CachedUser, Depends(get_current_user)]
     ):
     return current_user
 
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
 def delete_user_me(
-    current_user: Annotated[models.User, Depends(get_current_user)],
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
-    db.delete(current_user)
-    db.commit()
+    run_write(db, partial(_delete_user, user_id=current_user.id))
 
 
 # Favorite Pokemon Endpoints
 @router.post("/favorite-pokemon", response_model=schemas.FavoritePokemon, status_code=status.HTTP_201_CREATED)
 def add_favorite_pokemon(
     favorite_pokemon: schemas.FavoritePokemonCreate,
-    current_user: Annotated[models.User, Depends(get_current_user)],
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
-    new_fav = models.favorite_pokemon(
-        user_id=current_user.id,
-        pokemon_id=favorite_pokemon.pokemon_id
-    )
-    db.add(new_fav)
-    db.commit()
-    db.refresh(new_fav)
-    return new_fav
+    return run_write(db, partial(_add_favorite, user_id=current_user.id, pokemon_id=favorite_pokemon.pokemon_id))
 
 
 @router.get("/favorite-pokemons", response_model=list[schemas.FavoritePokemon])
 def get_favorite_pokemons(
-    current_user: Annotated[models.User, Depends(get_current_user)],
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    rows = db.execute(_favorites_query(current_user.id)).all()
+    return rows_response(rows, _FAVORITE_FIELDS)
+
+
+@router.get("/favorite-pokemons/page", response_model=schemas.FavoritePokemonPage)
+def get_favorite_pokemons_page(
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    rows = db.execute(_favorites_page_query(current_user.id, limit, cursor)).all()
+    return ORJSONResponse(page(rows, limit, key=lambda row: (row.id,), fields=_FAVORITE_FIELDS))
+
+
+@router.get("/favorite-pokemons/stream", response_class=StreamingResponse)
+def stream_favorite_pokemons(
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
-    favs = db.query(models.favorite_pokemon).filter(models.favorite_pokemon.user_id == current_user.id).all()
-    return favs
+    result = db.execute(_favorites_stream_query(current_user.id))
+    return StreamingResponse(ndjson_batches(result.partitions(), _FAVORITE_FIELDS), media_type="application/x-ndjson")
+
+
+@router.put("/favorite-pokemons", response_model=schemas.FavoritePokemonIds)
+def replace_favorite_pokemons(
+    favorites: schemas.FavoritePokemonIds,
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """Replaces all of the user's favorites with `pokemon_ids`."""
+    pokemon_ids = run_write(db, partial(replace_favorites, user_id=current_user.id, pokemon_ids=favorites.pokemon_ids))
+    return {"pokemon_ids": pokemon_ids}
+
+
+@router.patch("/favorite-pokemons", response_model=schemas.FavoritePokemonIds)
+def update_favorite_pokemons(
+    changes: schemas.FavoritePokemonChanges,
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """Adds `add` and removes `remove` in one transaction (an ID in both ends up removed)."""
+    pokemon_ids = run_write(db, partial(update_favorites, user_id=current_user.id, add=changes.add, remove=changes.remove))
+    return {"pokemon_ids": pokemon_ids}
+
+
+@router.get("/favorite-pokemons/in-common/{username}", response_model=schemas.FavoritesInCommon)
+def get_favorite_pokemons_in_common(
+    username: str,
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    How many favorites the current user shares with `username`. Only the
+    count: with every Pokemon as a favorite, the shared IDs would be the
+    other user's whole list.
+    """
+    other_user_id = _user_id_or_404(db.execute(_user_id_query(username)).scalar())
+    in_common = favorite_bitset(db, current_user.id) & favorite_bitset(db, other_user_id)
+    return {"count": in_common.bit_count()}
+
+
+@router.get("/favorites/top/{n}", response_model=list[schemas.FavoriteCount])
+def get_most_favorited(n: int, request: Request, db: Session = Depends(get_db)):
+    """The `n` Pokemon with the most favorites."""
+    index = get_favorite_count_index(db)
+    return get_response_cache().serve(
+        request, ("favorites-top", n), index.version, lambda: orjson.dumps(index.top(n)), _FAVORITES_TOP_CACHE_CONTROL
+    )
 
 
 @router.delete("/favorite-pokemon/", status_code=status.HTTP_204_NO_CONTENT)
 def delete_favorite_pokemon(
     favorite_pokemon: schemas.FavoritePokemonDelete,
-    current_user: Annotated[models.User, Depends(get_current_user)],
+    current_user: Annotated[CachedUser, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
-    fav = db.query(models.favorite_pokemon).filter(
-        models.favorite_pokemon.user_id == current_user.id,
-        models.favorite_pokemon.pokemon_id == favorite_pokemon.pokemon_id
-    ).first()
-    
-    if not fav:
-        raise HTTPException(status_code=404, detail="Selected Pokemon is not in favorites")
-    
-    db.delete(fav)
-    db.commit()
\ No newline at end of file
+    run_write(db, partial(_delete_favorite, user_id=current_user.id, pokemon_id=favorite_pokemon.pokemon_id))
+
+
+# --- Async endpoints (DB_MODE=async) ---
+
+@async_router.patch("/update", response_model=schemas.UserUpdateResponse)
+async def update_user_me_async(
+    user_update: schemas.UserUpdate,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+    ):
+    hashed_password = None
+    if user_update.password is not None:
+        hashed_password = await get_password_hash_async(user_update.password)
+
+    user = await run_write_async(db, partial(
+        _update_user, user_id=current_user.id, changes=_user_changes(user_update, hashed_password)
+    ))
+
+    username_changed = user_update.username is not None or user_update.password is not None
+    return _with_refreshed_token(user, username_changed)
+
+
+@async_router.get("/current-user", response_model=schemas.UserResponse)
+async def get_current_user_info_async(
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)]
+    ):
+    return current_user
+
+
+@async_router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_user_me_async(
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    await run_write_async(db, partial(_delete_user, user_id=current_user.id))
+
+
+@async_router.post("/favorite-pokemon", response_model=schemas.FavoritePokemon, status_code=status.HTTP_201_CREATED)
+async def add_favorite_pokemon_async(
+    favorite_pokemon: schemas.FavoritePokemonCreate,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await run_write_async(db, partial(_add_favorite, user_id=current_user.id, pokemon_id=favorite_pokemon.pokemon_id))
+
+
+@async_router.get("/favorite-pokemons", response_model=list[schemas.FavoritePokemon])
+async def get_favorite_pokemons_async(
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows = (await db.execute(_favorites_query(current_user.id))).all()
+    return rows_response(rows, _FAVORITE_FIELDS)
+
+
+@async_router.get("/favorite-pokemons/page", response_model=schemas.FavoritePokemonPage)
+async def get_favorite_pokemons_page_async(
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    rows = (await db.execute(_favorites_page_query(current_user.id, limit, cursor))).all()
+    return ORJSONResponse(page(rows, limit, key=lambda row: (row.id,), fields=_FAVORITE_FIELDS))
+
+
+@async_router.get("/favorite-pokemons/stream", response_class=StreamingResponse)
+async def stream_favorite_pokemons_async(
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    result = await db.stream(_favorites_stream_query(current_user.id))
+    return StreamingResponse(
+        ndjson_batches_async(result.partitions(), _FAVORITE_FIELDS), media_type="application/x-ndjson"
+    )
+
+
+@async_router.put("/favorite-pokemons", response_model=schemas.FavoritePokemonIds)
+async def replace_favorite_pokemons_async(
+    favorites: schemas.FavoritePokemonIds,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    pokemon_ids = await run_write_async(
+        db, partial(replace_favorites, user_id=current_user.id, pokemon_ids=favorites.pokemon_ids)
+    )
+    return {"pokemon_ids": pokemon_ids}
+
+
+@async_router.patch("/favorite-pokemons", response_model=schemas.FavoritePokemonIds)
+async def update_favorite_pokemons_async(
+    changes: schemas.FavoritePokemonChanges,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    pokemon_ids = await run_write_async(
+        db, partial(update_favorites, user_id=current_user.id, add=changes.add, remove=changes.remove)
+    )
+    return {"pokemon_ids": pokemon_ids}
+
+
+@async_router.get("/favorite-pokemons/in-common/{username}", response_model=schemas.FavoritesInCommon)
+async def get_favorite_pokemons_in_common_async(
+    username: str,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    other_user_id = _user_id_or_404((await db.execute(_user_id_query(username))).scalar())
+    in_common = await favorite_bitset_async(db, current_user.id) & await favorite_bitset_async(db, other_user_id)
+    return {"count": in_common.bit_count()}
+
+
+@async_router.get("/favorites/top/{n}", response_model=list[schemas.FavoriteCount])
+async def get_most_favorited_async(n: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    index = await get_favorite_count_index_async(db)
+    return get_response_cache().serve(
+        request, ("favorites-top", n), index.version, lambda: orjson.dumps(index.top(n)), _FAVORITES_TOP_CACHE_CONTROL
+    )
+
+
+@async_router.delete("/favorite-pokemon/", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_favorite_pokemon_async(
+    favorite_pokemon: schemas.FavoritePokemonDelete,
+    current_user: Annotated[CachedUser, Depends(get_current_user_async)],
+    db: AsyncSession = Depends(get_async_db)
+):
+    await run_write_async(db, partial(_delete_favorite, user_id=current_user.id, pokemon_id=favorite_pokemon.pokemon_id))
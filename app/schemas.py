@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional
+from typing import Annotated, Optional, Literal
+from datetime import datetime
 from .config import LAST_POKEMON_ID
 
 # --- Token Schemas ---
@@ -51,6 +52,26 @@ class FavoritePokemon(FavoritePokemonBase):
 class FavoritePokemonDelete(FavoritePokemonBase):
     pass
 
+class FavoritePokemonPage(BaseModel):
+    items: list[FavoritePokemon]
+    next_cursor: Optional[str] = None
+
+PokemonId = Annotated[int, Field(ge=1, le=LAST_POKEMON_ID)]
+
+class FavoritePokemonIds(BaseModel):
+    pokemon_ids: list[PokemonId] = Field(..., max_length=LAST_POKEMON_ID)
+
+class FavoritesInCommon(BaseModel):
+    count: int
+
+class FavoritePokemonChanges(BaseModel):
+    add: list[PokemonId] = Field([], max_length=LAST_POKEMON_ID)
+    remove: list[PokemonId] = Field([], max_length=LAST_POKEMON_ID)
+
+class FavoriteCount(BaseModel):
+    pokemon_id: int
+    count: int
+
 
 class PopularityLeaderboardBase(BaseModel):
     pokemon_id: int
@@ -64,7 +85,37 @@ class PopularityLeaderboard(PopularityLeaderboardBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class PopularityLeaderboardPage(BaseModel):
+    items: list[PopularityLeaderboard]
+    next_cursor: Optional[str] = None
+
+class PopularityRank(PopularityLeaderboard):
+    rank: int
+    total: int
+    percentile: float
+    above: list[PopularityLeaderboard]
+    below: list[PopularityLeaderboard]
+
+class PopularityHistoryPoint(BaseModel):
+    taken_at: datetime
+    elo: int
+    rank: int
+
+class PopularityHistory(BaseModel):
+    pokemon_id: int
+    points: list[PopularityHistoryPoint]
+
 class PopularityBattlePair(BaseModel):
     pokemon1_id: int
     pokemon2_id: int
-    session_id: str
\ No newline at end of file
+    session_id: str
+
+class PopularityVote(BaseModel):
+    session_id: str
+    winner_pokemon_id: int
+
+class PopularityVoteResult(BaseModel):
+    session_id: str
+    status: Literal["applied", "expired", "not_found", "invalid_winner", "buffer_full"]
+    pokemon1_id: Optional[int] = None
+    pokemon2_id: Optional[int] = None
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+In-process caches for the authentication fast path.
+
+Every authenticated request used to decode its JWT with python-jose and
+then look the user up by username. Two bounded LRU caches skip that work:
+
+- verified tokens, keyed by the SHA-256 digest of the token and kept until
+  the token's `exp`, hold its claims;
+- users, keyed by the `id` claim and kept for AUTH_USER_CACHE_TTL_SECONDS,
+  hold a plain snapshot of the row. An ORM instance would be tied to the
+  session that loaded it.
+
+A cached user only authenticates tokens whose `sub` still matches its
+username, so tokens issued before a rename stop working. `_update_user` and
+`_delete_user` drop the user and its tokens once their transaction commits.
+Invalidation is per process: with several workers, the others can serve a
+stale user for up to the TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+from sqlalchemy.orm import Session
+from ..config import AUTH_TOKEN_CACHE_SIZE, AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL_SECONDS
+from .commit_hooks import call_after_commit
+
+
+class TokenClaims(NamedTuple):
+    username: str
+    user_id: int
+    expires_at: int
+
+
+class CachedUser(NamedTuple):
+    """The columns of a `models.User` that requests read (no password hash)."""
+    id: int
+    username: str
+    email: str
+    profile_pic_pokemon_id: Optional[int]
+
+
+class ExpiringLRUCache:
+    """Bounded LRU mapping where every entry also has its own expiry time."""
+
+    def __init__(self, max_size: int, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def remove_where(self, predicate: Callable[[Any], bool]):
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class AuthCache:
+    def __init__(
+        self,
+        token_cache_size: int = AUTH_TOKEN_CACHE_SIZE,
+        user_cache_size: int = AUTH_USER_CACHE_SIZE,
+        user_ttl_seconds: float = AUTH_USER_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.tokens = ExpiringLRUCache(token_cache_size, clock)
+        self.users = ExpiringLRUCache(user_cache_size, clock)
+        self.user_ttl = user_ttl_seconds
+        # Bumped by every invalidation. A user read from the database is only
+        # cached if no invalidation happened since the read started, so a slow
+        # reader can't put back a row that was just changed
+        self.generation = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _token_key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get_claims(self, token: str) -> Optional[TokenClaims]:
+        return self.tokens.get(self._token_key(token))
+
+    def put_claims(self, token: str, claims: TokenClaims):
+        self.tokens.put(self._token_key(token), claims, claims.expires_at)
+
+    def get_user(self, user_id: int) -> Optional[CachedUser]:
+        return self.users.get(user_id)
+
+    def put_user(self, user, generation: int) -> CachedUser:
+        """Caches a snapshot of `user` (a `models.User`) unless it was invalidated since `generation`; returns the snapshot."""
+        cached = CachedUser(user.id, user.username, user.email, user.profile_pic_pokemon_id)
+        with self._lock:
+            if generation == self.generation:
+                self.users.put(user.id, cached, self._clock() + self.user_ttl)
+        return cached
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            self.generation += 1
+            self.users.pop(user_id)
+        self.tokens.remove_where(lambda claims: claims.user_id == user_id)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.users.clear()
+        self.tokens.clear()
+
+    def stats(self) -> dict:
+        return {"tokens": self.tokens.stats(), "users": self.users.stats()}
+
+
+auth_cache = AuthCache()
+
+
+def get_auth_cache() -> AuthCache:
+    return auth_cache
+
+
+def forget_user(session: Session, user_id: int):
+    """Drops the user and its tokens from the caches once the transaction commits."""
+    call_after_commit(session, partial(auth_cache.invalidate_user, user_id))
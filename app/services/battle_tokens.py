@@ -0,0 +1,136 @@
+"""
+Stateless battle tokens (SESSION_MODE=token).
+
+Instead of a ComparisonSession row, `pair-to-battle` hands out a token that
+carries the pair, its expiry and a random nonce, signed with HMAC-SHA256
+under a key derived from SECRET_KEY. A vote verifies the signature and the
+expiry without touching the database.
+
+Double votes are blocked by an in-memory set of spent nonces. A nonce only
+has to be remembered until its token expires, so the set never holds more
+than one expiry window of votes. It is per process: run a single worker, or
+a token could be spent once on each worker.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+from ..config import BATTLE_TOKEN_TTL_SECONDS
+
+
+# pokemon1_id, pokemon2_id, expiry (unix seconds), nonce
+_PAYLOAD = struct.Struct(">HHQ8s")
+_SIGNATURE_SIZE = 16
+
+
+class InvalidBattleToken(Exception):
+    pass
+
+
+class ExpiredBattleToken(Exception):
+    pass
+
+
+class BattleTicket(NamedTuple):
+    pokemon1_id: int
+    pokemon2_id: int
+    expires_at: int
+    nonce: bytes
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class ReplayGuard:
+    """Spent nonces, each kept only until the token it belongs to expires."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spent: dict[bytes, int] = {}
+        self._expiries: deque[tuple[int, bytes]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._spent)
+
+    def _prune(self, now: int):
+        # Tokens share one TTL, so expiries arrive roughly in order
+        while self._expiries and self._expiries[0][0] < now:
+            _, nonce = self._expiries.popleft()
+            self._spent.pop(nonce, None)
+
+    def claim(self, nonce: bytes, expires_at: int, now: Optional[int] = None) -> bool:
+        """Marks the nonce as spent. Returns False if it already was."""
+        with self._lock:
+            self._prune(int(time.time()) if now is None else now)
+            if nonce in self._spent:
+                return False
+            self._spent[nonce] = expires_at
+            self._expiries.append((expires_at, nonce))
+            return True
+
+    def release(self, nonce: bytes):
+        """Returns a nonce whose vote could not be applied, so it can be retried."""
+        with self._lock:
+            self._spent.pop(nonce, None)
+
+
+class BattleTokenSigner:
+    def __init__(self, secret_key: str, ttl_seconds: int = BATTLE_TOKEN_TTL_SECONDS):
+        # Separate key so battle tokens can never be confused with access tokens
+        self._key = hmac.new(secret_key.encode(), b"pokeparty-battle-token", hashlib.sha256).digest()
+        self.ttl_seconds = ttl_seconds
+        self.replay_guard = ReplayGuard()
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+
+    def issue(self, pokemon1_id: int, pokemon2_id: int, now: Optional[int] = None) -> str:
+        expires_at = (int(time.time()) if now is None else now) + self.ttl_seconds
+        payload = _PAYLOAD.pack(pokemon1_id, pokemon2_id, expires_at, os.urandom(8))
+        return _b64encode(payload + self._sign(payload))
+
+    def verify(self, token: str, now: Optional[int] = None) -> BattleTicket:
+        """Checks signature and expiry. Raises InvalidBattleToken or ExpiredBattleToken."""
+        try:
+            raw = _b64decode(token)
+        except ValueError:
+            raise InvalidBattleToken()
+        if len(raw) != _PAYLOAD.size + _SIGNATURE_SIZE:
+            raise InvalidBattleToken()
+
+        payload, signature = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidBattleToken()
+
+        ticket = BattleTicket(*_PAYLOAD.unpack(payload))
+        if (int(time.time()) if now is None else now) > ticket.expires_at:
+            raise ExpiredBattleToken()
+        return ticket
+
+
+battle_tokens: Optional[BattleTokenSigner] = None
+
+
+def get_battle_tokens() -> Optional[BattleTokenSigner]:
+    return battle_tokens
+
+
+def start_battle_tokens(secret_key: str) -> BattleTokenSigner:
+    global battle_tokens
+    battle_tokens = BattleTokenSigner(secret_key)
+    return battle_tokens
+
+
+def stop_battle_tokens():
+    global battle_tokens
+    battle_tokens = None
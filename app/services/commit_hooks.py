@@ -0,0 +1,46 @@
+"""
+Deferred callbacks for in-memory state that mirrors the database.
+
+`call_after_commit(session, callback)` runs `callback` once the transaction
+(or SAVEPOINT) that is current when it is registered has been committed
+all the way out. If that transaction or one of its parents rolls back, the
+callback is dropped, so in-memory indexes never see writes that did not
+persist.
+"""
+from typing import Callable
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+_PENDING_KEY = "after_commit_callbacks"
+
+
+def call_after_commit(session: Session, callback: Callable[[], None]):
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault(_PENDING_KEY, []).append((transaction, callback))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_committed_callbacks(session):
+    # Also fires when a SAVEPOINT is released (the writer runs every op in
+    # one); its callbacks wait for the outermost commit
+    if session.in_nested_transaction():
+        return
+    for _, callback in session.info.pop(_PENDING_KEY, []):
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_callbacks(session, previous_transaction):
+    pending = session.info.get(_PENDING_KEY)
+    if not pending:
+        return
+
+    def rolled_back(transaction):
+        while transaction is not None:
+            if transaction is previous_transaction:
+                return True
+            transaction = transaction.parent
+        return False
+
+    session.info[_PENDING_KEY] = [entry for entry in pending if not rolled_back(entry[0])]
@@ -0,0 +1,194 @@
+"""
+"Most favorited" counters.
+
+`favorite_counts` holds one row per Pokemon with the number of users that
+have it as a favorite. The favorites write ops in services/favorites.py
+update it in the same transaction as the favorites themselves: they learn
+which rows they actually inserted or deleted through RETURNING, so
+duplicate adds and removals of non-favorites don't move the counters.
+
+`favorite_count_index` mirrors the counters in a SortedList ordered by
+(-count, pokemon_id). The new counts come back from the UPDATE's RETURNING
+and are applied through `call_after_commit`, so `GET /users/favorites/top/{n}`
+is a slice of that list and never runs GROUP BY. There are at most
+LAST_POKEMON_ID entries, so the mirror keeps all of them, not only the top
+K. Like the leaderboard index, it is per process.
+
+`python -m app.services.favorite_counts` rebuilds the counters from
+`favorite_pokemons` and reports every Pokemon whose counter had drifted.
+A running server reloads its index within VIEW_RELOAD_INTERVAL_SECONDS
+(see services/view_generations.py).
+
+Usage: python -m app.services.favorite_counts [--dry-run]
+"""
+import argparse
+import threading
+from functools import partial
+from typing import Iterable
+from sortedcontainers import SortedList
+from sqlalchemy import Connection, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..database import Base, SessionLocal, engine
+from .commit_hooks import call_after_commit
+from .view_generations import FAVORITE_COUNTS, bump_generation
+from .writer import run_write
+
+
+class FavoriteCountIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = SortedList()
+        self._counts: dict[int, int] = {}
+        self.loaded = False
+        # Bumped on every reload and committed change; keys cached responses
+        self.version = 0
+
+    def reload(self, db: Session):
+        rows = db.execute(
+            select(models.FavoriteCount.pokemon_id, models.FavoriteCount.count).where(models.FavoriteCount.count > 0)
+        ).all()
+        with self._lock:
+            self._counts = dict(rows)
+            self._sorted = SortedList((-count, pokemon_id) for pokemon_id, count in self._counts.items())
+            self.loaded = True
+            self.version += 1
+
+    def apply(self, rows: Iterable[tuple[int, int]]):
+        """Applies committed (pokemon_id, count) values; a count of 0 removes the Pokemon."""
+        with self._lock:
+            self.version += 1
+            if not self.loaded:
+                return
+            for pokemon_id, count in rows:
+                previous = self._counts.pop(pokemon_id, None)
+                if previous is not None:
+                    self._sorted.remove((-previous, pokemon_id))
+                if count > 0:
+                    self._counts[pokemon_id] = count
+                    self._sorted.add((-count, pokemon_id))
+
+    def top(self, n: int) -> list[dict]:
+        with self._lock:
+            return [
+                {"pokemon_id": pokemon_id, "count": -negative_count}
+                for negative_count, pokemon_id in self._sorted.islice(0, max(n, 0))
+            ]
+
+
+favorite_count_index = FavoriteCountIndex()
+
+
+def get_favorite_count_index(db: Session) -> FavoriteCountIndex:
+    """Returns the index, loading it from `db` on first use."""
+    if not favorite_count_index.loaded:
+        favorite_count_index.reload(db)
+    return favorite_count_index
+
+
+async def get_favorite_count_index_async(db: AsyncSession) -> FavoriteCountIndex:
+    if not favorite_count_index.loaded:
+        await db.run_sync(favorite_count_index.reload)
+    return favorite_count_index
+
+
+# --- Counter updates (called from write ops; never commit) ---
+
+def count_added(db: Session, pokemon_ids: list[int]):
+    """+1 for every Pokemon in `pokemon_ids`, the favorite rows one user just inserted."""
+    if not pokemon_ids:
+        return
+    statement = insert(models.FavoriteCount).values([{"pokemon_id": pokemon_id, "count": 1} for pokemon_id in pokemon_ids])
+    statement = statement.on_conflict_do_update(
+        index_elements=["pokemon_id"], set_={"count": models.FavoriteCount.count + 1}
+    ).returning(models.FavoriteCount.pokemon_id, models.FavoriteCount.count)
+    _record_counts(db, db.execute(statement).all())
+
+
+def count_removed(db: Session, pokemon_ids: list[int]):
+    """-1 for every Pokemon in `pokemon_ids`, the favorite rows one user just deleted."""
+    if not pokemon_ids:
+        return
+    rows = db.execute(
+        update(models.FavoriteCount)
+        .where(models.FavoriteCount.pokemon_id.in_(pokemon_ids))
+        .values(count=func.max(models.FavoriteCount.count - 1, 0))
+        .returning(models.FavoriteCount.pokemon_id, models.FavoriteCount.count)
+        .execution_options(synchronize_session=False)
+    ).all()
+    _record_counts(db, rows)
+
+
+def _record_counts(db: Session, rows):
+    if rows:
+        call_after_commit(db, partial(favorite_count_index.apply, [tuple(row) for row in rows]))
+
+
+# --- Reconciliation ---
+
+def ensure_favorite_counts(connection: Connection):
+    """Builds the counters for databases that had favorites before `favorite_counts` existed."""
+    if connection.execute(select(models.FavoriteCount.pokemon_id).limit(1)).first() is not None:
+        return
+    if connection.execute(select(models.favorite_pokemon.id).limit(1)).first() is None:
+        return
+    connection.execute(insert(models.FavoriteCount).from_select(
+        ["pokemon_id", "count"],
+        select(models.favorite_pokemon.pokemon_id, func.count()).group_by(models.favorite_pokemon.pokemon_id),
+    ))
+
+
+def _reconcile(db: Session, dry_run: bool = False) -> list[tuple[int, int, int]]:
+    """
+    Write op: recounts `favorite_pokemons` and overwrites `favorite_counts`
+    with the result. Returns (pokemon_id, stored, actual) for every counter
+    that was wrong.
+    """
+    actual = dict(db.execute(
+        select(models.favorite_pokemon.pokemon_id, func.count()).group_by(models.favorite_pokemon.pokemon_id)
+    ).all())
+    stored = dict(db.execute(select(models.FavoriteCount.pokemon_id, models.FavoriteCount.count)).all())
+    drift = sorted(
+        (pokemon_id, stored.get(pokemon_id, 0), actual.get(pokemon_id, 0))
+        for pokemon_id in stored.keys() | actual.keys()
+        if stored.get(pokemon_id, 0) != actual.get(pokemon_id, 0)
+    )
+    if drift and not dry_run:
+        db.execute(delete(models.FavoriteCount))
+        if actual:
+            db.execute(insert(models.FavoriteCount), [
+                {"pokemon_id": pokemon_id, "count": count} for pokemon_id, count in actual.items()
+            ])
+        # Reloads this process's index, and the server's through the generation
+        bump_generation(db, FAVORITE_COUNTS)
+        call_after_commit(db, partial(_reload_index, db.get_bind()))
+    return drift
+
+
+def _reload_index(bind):
+    with Session(bind=bind) as db:
+        favorite_count_index.reload(db)
+
+
+def reconcile_favorite_counts(session_factory, dry_run: bool = False) -> list[tuple[int, int, int]]:
+    with session_factory() as db:
+        return run_write(db, partial(_reconcile, dry_run=dry_run))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the favorite counters from favorite_pokemons.")
+    parser.add_argument("--dry-run", action="store_true", help="report drift, but leave the table alone")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    drift = reconcile_favorite_counts(SessionLocal, dry_run=args.dry_run)
+    for pokemon_id, stored, actual in drift:
+        print(f"#{pokemon_id}: stored {stored}, actual {actual} ({actual - stored:+d})")
+    verb = "would fix" if args.dry_run else "fixed"
+    print(f"{len(drift)} counters drifted, {verb}" if drift else "no drift")
+
+
+if __name__ == "__main__":
+    main()
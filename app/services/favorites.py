@@ -0,0 +1,200 @@
+"""
+Favorite Pokemon as sets.
+
+`favorite_pokemons` has a UNIQUE (user_id, pokemon_id) index, so favoriting
+a Pokemon twice is a no-op instead of adding another row. Pokemon IDs are
+bounded by LAST_POKEMON_ID, so a user's favorites also fit in a bitset of
+LAST_POKEMON_ID + 1 bits (129 bytes), where bit `i` is set when Pokemon `i`
+is a favorite. `favorites_cache` keeps those bitsets, as Python ints, for
+recently active users. Favorites in common between two users are then a
+single `&`.
+
+Bulk edits are one INSERT ... ON CONFLICT DO NOTHING and/or one DELETE, in
+one transaction. Every write drops the user's bitset once it commits.
+Invalidation is per process: with several workers, the others can serve
+stale favorites for up to FAVORITES_CACHE_TTL_SECONDS.
+"""
+import threading
+import time
+from functools import partial
+from typing import Callable, Iterable, Optional
+from sqlalchemy import Connection, delete, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..config import FAVORITES_CACHE_SIZE, FAVORITES_CACHE_TTL_SECONDS
+from .auth_cache import ExpiringLRUCache
+from .commit_hooks import call_after_commit
+from .favorite_counts import count_added, count_removed
+
+
+_UNIQUE_INDEX = "ux_favorite_pokemons_user_pokemon"
+
+
+# --- Bitsets ---
+
+def to_bitset(pokemon_ids: Iterable[int]) -> int:
+    bits = 0
+    for pokemon_id in pokemon_ids:
+        bits |= 1 << pokemon_id
+    return bits
+
+
+def from_bitset(bits: int) -> list[int]:
+    """The Pokemon IDs set in `bits`, in ascending order."""
+    pokemon_ids = []
+    while bits:
+        lowest = bits & -bits
+        pokemon_ids.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return pokemon_ids
+
+
+class FavoritesCache:
+    def __init__(
+        self,
+        max_size: int = FAVORITES_CACHE_SIZE,
+        ttl_seconds: float = FAVORITES_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.bitsets = ExpiringLRUCache(max_size, clock)
+        self.ttl = ttl_seconds
+        # Same guard as AuthCache.generation: a bitset read from the database
+        # is only cached if no invalidation happened since the read started
+        self.generation = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[int]:
+        return self.bitsets.get(user_id)
+
+    def put(self, user_id: int, bits: int, generation: int):
+        with self._lock:
+            if generation == self.generation:
+                self.bitsets.put(user_id, bits, self._clock() + self.ttl)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.generation += 1
+            self.bitsets.pop(user_id)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.bitsets.clear()
+
+    def stats(self) -> dict:
+        return self.bitsets.stats()
+
+
+favorites_cache = FavoritesCache()
+
+
+def get_favorites_cache() -> FavoritesCache:
+    return favorites_cache
+
+
+def forget_favorites(session: Session, user_id: int):
+    """Drops the user's cached bitset once the transaction commits."""
+    call_after_commit(session, partial(favorites_cache.invalidate, user_id))
+
+
+# --- Reads ---
+
+def _favorite_ids_query(user_id: int):
+    return select(models.favorite_pokemon.pokemon_id).where(models.favorite_pokemon.user_id == user_id)
+
+
+def favorite_bitset(db: Session, user_id: int) -> int:
+    bits = favorites_cache.get(user_id)
+    if bits is None:
+        generation = favorites_cache.generation
+        bits = to_bitset(db.execute(_favorite_ids_query(user_id)).scalars())
+        favorites_cache.put(user_id, bits, generation)
+    return bits
+
+
+async def favorite_bitset_async(db: AsyncSession, user_id: int) -> int:
+    bits = favorites_cache.get(user_id)
+    if bits is None:
+        generation = favorites_cache.generation
+        bits = to_bitset((await db.execute(_favorite_ids_query(user_id))).scalars())
+        favorites_cache.put(user_id, bits, generation)
+    return bits
+
+
+# --- Write operations (run via run_write, see services/writer.py) ---
+
+# Each of these also updates favorite_counts with the rows it actually
+# inserted or deleted (see services/favorite_counts.py)
+
+def add_favorites(db: Session, user_id: int, pokemon_ids: Iterable[int]):
+    rows = [{"user_id": user_id, "pokemon_id": pokemon_id} for pokemon_id in set(pokemon_ids)]
+    if rows:
+        added = db.execute(
+            insert(models.favorite_pokemon).values(rows)
+            .on_conflict_do_nothing(index_elements=["user_id", "pokemon_id"])
+            .returning(models.favorite_pokemon.pokemon_id)
+        ).scalars().all()
+        count_added(db, added)
+    forget_favorites(db, user_id)
+
+
+def _delete_favorites(db: Session, user_id: int, *criteria) -> int:
+    removed = db.execute(
+        delete(models.favorite_pokemon)
+        .where(models.favorite_pokemon.user_id == user_id, *criteria)
+        .returning(models.favorite_pokemon.pokemon_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    count_removed(db, removed)
+    forget_favorites(db, user_id)
+    return len(removed)
+
+
+def remove_favorites(db: Session, user_id: int, pokemon_ids: Iterable[int]) -> int:
+    """Returns how many of `pokemon_ids` were favorites."""
+    pokemon_ids = set(pokemon_ids)
+    if not pokemon_ids:
+        return 0
+    return _delete_favorites(db, user_id, models.favorite_pokemon.pokemon_id.in_(pokemon_ids))
+
+
+def remove_all_favorites(db: Session, user_id: int) -> int:
+    """Used before deleting a user, so the counters see the favorites go."""
+    return _delete_favorites(db, user_id)
+
+
+def replace_favorites(db: Session, user_id: int, pokemon_ids: Iterable[int]) -> list[int]:
+    """Makes `pokemon_ids` the user's whole favorites set; returns it in ascending order."""
+    pokemon_ids = set(pokemon_ids)
+    _delete_favorites(db, user_id, models.favorite_pokemon.pokemon_id.not_in(pokemon_ids))
+    add_favorites(db, user_id, pokemon_ids)
+    return sorted(pokemon_ids)
+
+
+def update_favorites(db: Session, user_id: int, add: Iterable[int], remove: Iterable[int]) -> list[int]:
+    """Adds `add` and removes `remove` in one transaction; returns the resulting set in ascending order."""
+    add_favorites(db, user_id, add)
+    remove_favorites(db, user_id, remove)
+    return sorted(db.execute(_favorite_ids_query(user_id)).scalars())
+
+
+# --- Schema ---
+
+def ensure_unique_favorites(connection: Connection):
+    """
+    Databases created before the UNIQUE (user_id, pokemon_id) index can hold
+    duplicate favorites. Keeps the oldest row of each pair and adds the index.
+    """
+    if any(index["name"] == _UNIQUE_INDEX for index in inspect(connection).get_indexes("favorite_pokemons")):
+        return
+
+    connection.execute(text(
+        "DELETE FROM favorite_pokemons WHERE id NOT IN "
+        "(SELECT MIN(id) FROM favorite_pokemons GROUP BY user_id, pokemon_id)"
+    ))
+    for index in models.favorite_pokemon.__table__.indexes:
+        if index.name == _UNIQUE_INDEX:
+            index.create(connection)
@@ -0,0 +1,134 @@
+"""
+In-process ranked index of the popularity leaderboard.
+
+Keeps every leaderboard row in a SortedList ordered by (-elo, pokemon_id),
+so top-N, point lookups, rank, percentile and neighbours are all served
+from memory in O(log n) without touching SQLite.
+
+The index follows the database: Elo changes made by `apply_elo_update` (via
+RETURNING) and ORM flushes of PopularityLeaderboard rows are applied through
+`call_after_commit`, so rolled-back votes never reach it. It is per
+process: run a single worker, or each worker only sees the votes it
+committed itself.
+"""
+import threading
+from functools import partial
+from itertools import chain
+from typing import Iterable, Optional
+from sortedcontainers import SortedList
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import PopularityLeaderboard
+from .commit_hooks import call_after_commit
+
+
+class LeaderboardIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = SortedList()
+        self._rows: dict[int, tuple[int, int]] = {}  # pokemon_id -> (row id, elo)
+        self.loaded = False
+        # Bumped on every reload and committed Elo change; keys cached responses
+        self.version = 0
+
+    # --- Maintenance ---
+
+    def reload(self, db: Session):
+        rows = db.execute(
+            select(PopularityLeaderboard.id, PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+        ).all()
+        with self._lock:
+            self._rows = {pokemon_id: (row_id, elo) for row_id, pokemon_id, elo in rows}
+            self._sorted = SortedList((-elo, pokemon_id) for pokemon_id, (_, elo) in self._rows.items())
+            self.loaded = True
+            self.version += 1
+
+    def ensure_loaded(self, db: Session) -> "LeaderboardIndex":
+        if not self.loaded:
+            self.reload(db)
+        return self
+
+    def apply(self, rows: Iterable[tuple[int, int, Optional[int]]]):
+        """Applies committed (row id, pokemon_id, elo) changes; elo None removes the row."""
+        with self._lock:
+            self.version += 1
+            if not self.loaded:
+                return
+            for row_id, pokemon_id, elo in rows:
+                previous = self._rows.pop(pokemon_id, None)
+                if previous is not None:
+                    self._sorted.remove((-previous[1], pokemon_id))
+                if elo is not None:
+                    self._rows[pokemon_id] = (row_id, elo)
+                    self._sorted.add((-elo, pokemon_id))
+
+    # --- Queries ---
+
+    def _entry(self, pokemon_id: int) -> dict:
+        row_id, elo = self._rows[pokemon_id]
+        return {"id": row_id, "pokemon_id": pokemon_id, "elo": elo}
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def get(self, pokemon_id: int) -> Optional[dict]:
+        with self._lock:
+            if pokemon_id not in self._rows:
+                return None
+            return self._entry(pokemon_id)
+
+    def top(self, n: int) -> list[dict]:
+        with self._lock:
+            return [self._entry(pokemon_id) for _, pokemon_id in self._sorted.islice(0, max(n, 0))]
+
+    def rank(self, pokemon_id: int, neighbors: int = 1) -> Optional[dict]:
+        with self._lock:
+            if pokemon_id not in self._rows:
+                return None
+            _, elo = self._rows[pokemon_id]
+            position = self._sorted.index((-elo, pokemon_id))
+            total = len(self._sorted)
+            above = self._sorted.islice(max(position - neighbors, 0), position)
+            below = self._sorted.islice(position + 1, position + 1 + neighbors)
+            return {
+                **self._entry(pokemon_id),
+                "rank": position + 1,
+                "total": total,
+                # Share of the leaderboard ranked below this Pokemon
+                "percentile": round(100 * (total - 1 - position) / max(total - 1, 1), 2),
+                "above": [self._entry(other_id) for _, other_id in above],
+                "below": [self._entry(other_id) for _, other_id in below],
+            }
+
+
+leaderboard_index = LeaderboardIndex()
+
+
+def get_leaderboard_index(db: Session) -> LeaderboardIndex:
+    """Returns the index, loading it from `db` on first use."""
+    return leaderboard_index.ensure_loaded(db)
+
+
+async def get_leaderboard_index_async(db: AsyncSession) -> LeaderboardIndex:
+    if not leaderboard_index.loaded:
+        await db.run_sync(leaderboard_index.reload)
+    return leaderboard_index
+
+
+# --- Session hooks ---
+
+def record_elo_changes(session: Session, rows: Iterable[tuple[int, int, Optional[int]]]):
+    """Queues (row id, pokemon_id, elo) changes made with Core statements until commit."""
+    call_after_commit(session, partial(leaderboard_index.apply, list(rows)))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_rows(session, flush_context):
+    rows = [
+        (obj.id, obj.pokemon_id, obj.elo) for obj in chain(session.new, session.dirty)
+        if isinstance(obj, PopularityLeaderboard)
+    ]
+    rows += [(obj.id, obj.pokemon_id, None) for obj in session.deleted if isinstance(obj, PopularityLeaderboard)]
+    if rows:
+        record_elo_changes(session, rows)
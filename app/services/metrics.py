@@ -0,0 +1,313 @@
+"""
+In-process metrics, served in the Prometheus text format by `GET /metrics`.
+
+`registry` holds three kinds of metrics:
+
+- counters and histograms, updated on the hot path. A series is a list of
+  plain ints looked up by its label values; each metric has one lock, held
+  only for the few additions of an update, so recording a request or a
+  statement costs a microsecond or two. Histogram buckets are stored
+  per bucket and only made cumulative when rendered.
+- gauges, whose value is read by a callback at scrape time (pool checkouts,
+  threadpool occupancy), so they cost nothing between scrapes.
+- stats gauges, one per number in a component's `stats()` dict.
+
+`MetricsMiddleware` records every HTTP request by method and route template
+(`/popularity/{pokemon_id}`, not the raw path, which would give a series
+per Pokemon). `instrument_engine` records every SQL statement by operation
+and first table through the `before_cursor_execute`/`after_cursor_execute`
+events, and exposes the engine's pool. Values are per process.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Iterable, Optional, Union
+from anyio import to_thread
+from sqlalchemy import Engine, event
+
+
+_PREFIX = "pokeparty_"
+
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+Samples = Iterable[tuple[tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: int = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: tuple = ()) -> int:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = HTTP_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket..., count above the last bucket, total count, sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2) + [0.0]
+            series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self._series.get(labels)
+        return series[-2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-2]}")
+        return lines
+
+
+class Gauge:
+    """A value read at scrape time: `collect()` returns a number or (labels, value) samples."""
+
+    def __init__(self, name: str, help: str, collect: Callable[[], Union[float, Samples]], label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        samples = self.collect()
+        if samples is None:
+            return []
+        if isinstance(samples, (int, float)):
+            samples = [((), samples)]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in samples:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+def _flatten(stats: dict, prefix: str = "") -> Iterable[tuple[str, float]]:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+class StatsGauges:
+    """One gauge per number of `provider()`, a `stats()` dict (or None while the component is stopped)."""
+
+    def __init__(self, component: str, provider: Callable[[], Optional[dict]]):
+        self.name = _PREFIX + component
+        self.component = component
+        self.provider = provider
+
+    def render(self) -> list[str]:
+        stats = self.provider()
+        if stats is None:
+            return []
+        lines = []
+        for key, value in _flatten(stats):
+            name = f"{self.name}_{key}"
+            lines.append(f"# HELP {name} {self.component} stats(): {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+
+    def _add(self, metric):
+        # Registering a name again replaces it, e.g. a component restarted by the lifespan
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(_PREFIX + name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets=HTTP_BUCKETS) -> Histogram:
+        return self._add(Histogram(_PREFIX + name, help, label_names, buckets))
+
+    def gauge(self, name: str, help: str, collect, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(_PREFIX + name, help, collect, label_names))
+
+    def stats(self, component: str, provider: Callable[[], Optional[dict]]) -> StatsGauges:
+        return self._add(StatsGauges(component, provider))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return registry
+
+
+# --- HTTP ---
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code.", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template.", ("method", "route")
+)
+_in_progress = 0
+registry.gauge("http_requests_in_progress", "HTTP requests being handled.", lambda: _in_progress)
+
+
+def _threadpool_occupancy() -> Samples:
+    # The limiter belongs to the running event loop, so this only works at
+    # scrape time on the loop (GET /metrics is an async handler)
+    try:
+        limiter = to_thread.current_default_thread_limiter()
+    except RuntimeError:
+        return []
+    return [(("in_use",), limiter.borrowed_tokens), (("max",), limiter.total_tokens)]
+
+
+registry.gauge(
+    "threadpool_threads", "Threads of the request threadpool (sync handlers run there).", _threadpool_occupancy, ("state",)
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; unlike BaseHTTPMiddleware it leaves the response stream untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_progress
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        _in_progress += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_progress -= 1
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests.inc((method, route, status_code))
+            http_request_duration.observe((method, route), elapsed)
+
+
+# --- SQL ---
+
+sql_statement_duration = registry.histogram(
+    "sql_statement_duration_seconds", "SQL statement latency by operation and first table.", ("operation", "table"), SQL_BUCKETS
+)
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+"?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_labels(statement: str) -> tuple[str, str]:
+    """(operation, table) of a statement; SQLAlchemy reuses statement strings, so this is a cache hit."""
+    stripped = statement.lstrip()
+    operation = stripped.split(None, 1)[0].upper() if stripped else ""
+    table = _TABLE.search(stripped)
+    return operation, table.group(1) if table else ""
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        sql_statement_duration.observe(statement_labels(statement), time.perf_counter() - started)
+
+
+_engines: dict[str, Engine] = {}
+
+
+def _pool_checkouts() -> Samples:
+    return [((name, "checked_out"), engine.pool.checkedout()) for name, engine in _engines.items()] + [
+        ((name, "size"), engine.pool.size()) for name, engine in _engines.items() if hasattr(engine.pool, "size")
+    ]
+
+
+registry.gauge("db_pool_connections", "Connections of each engine's pool.", _pool_checkouts, ("engine", "state"))
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Times every statement of `engine` and exposes its pool as `engine=name`."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    _engines[name] = engine
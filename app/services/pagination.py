@@ -0,0 +1,60 @@
+"""
+Keyset pagination and NDJSON streaming helpers.
+
+A page is fetched with `WHERE <key> after <cursor> ORDER BY <key> LIMIT
+limit + 1`, so every page costs one index range scan, however deep it is.
+The extra row only tells whether there is a next page. The cursor is the
+key of the last row returned, base64url-encoded, and clients should treat
+it as opaque.
+
+Streams yield NDJSON lines in batches from a server-side cursor, so only
+one batch of rows is in memory at a time.
+"""
+import base64
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Sequence
+from .fast_json import ndjson_lines, row_dicts
+
+
+STREAM_BATCH_SIZE = 500
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(*key: int) -> str:
+    return base64.urlsafe_b64encode(":".join(map(str, key)).encode()).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[tuple[int, ...]]:
+    """The key of `size` integers in `cursor`; None for the first page."""
+    if cursor is None:
+        return None
+    try:
+        key = tuple(int(part) for part in base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":"))
+    except ValueError:  # also covers binascii and unicode errors
+        raise InvalidCursor()
+    if len(key) != size:
+        raise InvalidCursor()
+    return key
+
+
+def page(rows: Sequence, limit: int, key, fields: Sequence[str]) -> dict:
+    """
+    Splits `limit` + 1 fetched Core rows into items (as dicts of `fields`)
+    and the next cursor (`key(row)` -> tuple of ints).
+    """
+    items = rows[:limit]
+    next_cursor = encode_cursor(*key(items[-1])) if len(rows) > limit else None
+    return {"items": row_dicts(items, fields), "next_cursor": next_cursor}
+
+
+def ndjson_batches(partitions: Iterable, fields: Sequence[str]) -> Iterator[bytes]:
+    """One chunk of NDJSON lines per partition of rows (from `Result.partitions()`)."""
+    for batch in partitions:
+        yield ndjson_lines(batch, fields)
+
+
+async def ndjson_batches_async(partitions: AsyncIterable, fields: Sequence[str]) -> AsyncIterator[bytes]:
+    async for batch in partitions:
+        yield ndjson_lines(batch, fields)
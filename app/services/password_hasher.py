@@ -0,0 +1,137 @@
+"""
+Bounded pool for bcrypt.
+
+A bcrypt hash or check takes about 250 ms at the default cost. Run on the
+request threadpool, a burst of logins used to take every thread and stall
+unrelated endpoints. Password work now goes to PASSWORD_HASH_WORKERS
+dedicated threads (bcrypt releases the GIL, so they run in parallel). At
+most PASSWORD_HASH_QUEUE_SIZE more jobs may wait. Beyond that,
+`PasswordHasherBusy` is raised at once and the endpoints answer 503
+instead of letting requests time out.
+
+In the sync handlers the request thread still waits for its job, but only
+admitted jobs wait, so at most workers + queue size request threads are
+held by password work. The async handlers await the job without holding
+any thread.
+
+`verify_and_update` also returns a new hash when the stored one was made
+with a different cost than BCRYPT_ROUNDS (passlib's `needs_update`), so
+hashes are upgraded on login.
+
+passlib (and the bcrypt backend) is imported with the first password
+operation, not at startup.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from starlette.concurrency import run_in_threadpool
+from ..config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE, BCRYPT_ROUNDS
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        queue_size: int = PASSWORD_HASH_QUEUE_SIZE,
+        rounds: int = BCRYPT_ROUNDS,
+    ):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.completed = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._context = None
+
+    @property
+    def context(self):
+        if self._context is None:
+            from passlib.context import CryptContext
+
+            with self._lock:
+                if self._context is None:
+                    self._context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=self.rounds)
+        return self._context
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        """Waits for running jobs and stops the threads; the next job starts a new pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    # --- Admission ---
+
+    def _submit(self, fn: Callable[..., Any], *args) -> Future:
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hasher")
+            executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Optional[Future]):
+        with self._lock:
+            self._in_flight -= 1
+            if future is not None:
+                self.completed += 1
+
+    def _run(self, fn: Callable[..., Any], *args) -> Any:
+        if self.workers <= 0:
+            return fn(*args)
+        return self._submit(fn, *args).result()
+
+    async def _run_async(self, fn: Callable[..., Any], *args) -> Any:
+        if self.workers <= 0:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    # --- Operations ---
+
+    def hash(self, password: str) -> str:
+        return self._run(self.context.hash, password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run_async(self.context.hash, password)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """Returns whether `password` matches, and a replacement hash if the stored one is outdated."""
+        return self._run(self.context.verify_and_update, password, hashed_password)
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run_async(self.context.verify_and_update, password, hashed_password)
+
+
+password_hasher = PasswordHasher()
+
+
+def get_password_hasher() -> PasswordHasher:
+    return password_hasher
+
+
+def stop_password_hasher():
+    password_hasher.shutdown()
@@ -1,41 +1,231 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-from datetime import date
+"""
+Pokemon of the day.
+
+The schedule is generated in bulk, POTD_SCHEDULE_DAYS ahead, and stored in
+`pokemon_of_the_day`. Each day's pick is drawn from a RNG seeded with
+POTD_SEED and the date, skipping Pokemon used in the previous
+POTD_NO_REPEAT_DAYS days. Every worker therefore computes the same
+schedule. Rows are inserted with ON CONFLICT DO NOTHING, so concurrent
+workers don't race on the first request of a day.
+
+The loaded schedule is kept in memory. `potd_cache` resolves the current
+day in the requested timezone and remembers the answer until that
+timezone's next midnight, so `GET /pokemon-otd` (with or without `?tz=`)
+normally runs no query.
+"""
 import random
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone, time as dt_time
+from functools import partial
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models
-from ..config import LAST_POKEMON_ID
+from ..config import LAST_POKEMON_ID, POTD_TIMEZONE, POTD_SEED, POTD_SCHEDULE_DAYS, POTD_NO_REPEAT_DAYS
+from .writer import run_write, run_write_async
+
+
+class UnknownTimezone(Exception):
+    pass
+
+
+class PokemonOfTheDay(NamedTuple):
+    day_date: str
+    pokemon_id: int
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def today(tz: str = POTD_TIMEZONE) -> date:
+    return datetime.now(ZoneInfo(tz)).date()
+
+
+# --- Schedule ---
+
+def pick_pokemon(day: date, recent, seed: str = POTD_SEED, last_pokemon_id: int = LAST_POKEMON_ID) -> int:
+    """Deterministic pick for `day` that is not in `recent`."""
+    rng = random.Random(f"{seed}:{day.isoformat()}")
+    while True:
+        pokemon_id = rng.randint(1, last_pokemon_id)
+        if pokemon_id not in recent:
+            return pokemon_id
+
+
+def plan_schedule(
+    existing: dict[date, int],
+    start: date,
+    days: int,
+    window: int = POTD_NO_REPEAT_DAYS,
+    seed: str = POTD_SEED,
+    last_pokemon_id: int = LAST_POKEMON_ID,
+) -> dict[date, int]:
+    """
+    Pokemon for `days` days from `start`. Days in `existing` keep their
+    Pokemon; `existing` should also hold the `window` - 1 days before
+    `start`, which the first new picks must avoid.
+    """
+    if window >= last_pokemon_id:
+        raise ValueError("POTD_NO_REPEAT_DAYS must be below the number of Pokemon")
+
+    recent: deque[int] = deque(maxlen=max(window - 1, 0))
+    day = start - timedelta(days=window - 1)
+    while day < start:
+        if day in existing:
+            recent.append(existing[day])
+        day += timedelta(days=1)
+
+    schedule = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        pokemon_id = existing.get(day) or pick_pokemon(day, set(recent), seed, last_pokemon_id)
+        schedule[day] = pokemon_id
+        if recent.maxlen:
+            recent.append(pokemon_id)
+    return schedule
+
+
+def extend_schedule(db: Session, start: date, days: int = POTD_SCHEDULE_DAYS, window: int = POTD_NO_REPEAT_DAYS) -> int:
+    """Write op: fills in the missing days of the next `days` days from `start`. Returns the rows inserted."""
+    end = start + timedelta(days=days - 1)
+    rows = db.execute(
+        select(models.pokemon_of_the_day.day_date, models.pokemon_of_the_day.pokemon_id).where(
+            models.pokemon_of_the_day.day_date >= (start - timedelta(days=window - 1)).isoformat(),
+            models.pokemon_of_the_day.day_date <= end.isoformat(),
+        )
+    ).all()
+    existing = {date.fromisoformat(day_date): pokemon_id for day_date, pokemon_id in rows}
+
+    new_rows = [
+        {"day_date": day.isoformat(), "pokemon_id": pokemon_id}
+        for day, pokemon_id in plan_schedule(existing, start, days, window).items()
+        if day not in existing
+    ]
+    if new_rows:
+        db.execute(insert(models.pokemon_of_the_day).on_conflict_do_nothing(index_elements=["day_date"]), new_rows)
+    return len(new_rows)
+
+
+def _schedule_start() -> date:
+    # Midnight in UTC-12 is still yesterday in UTC
+    return _utc_today() - timedelta(days=1)
 
-def get_or_create_pokemon_of_the_day(db: Session) -> models.pokemon_of_the_day:
+
+# --- Cache ---
+
+class PotdCache:
+    def __init__(self, default_timezone: str = POTD_TIMEZONE):
+        self.default_timezone = default_timezone
+        self._schedule: dict[str, int] = {}
+        # timezone -> (expires_at, entry)
+        self._current: dict[str, tuple[float, PokemonOfTheDay]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, db: Session, start: Optional[date] = None):
+        start = start or _schedule_start()
+        rows = db.execute(
+            select(models.pokemon_of_the_day.day_date, models.pokemon_of_the_day.pokemon_id)
+            .where(models.pokemon_of_the_day.day_date >= start.isoformat())
+        ).all()
+        with self._lock:
+            self._schedule = dict(rows)
+            self._current = {}
+
+    def current(self, tz: Optional[str] = None, now: Optional[float] = None) -> Optional[PokemonOfTheDay]:
+        """
+        Today's entry in `tz`, or None if the loaded schedule doesn't cover
+        it. Raises `UnknownTimezone` for anything that isn't an IANA zone name.
+        """
+        key = tz or self.default_timezone
+        now = time.time() if now is None else now
+        cached = self._current.get(key)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+
+        try:
+            zone = ZoneInfo(key)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise UnknownTimezone(key)
+        today = datetime.fromtimestamp(now, zone).date()
+        pokemon_id = self._schedule.get(today.isoformat())
+        if pokemon_id is None:
+            return None
+        entry = PokemonOfTheDay(today.isoformat(), pokemon_id)
+        with self._lock:
+            self._current[key] = (self.next_day_starts_at(entry, key), entry)
+        return entry
+
+    def next_day_starts_at(self, entry: PokemonOfTheDay, tz: Optional[str] = None) -> float:
+        """Unix time of the midnight that ends `entry`'s day in `tz`."""
+        next_day = date.fromisoformat(entry.day_date) + timedelta(days=1)
+        return datetime.combine(next_day, dt_time.min, tzinfo=ZoneInfo(tz or self.default_timezone)).timestamp()
+
+
+potd_cache = PotdCache()
+
+
+def refresh_schedule(db: Session):
+    """Extends the stored schedule (if needed) and reloads the cache from it."""
+    run_write(db, partial(extend_schedule, start=_schedule_start()))
+    potd_cache.load(db)
+
+
+async def refresh_schedule_async(db: AsyncSession):
+    await run_write_async(db, partial(extend_schedule, start=_schedule_start()))
+    await db.run_sync(potd_cache.load)
+
+
+def current_pokemon_of_the_day(db: Session, tz: Optional[str] = None) -> PokemonOfTheDay:
+    entry = potd_cache.current(tz)
+    if entry is None:
+        # Ran past the loaded schedule (or it was never loaded)
+        refresh_schedule(db)
+        entry = potd_cache.current(tz)
+    return entry
+
+
+async def current_pokemon_of_the_day_async(db: AsyncSession, tz: Optional[str] = None) -> PokemonOfTheDay:
+    entry = potd_cache.current(tz)
+    if entry is None:
+        await refresh_schedule_async(db)
+        entry = potd_cache.current(tz)
+    return entry
+
+
+# --- Database lookups ---
+
+def get_or_create_pokemon_of_the_day(db: Session, day: Optional[date] = None) -> models.pokemon_of_the_day:
     """
-    Retrieves the Pokemon of the Day for the current date.
-    If it doesn't exist, it randomly selects one and saves it to the database.
-    Thread-safe thanks to database unique constraints.
+    Returns the stored Pokemon of the Day for `day` (today in POTD_TIMEZONE by default).
+    If the schedule doesn't reach that day yet, it is extended first.
     """
-    today = date.today().isoformat()
+    day = day or today()
+    query = select(models.pokemon_of_the_day).filter(models.pokemon_of_the_day.day_date == day.isoformat())
 
-    # 1. Try to find existing entry for today
-    existing_potd = db.query(models.pokemon_of_the_day).filter(
-        models.pokemon_of_the_day.day_date == today
-    ).first()
+    existing_potd = db.execute(query).scalars().first()
+    if existing_potd:
+        return existing_potd
+
+    run_write(db, partial(extend_schedule, start=day))
+    return db.execute(query).scalars().first()
+
+
+async def get_or_create_pokemon_of_the_day_async(db: AsyncSession, day: Optional[date] = None) -> models.pokemon_of_the_day:
+    """
+    Async counterpart of `get_or_create_pokemon_of_the_day` for DB_MODE=async.
+    """
+    day = day or today()
+    query = select(models.pokemon_of_the_day).filter(models.pokemon_of_the_day.day_date == day.isoformat())
 
+    existing_potd = (await db.execute(query)).scalars().first()
     if existing_potd:
         return existing_potd
 
-    # 2. If not found, create a new one
-    random_pokemon_id = random.randint(1, LAST_POKEMON_ID)
-    
-    new_potd = models.pokemon_of_the_day(
-        day_date=today,
-        pokemon_id=random_pokemon_id
-    )
-
-    try:
-        db.add(new_potd)
-        db.commit()
-        db.refresh(new_potd)
-        return new_potd
-    except IntegrityError:
-        db.rollback()
-        return db.query(models.pokemon_of_the_day).filter(
-            models.pokemon_of_the_day.day_date == today
-        ).first()
+    await run_write_async(db, partial(extend_schedule, start=day))
+    return (await db.execute(query)).scalars().first()
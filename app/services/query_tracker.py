@@ -0,0 +1,172 @@
+"""
+Per-request SQL accounting.
+
+`QueryTrackingMiddleware` opens a `QueryTracker` for every HTTP request and
+keeps it in a context variable. Sync handlers and dependencies run in the
+threadpool with a copy of the request's context, and the async engine runs
+statements in greenlets that share it, so the cursor events installed by
+`track_engine` find the tracker of the request that issued each statement.
+For every request the tracker:
+
+- counts statements and their total time, returned to the client as
+  `Server-Timing: db;dur=<ms>;desc="<n> queries"`;
+- keeps how often each SQL string ran. SQLAlchemy renders the same string
+  for the same query with different parameters, so a string that runs
+  QUERY_REPEAT_THRESHOLD times in one request is logged as a likely N+1.
+
+Statements slower than SLOW_QUERY_MS are logged with every parameter
+replaced by its type, so no emails, password hashes or tokens reach the
+logs. That check also covers statements outside requests (background jobs,
+the writer thread with WRITE_MODE=queue), which have no tracker.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from sqlalchemy import Engine, event
+from ..config import QUERY_REPEAT_THRESHOLD, SLOW_QUERY_MS
+
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["QueryTracker"]] = contextvars.ContextVar("query_tracker", default=None)
+
+
+class QueryTracker:
+    def __init__(self, label: str = "", scope: Optional[dict] = None):
+        self._label = label
+        self._scope = scope
+        self.count = 0
+        self.duration = 0.0
+        # SQL string -> executions
+        self.statements: dict[str, int] = {}
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    @property
+    def label(self) -> str:
+        """For a request, the method and route template once routed (`GET /users/{username}`)."""
+        if self._scope is None:
+            return self._label
+        route = self._scope.get("route")
+        return f"{self._scope['method']} {route.path if route is not None else self._scope['path']}"
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> dict[str, int]:
+        """Statements that ran at least `threshold` times."""
+        if threshold <= 0:
+            return {}
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+    def describe(self) -> str:
+        return "\n".join(f"{count}x {statement}" for statement, count in self.statements.items())
+
+
+def current_tracker() -> Optional[QueryTracker]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries(label: str = "") -> Iterator[QueryTracker]:
+    """Tracks the statements run in this context (and threads/greenlets started from it)."""
+    tracker = QueryTracker(label)
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
+
+
+# --- Redaction ---
+
+def _placeholder(value) -> str:
+    return "NULL" if value is None else f"<{type(value).__name__}>"
+
+
+def redact(parameters):
+    """`parameters` with every value replaced by its type name."""
+    if isinstance(parameters, dict):
+        return {key: _placeholder(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            # executemany
+            return f"<{len(parameters)} parameter sets>"
+        return tuple(_placeholder(value) for value in parameters)
+    return parameters
+
+
+# --- Engine events ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._tracker_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_tracker_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(statement, elapsed)
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s %s",
+            elapsed * 1000, tracker.label if tracker is not None else "background", statement, redact(parameters),
+        )
+
+
+def track_engine(engine: Engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Requests ---
+
+_observers: list[Callable[[QueryTracker], None]] = []
+
+
+@contextmanager
+def collect_request_trackers() -> Iterator[list[QueryTracker]]:
+    """Collects the tracker of every request that finishes inside the block (used by the test suite)."""
+    finished: list[QueryTracker] = []
+    _observers.append(finished.append)
+    try:
+        yield finished
+    finally:
+        _observers.remove(finished.append)
+
+
+class QueryTrackingMiddleware:
+    """Pure ASGI middleware: one QueryTracker per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = QueryTracker(scope=scope)
+        token = _current.set(tracker)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={tracker.duration * 1000:.2f};desc="{tracker.count} queries"'
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            for statement, count in tracker.repeated().items():
+                logger.warning("Possible N+1 in %s: %d x %s", tracker.label, count, statement)
+            for observer in _observers:
+                observer(tracker)
@@ -1,40 +1,220 @@
-from sqlalchemy.orm import Session
-from ..models import PopularityLeaderboard
+import time
+from sqlalchemy import select, update, case, cast, func, text, bindparam, Integer
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, aliased
+from ..models import PopularityLeaderboard, Vote
+from ..config import LAST_POKEMON_ID
+from .leaderboard_index import record_elo_changes
+from .matchmaking import record_vote
 
 
-def update_elo_and_save(db: Session, pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int):
+K_FACTOR = 48
+DEFAULT_ELO = 1000
+
+
+def calculate_elo_delta(elo1: int, elo2: int, pokemon1_won: bool) -> int:
+    """Points pokemon1 gains (negative: loses); pokemon2 moves by the opposite amount."""
+    expected_1 = 1 / (1 + 10 ** ((elo2 - elo1) / 400))
+    result_1 = 1 if pokemon1_won else 0
+    
+    # Truncating the delta (not each new rating) keeps the update zero-sum
+    return int(K_FACTOR * (result_1 - expected_1))
+
+
+def calculate_new_elos(elo1: int, elo2: int, pokemon1_won: bool) -> tuple[int, int]:
+    delta = calculate_elo_delta(elo1, elo2, pokemon1_won)
+    return elo1 + delta, elo2 - delta
+
+
+# --- SQL statements ---
+# Built once with bind parameters; constructing them per vote costs more than
+# executing them.
+
+# UPSERT that creates missing leaderboard rows and leaves existing ones alone
+_ENSURE_ROWS = insert(PopularityLeaderboard.__table__).values([
+    {"pokemon_id": bindparam("pokemon1_id"), "elo": DEFAULT_ELO},
+    {"pokemon_id": bindparam("pokemon2_id"), "elo": DEFAULT_ELO},
+]).on_conflict_do_nothing(index_elements=["pokemon_id"])
+
+
+def _build_elo_update():
+    """
+    Single UPDATE ... RETURNING that moves Elo between the two rows.
+
+    Elo is zero-sum: pokemon2 loses exactly what pokemon1 gains, computed
+    the same way as `calculate_elo_delta`. The delta is an uncorrelated
+    scalar subquery, which SQLite evaluates once per statement from the
+    pre-update values, so both rows use the same delta and concurrent votes
+    can never lose an update.
+    """
+    p1 = aliased(PopularityLeaderboard)
+    p2 = aliased(PopularityLeaderboard)
+    expected_1 = 1.0 / (1 + func.pow(10, (p2.elo - p1.elo) / 400.0))
+    delta = select(
+        cast(K_FACTOR * (bindparam("result_1", type_=Integer) - expected_1), Integer)
+    ).select_from(p1).join(
+        p2, p2.pokemon_id == bindparam("pokemon2_id")
+    ).where(
+        p1.pokemon_id == bindparam("pokemon1_id")
+    ).scalar_subquery()
+
+    return (
+        update(PopularityLeaderboard)
+        .where(PopularityLeaderboard.pokemon_id.in_([bindparam("pokemon1_id"), bindparam("pokemon2_id")]))
+        .values(elo=PopularityLeaderboard.elo + delta * case(
+            (PopularityLeaderboard.pokemon_id == bindparam("pokemon1_id"), 1), else_=-1
+        ))
+        .returning(PopularityLeaderboard.id, PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+    )
+
+
+_ELO_UPDATE = _build_elo_update()
+
+# Append-only vote log (see services/recompute.py)
+_LOG_VOTE = insert(Vote.__table__)
+
+
+def _vote_params(pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int) -> dict:
+    return {
+        "pokemon1_id": pokemon1_id,
+        "pokemon2_id": pokemon2_id,
+        "result_1": 1 if winner_pokemon_id == pokemon1_id else 0,
+    }
+
+
+def _log_params(pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int) -> dict:
+    return {
+        "pokemon1_id": pokemon1_id,
+        "pokemon2_id": pokemon2_id,
+        "pokemon1_won": winner_pokemon_id == pokemon1_id,
+        "created_at": int(time.time()),
+    }
+
+
+def _new_elos(rows, pokemon1_id: int) -> tuple[int, int]:
+    elos = {pokemon_id: elo for _, pokemon_id, elo in rows}
+    pokemon2_elo = next(elo for pokemon_id, elo in elos.items() if pokemon_id != pokemon1_id)
+    return elos[pokemon1_id], pokemon2_elo
+
+
+def apply_elo_update(db: Session, pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int) -> tuple[int, int]:
+    """
+    Applies one vote to the leaderboard without committing, so callers can
+    group it with other writes (e.g. the session delete) in one transaction.
+    """
     # Validate winner_pokemon_id
     if winner_pokemon_id not in [pokemon1_id, pokemon2_id]:
         raise ValueError("Winner ID must be one of the pokemon IDs")
     
-    K_FACTOR = 48
+    params = _vote_params(pokemon1_id, pokemon2_id, winner_pokemon_id)
+    db.execute(_ENSURE_ROWS, params)
+    rows = db.execute(_ELO_UPDATE, params).all()
+    db.execute(_LOG_VOTE, _log_params(pokemon1_id, pokemon2_id, winner_pokemon_id))
+    record_elo_changes(db, rows)
+    new_elos = _new_elos(rows, pokemon1_id)
+    record_vote(db, pokemon1_id, pokemon2_id, *new_elos)
     
-    pokemon1 = db.query(PopularityLeaderboard).filter_by(pokemon_id=pokemon1_id).first()
-    if not pokemon1:
-        pokemon1 = PopularityLeaderboard(pokemon_id=pokemon1_id, elo=1000)
-        db.add(pokemon1)
-        db.commit()
-    
-    pokemon2 = db.query(PopularityLeaderboard).filter_by(pokemon_id=pokemon2_id).first()
-    if not pokemon2:
-        pokemon2 = PopularityLeaderboard(pokemon_id=pokemon2_id, elo=1000)
-        db.add(pokemon2)
-        db.commit()
-    
-    pokemon1_won = winner_pokemon_id == pokemon1_id
-    
-    expected_1 = 1 / (1 + 10 ** ((pokemon2.elo - pokemon1.elo) / 400))
-    expected_2 = 1 / (1 + 10 ** ((pokemon1.elo - pokemon2.elo) / 400))
-    
-    result_1 = 1 if pokemon1_won else 0
-    result_2 = 0 if pokemon1_won else 1
-    
-    new_elo_1 = pokemon1.elo + K_FACTOR * (result_1 - expected_1)
-    new_elo_2 = pokemon2.elo + K_FACTOR * (result_2 - expected_2)
-    
-    pokemon1.elo = int(new_elo_1)
-    pokemon2.elo = int(new_elo_2)
-    
-    db.add(pokemon1)
-    db.add(pokemon2)
+    return new_elos
+
+
+def apply_elo_updates(db: Session, votes: list[tuple[int, int, int]]) -> list[tuple[int, int]]:
+    """
+    Batch `apply_elo_update` for (pokemon1_id, pokemon2_id, winner) votes,
+    in four statements however many votes there are. Elo depends on the
+    order of the votes, so they are replayed in Python (with
+    `calculate_new_elos`, which matches the SQL) on Elos read after the
+    batch took the write lock, and the final Elos go back in one upsert.
+    Returns the new (elo1, elo2) of every vote.
+    """
+    for pokemon1_id, pokemon2_id, winner_pokemon_id in votes:
+        if winner_pokemon_id not in [pokemon1_id, pokemon2_id]:
+            raise ValueError("Winner ID must be one of the pokemon IDs")
+    if not votes:
+        return []
+
+    pokemon_ids = sorted({pokemon_id for vote in votes for pokemon_id in vote[:2]})
+    # Like _ENSURE_ROWS. run_write already holds the write lock (BEGIN
+    # IMMEDIATE), and called elsewhere this write takes it, so no other vote
+    # can move the Elos read next before this one commits
+    db.execute(insert(PopularityLeaderboard.__table__).values([
+        {"pokemon_id": pokemon_id, "elo": DEFAULT_ELO} for pokemon_id in pokemon_ids
+    ]).on_conflict_do_nothing(index_elements=["pokemon_id"]))
+    elos = dict(db.execute(
+        select(PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+        .where(PopularityLeaderboard.pokemon_id.in_(pokemon_ids))
+    ).all())
+
+    new_elos = []
+    for pokemon1_id, pokemon2_id, winner_pokemon_id in votes:
+        elos[pokemon1_id], elos[pokemon2_id] = calculate_new_elos(
+            elos[pokemon1_id], elos[pokemon2_id], winner_pokemon_id == pokemon1_id
+        )
+        new_elos.append((elos[pokemon1_id], elos[pokemon2_id]))
+
+    upsert = insert(PopularityLeaderboard.__table__).values([
+        {"pokemon_id": pokemon_id, "elo": elos[pokemon_id]} for pokemon_id in pokemon_ids
+    ])
+    rows = db.execute(
+        upsert.on_conflict_do_update(index_elements=["pokemon_id"], set_={"elo": upsert.excluded.elo})
+        .returning(PopularityLeaderboard.id, PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+    ).all()
+    db.execute(_LOG_VOTE, [_log_params(*vote) for vote in votes])
+
+    record_elo_changes(db, rows)
+    for (pokemon1_id, pokemon2_id, _), (elo1, elo2) in zip(votes, new_elos):
+        record_vote(db, pokemon1_id, pokemon2_id, elo1, elo2)
+    return new_elos
+
+
+def update_elo_and_save(db: Session, pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int):
+    apply_elo_update(db, pokemon1_id, pokemon2_id, winner_pokemon_id)
     db.commit()
+
+
+# --- Startup ---
+
+def ensure_unique_leaderboard(connection: Connection):
+    """
+    Databases created before pokemon_id became UNIQUE have a plain index and
+    possibly duplicate rows. Keeps the oldest row per Pokemon (the one votes
+    were applied to) and swaps in the unique index.
+    """
+    indexes = connection.execute(text("PRAGMA index_list(popularity_leaderboard)")).all()
+    for index in indexes:
+        if index.unique and [
+            column.name for column in connection.execute(text(f"PRAGMA index_info({index.name})"))
+        ] == ["pokemon_id"]:
+            return
+
+    connection.execute(text(
+        "DELETE FROM popularity_leaderboard WHERE id NOT IN "
+        "(SELECT MIN(id) FROM popularity_leaderboard GROUP BY pokemon_id)"
+    ))
+    connection.execute(text("DROP INDEX IF EXISTS ix_popularity_leaderboard_pokemon_id"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX ix_popularity_leaderboard_pokemon_id ON popularity_leaderboard (pokemon_id)"
+    ))
+
+
+def ensure_leaderboard_indexes(connection: Connection):
+    """Adds the rank-order index to databases created before it existed."""
+    for index in PopularityLeaderboard.__table__.indexes:
+        if index.name == "ix_popularity_leaderboard_rank":
+            index.create(connection, checkfirst=True)
+
+
+def seed_leaderboard(connection: Connection):
+    """Creates a row for every Pokemon in one bulk insert, so votes never have to."""
+    # Runs on every startup; a full leaderboard takes one read, not a write
+    seeded = connection.execute(
+        select(func.count()).select_from(PopularityLeaderboard).where(PopularityLeaderboard.pokemon_id <= LAST_POKEMON_ID)
+    ).scalar()
+    if seeded == LAST_POKEMON_ID:
+        return
+    connection.execute(
+        insert(PopularityLeaderboard).values([
+            {"pokemon_id": pokemon_id, "elo": DEFAULT_ELO}
+            for pokemon_id in range(1, LAST_POKEMON_ID + 1)
+        ]).on_conflict_do_nothing(index_elements=["pokemon_id"])
+    )
@@ -0,0 +1,150 @@
+"""
+Pre-encoded responses for heavily polled read endpoints.
+
+`GET /popularity/`, `/popularity/top/{n}` and `/pokemon-otd` return the same
+body until the data behind them changes. Each body is stored once per
+route and parameters, already serialized, gzip- and brotli-compressed,
+together with a strong ETag derived from the JSON bytes. Every entry
+remembers the version of the data it was built from (the leaderboard
+index version, bumped on every committed Elo change, or the Pokemon of the
+day). A lookup with a different version rebuilds the entry.
+
+A request whose If-None-Match matches gets 304 straight from memory. Each
+encoding has its own ETag (`"<hash>"`, `"<hash>-gzip"`, `"<hash>-br"`);
+any of them validates, since the content is the same. The ETag is a hash
+of the content, so all workers agree on it.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Optional
+import brotli
+from fastapi import Request, Response
+from ..config import RESPONSE_CACHE_MAX_ENTRIES
+
+
+# Below this size compression doesn't pay for the Content-Encoding overhead
+_MIN_COMPRESS_SIZE = 512
+
+
+class EncodedBody(NamedTuple):
+    etag: str  # without quotes
+    identity: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+
+
+def encode_body(payload: bytes) -> EncodedBody:
+    etag = hashlib.sha256(payload).hexdigest()[:32]
+    if len(payload) < _MIN_COMPRESS_SIZE:
+        return EncodedBody(etag, payload, None, None)
+    return EncodedBody(
+        etag,
+        payload,
+        gzip.compress(payload, compresslevel=6, mtime=0),
+        brotli.compress(payload, quality=5, mode=brotli.MODE_TEXT),
+    )
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, EncodedBody]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Any) -> Optional[EncodedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, version: Any, payload: bytes) -> EncodedBody:
+        body = encode_body(payload)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (version, body)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+    # --- Responses ---
+
+    def respond(self, request: Request, body: EncodedBody, cache_control: str) -> Response:
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding, content = None, body.identity
+        if body.br is not None and "br" in accepted:
+            encoding, content = "br", body.br
+        elif body.gzip is not None and "gzip" in accepted:
+            encoding, content = "gzip", body.gzip
+
+        headers = {
+            "ETag": f'"{body.etag}-{encoding}"' if encoding else f'"{body.etag}"',
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(request.headers.get("if-none-match"), body.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content, media_type="application/json", headers=headers)
+
+    def serve(self, request: Request, key: Hashable, version: Any, build: Callable[[], bytes], cache_control: str) -> Response:
+        """Responds from the entry for `key` if it was built at `version`, otherwise rebuilds it with `build()`."""
+        body = self.get(key, version)
+        if body is None:
+            body = self.put(key, version, build())
+        return self.respond(request, body, cache_control)
+
+    async def serve_async(
+        self, request: Request, key: Hashable, version: Any, build: Callable[[], Awaitable[bytes]], cache_control: str
+    ) -> Response:
+        body = self.get(key, version)
+        if body is None:
+            body = self.put(key, version, await build())
+        return self.respond(request, body, cache_control)
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        if tag == etag or tag.rsplit("-", 1)[0] == etag:
+            return True
+    return False
+
+
+response_cache = ResponseCache()
+
+
+def get_response_cache() -> ResponseCache:
+    return response_cache
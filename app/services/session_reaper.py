@@ -0,0 +1,132 @@
+"""
+Background reaper for expired comparison sessions.
+
+A ComparisonSession is normally deleted when someone votes on it, so every
+pair that is fetched and then abandoned would stay in the table forever.
+The reaper wakes up every SESSION_REAPER_INTERVAL_SECONDS and deletes
+expired rows in batches of SESSION_REAPER_BATCH_SIZE, each batch in its own
+short transaction (through `run_write`, so it queues behind request writes
+in WRITE_MODE=queue), using the index on `expires_at`.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+from functools import partial
+from typing import Callable, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from ..config import SESSION_REAPER_INTERVAL_SECONDS, SESSION_REAPER_BATCH_SIZE
+from ..models import ComparisonSession
+from .writer import run_write
+
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_session_indexes(connection):
+    """Adds the `expires_at` index to databases created before it existed."""
+    for index in ComparisonSession.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _delete_expired_batch(db: Session, now: datetime, batch_size: int) -> int:
+    """Write op: deletes up to `batch_size` sessions that expired before `now`."""
+    expired_ids = (
+        select(ComparisonSession.id)
+        .where(ComparisonSession.expires_at < now)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        delete(ComparisonSession).where(ComparisonSession.id.in_(expired_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+class SessionReaper:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval_seconds: float = SESSION_REAPER_INTERVAL_SECONDS,
+        batch_size: int = SESSION_REAPER_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval_seconds
+        self.batch_size = batch_size
+        self.runs = 0
+        self.rows_reaped = 0
+        self.table_size = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "rows_reaped": self.rows_reaped, "table_size": self.table_size}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._stopping = False
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("Session reaper run failed")
+            self._wake.wait(self.interval)
+            if self._stopping:
+                break
+
+    # --- Reaping ---
+
+    def reap(self, now: Optional[datetime] = None) -> int:
+        """Deletes every session expired before `now`, one batch per transaction."""
+        # expires_at is stored as naive UTC
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        reaped = 0
+        with self.session_factory() as db:
+            while True:
+                deleted = run_write(db, partial(_delete_expired_batch, now=now, batch_size=self.batch_size))
+                reaped += deleted
+                if deleted < self.batch_size or self._stopping:
+                    break
+            self.table_size = db.scalar(select(func.count()).select_from(ComparisonSession))
+
+        self.runs += 1
+        self.rows_reaped += reaped
+        if reaped:
+            logger.info("Reaped %d expired comparison sessions, %d left", reaped, self.table_size)
+        return reaped
+
+
+session_reaper: Optional[SessionReaper] = None
+
+
+def get_session_reaper() -> Optional[SessionReaper]:
+    return session_reaper
+
+
+def start_session_reaper(session_factory: Callable[[], Session]) -> SessionReaper:
+    global session_reaper
+    session_reaper = SessionReaper(session_factory)
+    session_reaper.start()
+    return session_reaper
+
+
+def stop_session_reaper():
+    global session_reaper
+    if session_reaper is not None:
+        session_reaper.stop()
+        session_reaper = None
@@ -0,0 +1,229 @@
+"""
+Periodic leaderboard snapshots for rank-over-time history.
+
+Every SNAPSHOT_INTERVAL_SECONDS (aligned to the interval, so hourly
+snapshots land on the hour) the whole leaderboard is stored as one
+LeaderboardSnapshot row. The row holds two packed little-endian int16
+arrays, the Elo and the rank of every Pokemon, so a snapshot is about 4 KB
+instead of 1025 rows.
+
+After each snapshot, older rows are thinned out. Hourly snapshots past
+SNAPSHOT_HOURLY_RETENTION_HOURS keep only the first of each UTC day, which
+becomes a daily snapshot. Daily snapshots past SNAPSHOT_DAILY_RETENTION_DAYS
+keep only the first of each ISO week, which becomes a weekly snapshot.
+
+`history` reads one Pokemon's values with SQLite `substr`, so only 2 bytes
+per array and snapshot leave the database.
+"""
+import logging
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from typing import Callable, Optional
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import (
+    LAST_POKEMON_ID,
+    SNAPSHOT_INTERVAL_SECONDS,
+    SNAPSHOT_HOURLY_RETENTION_HOURS,
+    SNAPSHOT_DAILY_RETENTION_DAYS,
+)
+from ..models import LeaderboardSnapshot, PopularityLeaderboard
+from .writer import run_write
+
+
+logger = logging.getLogger(__name__)
+
+_INT16 = struct.Struct("<h")
+_INT16_MIN, _INT16_MAX = -(2 ** 15), 2 ** 15 - 1
+
+
+def _pack(values: list[int]) -> bytes:
+    return struct.pack(f"<{len(values)}h", *(min(max(value, _INT16_MIN), _INT16_MAX) for value in values))
+
+
+def unpack(blob: bytes) -> list[int]:
+    return list(struct.unpack(f"<{len(blob) // 2}h", blob))
+
+
+# --- Write operations (run via run_write) ---
+
+def take_snapshot(db: Session, now: int, size: int = LAST_POKEMON_ID) -> LeaderboardSnapshot:
+    """Write op: stores the current Elo and rank of Pokemon 1..size."""
+    elos = dict(db.execute(select(PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)).all())
+    # Same order as the leaderboard index: Elo descending, then pokemon_id
+    ordered = sorted(elos, key=lambda pokemon_id: (-elos[pokemon_id], pokemon_id))
+    ranks = {pokemon_id: rank for rank, pokemon_id in enumerate(ordered, start=1)}
+
+    snapshot = LeaderboardSnapshot(
+        taken_at=now,
+        resolution="hourly",
+        elos=_pack([elos.get(pokemon_id, 0) for pokemon_id in range(1, size + 1)]),
+        # Rank 0: not on the leaderboard
+        ranks=_pack([ranks.get(pokemon_id, 0) for pokemon_id in range(1, size + 1)]),
+    )
+    db.add(snapshot)
+    return snapshot
+
+
+def _thin(rows: list[tuple[int, int]], bucket: Callable[[int], tuple], seen: set) -> tuple[list[int], list[int]]:
+    """Splits (id, taken_at) rows into the first per bucket (kept) and the rest (dropped).
+
+    Rows in a bucket that is already in `seen` are all dropped.
+    """
+    kept, dropped = [], []
+    for snapshot_id, taken_at in sorted(rows, key=lambda row: row[1]):
+        key = bucket(taken_at)
+        if key in seen:
+            dropped.append(snapshot_id)
+        else:
+            seen.add(key)
+            kept.append(snapshot_id)
+    return kept, dropped
+
+
+def _utc(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def compact_snapshots(
+    db: Session,
+    now: int,
+    hourly_retention_hours: int = SNAPSHOT_HOURLY_RETENTION_HOURS,
+    daily_retention_days: int = SNAPSHOT_DAILY_RETENTION_DAYS,
+) -> int:
+    """Write op: downsamples hourly -> daily -> weekly. Returns the number of snapshots deleted."""
+    deleted = 0
+    for resolution, next_resolution, cutoff, bucket, bucket_seconds in (
+        ("hourly", "daily", now - hourly_retention_hours * 3600, lambda ts: _utc(ts).date(), 86400),
+        ("daily", "weekly", now - daily_retention_days * 86400, lambda ts: _utc(ts).isocalendar()[:2], 7 * 86400),
+    ):
+        # Only ids and timestamps; the blobs are never read here
+        rows = db.execute(
+            select(LeaderboardSnapshot.id, LeaderboardSnapshot.taken_at)
+            .where(LeaderboardSnapshot.resolution == resolution, LeaderboardSnapshot.taken_at < cutoff)
+        ).all()
+        if not rows:
+            continue
+
+        # Run periodically, compaction sees a bucket's rows one at a time as
+        # they cross the cutoff. Once one of them was promoted, the rest of
+        # the bucket is dropped instead of promoted again.
+        promoted = db.scalars(
+            select(LeaderboardSnapshot.taken_at).where(
+                LeaderboardSnapshot.resolution == next_resolution,
+                LeaderboardSnapshot.taken_at >= min(taken_at for _, taken_at in rows) - bucket_seconds,
+            )
+        ).all()
+        kept, dropped = _thin(rows, bucket, {bucket(taken_at) for taken_at in promoted})
+        if dropped:
+            db.execute(delete(LeaderboardSnapshot).where(LeaderboardSnapshot.id.in_(dropped)))
+        if kept:
+            db.execute(
+                update(LeaderboardSnapshot).where(LeaderboardSnapshot.id.in_(kept)).values(resolution=next_resolution)
+            )
+        deleted += len(dropped)
+    return deleted
+
+
+# --- History ---
+
+def _history_query(pokemon_id: int, since: Optional[int], until: Optional[int]):
+    offset = (pokemon_id - 1) * _INT16.size + 1  # substr is 1-based
+    query = select(
+        LeaderboardSnapshot.taken_at,
+        func.substr(LeaderboardSnapshot.elos, offset, _INT16.size),
+        func.substr(LeaderboardSnapshot.ranks, offset, _INT16.size),
+    ).order_by(LeaderboardSnapshot.taken_at)
+    if since is not None:
+        query = query.where(LeaderboardSnapshot.taken_at >= since)
+    if until is not None:
+        query = query.where(LeaderboardSnapshot.taken_at <= until)
+    return query
+
+
+def _history_points(rows) -> list[dict]:
+    return [
+        {"taken_at": _utc(taken_at), "elo": _INT16.unpack(elo)[0], "rank": _INT16.unpack(rank)[0]}
+        for taken_at, elo, rank in rows
+        # Snapshots taken before LAST_POKEMON_ID grew don't cover this Pokemon
+        if len(elo) == _INT16.size and _INT16.unpack(rank)[0] > 0
+    ]
+
+
+def history(db: Session, pokemon_id: int, since: Optional[int] = None, until: Optional[int] = None) -> list[dict]:
+    return _history_points(db.execute(_history_query(pokemon_id, since, until)).all())
+
+
+async def history_async(db: AsyncSession, pokemon_id: int, since: Optional[int] = None, until: Optional[int] = None) -> list[dict]:
+    return _history_points((await db.execute(_history_query(pokemon_id, since, until))).all())
+
+
+# --- Background job ---
+
+class SnapshotJob:
+    def __init__(self, session_factory: Callable[[], Session], interval_seconds: int = SNAPSHOT_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval_seconds
+        self.snapshots = 0
+        self.compacted = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping = False
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Leaderboard snapshot failed")
+            # Sleep until the next interval boundary
+            self._wake.wait(self.interval - time.time() % self.interval)
+            if self._stopping:
+                break
+
+    def run_once(self, now: Optional[int] = None) -> bool:
+        """Takes a snapshot unless the current interval already has one, then compacts. Returns True if it took one."""
+        now = int(time.time()) if now is None else now
+        period_start = now - now % self.interval
+        with self.session_factory() as db:
+            latest = db.scalar(select(func.max(LeaderboardSnapshot.taken_at)))
+            taken = latest is None or latest < period_start
+            if taken:
+                run_write(db, partial(take_snapshot, now=now))
+                self.snapshots += 1
+            self.compacted += run_write(db, partial(compact_snapshots, now=now))
+        return taken
+
+
+snapshot_job: Optional[SnapshotJob] = None
+
+
+def start_snapshot_job(session_factory: Callable[[], Session]) -> SnapshotJob:
+    global snapshot_job
+    snapshot_job = SnapshotJob(session_factory)
+    snapshot_job.start()
+    return snapshot_job
+
+
+def stop_snapshot_job():
+    global snapshot_job
+    if snapshot_job is not None:
+        snapshot_job.stop()
+        snapshot_job = None
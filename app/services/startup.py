@@ -0,0 +1,141 @@
+"""
+Worker startup: schema checks, cache warmup and the startup-time breakdown.
+
+The lifespan in main.py runs these before the worker serves requests:
+
+- schema: `create_all` and the idempotent migrations in `_MIGRATIONS`. Once
+  they succeed, a fingerprint of the schema (the DDL of every table and
+  index, plus the migrations' names) goes into SQLite's
+  `PRAGMA user_version`. Later workers and restarts read the fingerprint and
+  skip the checks while the models and migrations are unchanged.
+  Changing a model or adding a migration changes the fingerprint.
+  `seed_leaderboard` is not gated: it runs on every start, so Pokemon added
+  by raising LAST_POKEMON_ID (or rows deleted by hand) get their row. When
+  the leaderboard is complete it costs one COUNT.
+- load: the in-memory indexes the handlers rely on.
+- warmup (STARTUP_WARMUP): opens the pool's connections and pre-encodes
+  the most polled responses, so the first requests don't pay for them.
+
+`startup` keeps how long each phase took, including `import` (importing
+app.main, which is most of a cold start). `GET /health/ready` returns the
+breakdown, and answers 503 until the lifespan has finished.
+"""
+import logging
+import time
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from ..database import Base
+from .favorite_counts import ensure_favorite_counts
+from .favorites import ensure_unique_favorites
+from .ranking import ensure_leaderboard_indexes, ensure_unique_leaderboard, seed_leaderboard
+from .session_reaper import ensure_session_indexes
+
+
+logger = logging.getLogger(__name__)
+
+# Run in this order on every database whose fingerprint is out of date
+_MIGRATIONS = (
+    ensure_unique_leaderboard,
+    ensure_leaderboard_indexes,
+    ensure_unique_favorites,
+    ensure_favorite_counts,
+    ensure_session_indexes,
+)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        # "starting", "ready" or "stopping"
+        self.state = "starting"
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def mark_ready(self):
+        self.state = "ready"
+        logger.info(
+            "Ready after %.3fs (%s)",
+            sum(self.phases.values()), ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items()),
+        )
+
+    def mark_stopping(self):
+        self.state = "stopping"
+
+    def stats(self) -> dict:
+        stats = {f"{name}_seconds": round(seconds, 4) for name, seconds in self.phases.items()}
+        stats["total_seconds"] = round(sum(self.phases.values()), 4)
+        return stats
+
+
+startup = StartupTimer()
+
+
+def get_startup() -> StartupTimer:
+    return startup
+
+
+# --- Schema ---
+
+def schema_fingerprint(engine: Engine) -> int:
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=engine.dialect)) for index in sorted(table.indexes, key=lambda index: index.name))
+    ddl.extend(f"{migration.__module__}.{migration.__qualname__}" for migration in _MIGRATIONS)
+    # user_version is a signed 32-bit integer and 0 means "never prepared"
+    return zlib.crc32("\n".join(ddl).encode()) & 0x7FFFFFFF or 1
+
+
+def prepare_schema(engine: Engine) -> bool:
+    """
+    Creates missing tables and runs the migrations, unless this schema was
+    already prepared, then seeds the leaderboard. Returns whether the
+    migrations ran.
+    """
+    fingerprint = schema_fingerprint(engine)
+    with engine.connect() as connection:
+        prepared = connection.exec_driver_sql("PRAGMA user_version").scalar() == fingerprint
+
+    if not prepared:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            for migration in _MIGRATIONS:
+                migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+        logger.info("Prepared the database schema (fingerprint %d)", fingerprint)
+
+    # Depends on LAST_POKEMON_ID and the data, not the schema
+    with engine.begin() as connection:
+        seed_leaderboard(connection)
+    return not prepared
+
+
+# --- Warmup ---
+
+def warm_pool(engine: Engine):
+    """Opens (and returns) as many connections as the pool keeps, so they are connected and configured."""
+    connections = [engine.connect() for _ in range(getattr(engine.pool, "size", lambda: 1)())]
+    for connection in connections:
+        connection.close()
+
+
+async def warm_pool_async(engine: AsyncEngine):
+    connections = [await engine.connect() for _ in range(getattr(engine.pool, "size", lambda: 1)())]
+    for connection in connections:
+        await connection.close()
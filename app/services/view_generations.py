@@ -0,0 +1,134 @@
+"""
+Reloads in-memory views after another process rewrote their table.
+
+The leaderboard index, the matchmaker and the favorite count index follow
+the database through `call_after_commit`, which only sees commits made by
+the server itself. The offline jobs (`python -m app.services.recompute`,
+`python -m app.services.favorite_counts`) rewrite those tables from a
+separate process, so they also bump the view's row in `view_generations`
+in the same transaction.
+
+The server's `GenerationWatcher` reads that table (a handful of rows) every
+VIEW_RELOAD_INTERVAL_SECONDS and reloads every view whose generation moved
+since it last looked, so a recompute reaches the running server within one
+interval, without a restart.
+"""
+import logging
+import threading
+from typing import Callable, Optional
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from ..config import VIEW_RELOAD_INTERVAL_SECONDS
+from ..models import ViewGeneration
+
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD = "leaderboard"
+FAVORITE_COUNTS = "favorite_counts"
+
+_BUMP = insert(ViewGeneration).values(name=bindparam("view_name"), generation=1)
+_BUMP = _BUMP.on_conflict_do_update(
+    index_elements=["name"], set_={"generation": ViewGeneration.generation + 1}
+)
+
+
+def bump_generation(db: Session, name: str):
+    """Part of a write op: tells other processes that `name`'s table was rewritten."""
+    db.execute(_BUMP, {"view_name": name})
+
+
+def read_generations(db: Session) -> dict[str, int]:
+    return dict(db.execute(select(ViewGeneration.name, ViewGeneration.generation)).all())
+
+
+class GenerationWatcher:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        reloaders: dict[str, Callable[[Session], None]],
+        interval_seconds: float = VIEW_RELOAD_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.reloaders = reloaders
+        self.interval = interval_seconds
+        self.reloads = 0
+        self._seen: Optional[dict[str, int]] = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def stats(self) -> dict:
+        return {"reloads": self.reloads}
+
+    # --- Lifecycle ---
+
+    def start(self):
+        # The views were just loaded, so the current generations are the baseline
+        self.check()
+        self._stopping = False
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="view-generations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            if self._stopping:
+                break
+            try:
+                self.check()
+            except Exception:
+                logger.exception("View generation check failed")
+
+    # --- Checking ---
+
+    def check(self) -> list[str]:
+        """Reloads the views whose generation changed since the last check; returns their names."""
+        with self.session_factory() as db:
+            generations = read_generations(db)
+            if self._seen is None:
+                self._seen = generations
+                return []
+            changed = [
+                name for name in self.reloaders
+                if generations.get(name, 0) != self._seen.get(name, 0)
+            ]
+            for name in changed:
+                self.reloaders[name](db)
+                # Only advance once the reload worked, so a failure is retried
+                self._seen[name] = generations[name]
+                self.reloads += 1
+                logger.info("Reloaded %s (generation %d)", name, generations[name])
+        return changed
+
+
+generation_watcher: Optional[GenerationWatcher] = None
+
+
+def get_generation_watcher() -> Optional[GenerationWatcher]:
+    return generation_watcher
+
+
+def start_generation_watcher(
+    session_factory: Callable[[], Session], reloaders: dict[str, Callable[[Session], None]]
+) -> GenerationWatcher:
+    global generation_watcher
+    generation_watcher = GenerationWatcher(session_factory, reloaders)
+    generation_watcher.start()
+    return generation_watcher
+
+
+def stop_generation_watcher():
+    global generation_watcher
+    if generation_watcher is not None:
+        generation_watcher.stop()
+        generation_watcher = None
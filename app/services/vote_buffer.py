@@ -0,0 +1,285 @@
+"""
+Buffered vote ingestion (VOTE_MODE=buffered).
+
+A vote request only validates its comparison session and appends the vote
+to an append-only log on local disk (one JSON line per vote, fsynced), then
+returns. A background flusher applies pending votes to the leaderboard in
+order, in one transaction, every VOTE_FLUSH_INTERVAL_MS or as soon as
+VOTE_FLUSH_MAX_VOTES are pending.
+
+The log is split into segments that are rotated on every flush and deleted
+once their votes are committed. Each flush also stores the highest applied
+sequence number in `vote_buffer_checkpoint`, so replaying the log after a
+crash applies every vote exactly once.
+"""
+import json
+import logging
+import os
+import threading
+from functools import partial
+from typing import Callable, Optional
+from sqlalchemy.orm import Session
+from ..config import (
+    VOTE_FLUSH_INTERVAL_MS,
+    VOTE_FLUSH_MAX_VOTES,
+    VOTE_BUFFER_MAX_SIZE,
+    VOTE_BUFFER_FSYNC,
+)
+from ..models import ComparisonSession, VoteBufferCheckpoint
+from .ranking import apply_elo_updates
+from .writer import run_write
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+
+
+class VoteBufferFull(Exception):
+    pass
+
+
+class SessionAlreadyVoted(Exception):
+    pass
+
+
+def _apply_votes(db: Session, votes: list[dict]):
+    """
+    Write op: applies buffered votes in order and consumes their sessions.
+    Votes without a session_id come from battle tokens and always apply.
+    """
+    session_ids = {vote["session_id"] for vote in votes if vote["session_id"] is not None}
+    # A session may have been consumed by an earlier flush after the vote was
+    # validated; only the first vote on a still-existing session counts.
+    live = {
+        session_id for (session_id,) in
+        db.query(ComparisonSession.session_id).filter(ComparisonSession.session_id.in_(session_ids))
+    } if session_ids else set()
+
+    applied = []
+    for vote in votes:
+        if vote["session_id"] is None or vote["session_id"] in live:
+            applied.append((vote["pokemon1_id"], vote["pokemon2_id"], vote["winner_pokemon_id"]))
+            live.discard(vote["session_id"])
+    apply_elo_updates(db, applied)
+
+    if session_ids:
+        db.query(ComparisonSession).filter(
+            ComparisonSession.session_id.in_(session_ids)
+        ).delete(synchronize_session=False)
+
+    checkpoint = db.get(VoteBufferCheckpoint, 1)
+    if checkpoint is None:
+        db.add(VoteBufferCheckpoint(id=1, last_seq=votes[-1]["seq"]))
+    else:
+        checkpoint.last_seq = votes[-1]["seq"]
+
+
+class VoteBuffer:
+    def __init__(
+        self,
+        directory: str,
+        session_factory: Callable[[], Session],
+        flush_interval_ms: int = VOTE_FLUSH_INTERVAL_MS,
+        flush_max_votes: int = VOTE_FLUSH_MAX_VOTES,
+        max_size: int = VOTE_BUFFER_MAX_SIZE,
+        fsync: bool = VOTE_BUFFER_FSYNC,
+    ):
+        self.directory = directory
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_votes = flush_max_votes
+        self.max_size = max_size
+        self.fsync = fsync
+        self.flushes = 0
+        self.flushed_votes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._pending: list[dict] = []
+        self._pending_sessions: set[str] = set()
+        # [path, last seq written to it], oldest first; the last one is open
+        self._segments: list[list] = []
+        self._file = None
+        # Whether the open segment got a vote since it was opened
+        self._file_written = False
+        self._seq = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    # --- Lifecycle ---
+
+    def open(self, replay: bool = True) -> int:
+        """Recovers the log left by a previous run. Returns the number of votes replayed."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.session_factory() as db:
+            checkpoint = db.get(VoteBufferCheckpoint, 1)
+            last_applied = checkpoint.last_seq if checkpoint else 0
+
+        paths = sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX)
+        )
+        records = [record for path in paths for record in self._read_segment(path)]
+        self._seq = max([last_applied] + [record["seq"] for record in records])
+
+        unapplied = [record for record in records if record["seq"] > last_applied]
+        if unapplied and replay:
+            self._apply(unapplied)
+            logger.info("Replayed %d buffered votes", len(unapplied))
+        elif unapplied:
+            logger.warning("Discarding %d buffered votes (replay disabled)", len(unapplied))
+
+        for path in paths:
+            os.remove(path)
+        self._rotate()
+        return len(unapplied) if replay else 0
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="vote-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    # --- Ingestion ---
+
+    def append(self, session_id: Optional[str], pokemon1_id: int, pokemon2_id: int, winner_pokemon_id: int) -> int:
+        with self._lock:
+            if session_id is not None and session_id in self._pending_sessions:
+                raise SessionAlreadyVoted(session_id)
+            if len(self._pending) >= self.max_size:
+                raise VoteBufferFull()
+
+            self._seq += 1
+            record = {
+                "seq": self._seq,
+                "session_id": session_id,
+                "pokemon1_id": pokemon1_id,
+                "pokemon2_id": pokemon2_id,
+                "winner_pokemon_id": winner_pokemon_id,
+            }
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._segments[-1][1] = self._seq
+            self._file_written = True
+
+            self._pending.append(record)
+            if session_id is not None:
+                self._pending_sessions.add(session_id)
+            should_flush = len(self._pending) >= self.flush_max_votes
+
+        if should_flush:
+            self._wake.set()
+        return record["seq"]
+
+    # --- Flushing ---
+
+    def flush(self) -> int:
+        """Applies every pending vote in one transaction. Returns the number applied."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                if not batch:
+                    return 0
+                self._pending = []
+                # An empty segment has nothing to seal. Rotating it anyway (a
+                # retry after a failed flush) would reopen the same path and
+                # list it twice, and the older entry would delete the open file.
+                if self._file is not None and self._file_written:
+                    self._rotate()
+
+            try:
+                self._apply(batch)
+            except Exception:
+                logger.exception("Vote flush failed, %d votes kept for retry", len(batch))
+                with self._lock:
+                    self._pending = batch + self._pending
+                return 0
+
+            with self._lock:
+                for record in batch:
+                    self._pending_sessions.discard(record["session_id"])
+                last_seq = batch[-1]["seq"]
+                *sealed, current = self._segments
+                kept = []
+                for segment in sealed:
+                    if segment[1] <= last_seq and segment[0] != current[0]:
+                        os.remove(segment[0])
+                    else:
+                        kept.append(segment)
+                self._segments = kept + [current]
+
+            self.flushes += 1
+            self.flushed_votes += len(batch)
+            return len(batch)
+
+    def _apply(self, votes: list[dict]):
+        with self.session_factory() as db:
+            run_write(db, partial(_apply_votes, votes=votes))
+
+    # --- Log segments ---
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._seq + 1:012d}.log")
+        self._file = open(path, "a", encoding="utf-8")
+        self._file_written = False
+        self._segments.append([path, self._seq])
+
+    @staticmethod
+    def _read_segment(path: str) -> list[dict]:
+        records = []
+        with open(path, encoding="utf-8") as segment:
+            for line in segment:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn write from a crash; nothing after it was acknowledged
+                    break
+        return records
+
+
+vote_buffer: Optional[VoteBuffer] = None
+
+
+def get_vote_buffer() -> Optional[VoteBuffer]:
+    return vote_buffer
+
+
+def start_vote_buffer(directory: str, session_factory: Callable[[], Session], replay: bool) -> VoteBuffer:
+    global vote_buffer
+    vote_buffer = VoteBuffer(directory, session_factory)
+    vote_buffer.open(replay=replay)
+    vote_buffer.start()
+    return vote_buffer
+
+
+def stop_vote_buffer():
+    global vote_buffer
+    if vote_buffer is not None:
+        vote_buffer.stop()
+        vote_buffer = None
@@ -0,0 +1,215 @@
+"""
+Single-writer queue for SQLite mutations.
+
+SQLite allows one writer at a time. With WRITE_MODE=queue every mutation is
+submitted as an operation ``op(session)`` to one background thread that owns
+one connection. The thread drains whatever is queued, runs each operation in
+its own SAVEPOINT (so a failing op only rolls back itself), commits the whole
+group once and hands each caller its result or exception. Request threads
+never contend for the write lock, so `database is locked` cannot happen
+between them.
+
+Operations must not commit themselves; they should `flush()` if they need
+generated ids. Returned ORM objects are detached after the commit, with
+their loaded attributes still readable.
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import DB_PROFILE, METRICS_ENABLED, QUERY_TRACKING_ENABLED, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_DELAY_MS
+from ..db_profiles import apply_connection_profile
+from .metrics import instrument_engine
+from .query_tracker import track_engine
+
+
+WriteOp = Callable[[Session], Any]
+
+_STOP = object()
+
+
+def create_writer_engine(database_url: str, profile: str = DB_PROFILE):
+    """One-connection engine whose transactions take the write lock up front."""
+    engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+    )
+    apply_connection_profile(engine, profile)
+
+    # pysqlite's implicit transaction handling would turn the first RELEASE
+    # SAVEPOINT into a commit; take over BEGIN so a batch is one transaction.
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class WriteQueue:
+    def __init__(self, engine, max_batch: int = WRITE_QUEUE_MAX_BATCH, max_delay_ms: float = WRITE_QUEUE_MAX_DELAY_MS):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.commits = 0
+        self.ops = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._session_factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, op: WriteOp) -> Future:
+        if not self.running:
+            raise RuntimeError("Write queue is not running")
+        future: Future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def _collect_batch(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                timeout = deadline - time.monotonic()
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        with self._session_factory() as db:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                batch, stopping = self._collect_batch(first)
+                self._run_batch(db, batch)
+        self.engine.dispose()
+
+    def _run_batch(self, db: Session, batch: list):
+        outcomes = []
+        for op, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                with db.begin_nested():
+                    outcomes.append((future, op(db), None))
+            except Exception as exc:
+                outcomes.append((future, None, exc))
+
+        try:
+            db.commit()
+            self.commits += 1
+        except Exception as exc:
+            db.rollback()
+            outcomes = [(future, None, error or exc) for future, _, error in outcomes]
+        db.expunge_all()
+        self.ops += len(outcomes)
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+writer: Optional[WriteQueue] = None
+
+
+def start_writer(database_url: str) -> WriteQueue:
+    global writer
+    engine = create_writer_engine(database_url)
+    if METRICS_ENABLED:
+        instrument_engine(engine, "writer")
+    if QUERY_TRACKING_ENABLED:
+        track_engine(engine)
+    writer = WriteQueue(engine)
+    writer.start()
+    return writer
+
+
+def stop_writer():
+    global writer
+    if writer is not None:
+        writer.stop()
+        writer = None
+
+
+def _begin_immediate(db: Session):
+    """
+    Direct mode: takes the write lock before `op` reads anything, like the
+    writer engine does. pysqlite only opens a transaction at the first
+    INSERT/UPDATE/DELETE, so an op's reads (the sessions a batch vote checks)
+    would otherwise not be isolated from a concurrent op writing the same rows.
+    Issued on the driver connection, like pysqlite's own BEGIN.
+    """
+    connection = db.connection().connection
+    if not connection.driver_connection.in_transaction:
+        cursor = connection.dbapi_connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+        finally:
+            cursor.close()
+
+
+def _immediate(op: WriteOp) -> WriteOp:
+    def run(db: Session):
+        _begin_immediate(db)
+        return op(db)
+    return run
+
+
+def run_write(db: Session, op: WriteOp):
+    """Runs `op` on the writer thread when it is running, otherwise on `db` followed by a commit."""
+    if writer is not None and writer.running:
+        return writer.submit(op).result()
+    try:
+        result = _immediate(op)(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+async def run_write_async(db: AsyncSession, op: WriteOp):
+    """Async counterpart of `run_write`; `op` still receives a sync Session."""
+    if writer is not None and writer.running:
+        return await asyncio.wrap_future(writer.submit(op))
+    try:
+        result = await db.run_sync(_immediate(op))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return result
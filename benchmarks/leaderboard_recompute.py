@@ -0,0 +1,70 @@
+"""
+Leaderboard recompute throughput: vote log load, Elo replay and Bradley-Terry fit.
+
+Usage: python -m benchmarks.leaderboard_recompute [--votes 10000000] [--db-votes 1000000]
+
+Replay and fit run on --votes synthetic votes over LAST_POKEMON_ID Pokemon.
+Loading is measured separately by writing --db-votes rows to a fresh SQLite
+`votes` table and reading them back with `load_votes`.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine
+from app.config import LAST_POKEMON_ID
+from app.database import Base
+from app.services.recompute import _VOTE_DTYPE, fit_bradley_terry, load_votes, replay_elo
+
+
+def _synthetic_votes(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    strength = rng.normal(0, 200, LAST_POKEMON_ID + 1)
+    votes = np.empty(count, dtype=_VOTE_DTYPE)
+    votes["pokemon1_id"] = rng.integers(1, LAST_POKEMON_ID + 1, count)
+    votes["pokemon2_id"] = (votes["pokemon1_id"] + rng.integers(1, LAST_POKEMON_ID, count) - 1) % LAST_POKEMON_ID + 1
+    gap = strength[votes["pokemon2_id"]] - strength[votes["pokemon1_id"]]
+    votes["pokemon1_won"] = rng.random(count) < 1 / (1 + 10 ** (gap / 400))
+    return votes
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def run_load(votes: np.ndarray) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "INSERT INTO votes (pokemon1_id, pokemon2_id, pokemon1_won, created_at) VALUES (?, ?, ?, 0)",
+                votes.tolist(),
+            )
+        with engine.connect() as connection:
+            elapsed = _timed(load_votes, connection)
+        engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--votes", type=int, default=10_000_000)
+    parser.add_argument("--db-votes", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    votes = _synthetic_votes(args.votes)
+    print(f"{'step':<18} {'votes':>11} {'seconds':>8} {'Mvotes/s':>9}")
+    for name, count, seconds in [
+        ("load (sqlite)", args.db_votes, run_load(votes[:args.db_votes])),
+        ("elo replay", args.votes, _timed(replay_elo, votes)),
+        ("bradley-terry", args.votes, _timed(fit_bradley_terry, votes)),
+    ]:
+        print(f"{name:<18} {count:>11} {seconds:>8.2f} {count / seconds / 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
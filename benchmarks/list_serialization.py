@@ -0,0 +1,79 @@
+"""
+List serialization: ORM + Pydantic validation against Core rows + orjson.
+
+Usage: python -m benchmarks.list_serialization [--rows 1000 100000] [--repeat 5]
+
+Each size fills a fresh SQLite `popularity_leaderboard` table and times
+building the `GET /popularity/` body both ways, query included. The old
+path loads ORM instances, validates them through the response model with
+`from_attributes=True`, and encodes with json.dumps, which is what FastAPI
+did for the route. The fast path selects row tuples and encodes them with
+orjson (services/fast_json.py). The best of --repeat runs is reported.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app.database import Base
+from app.models import PopularityLeaderboard
+from app.schemas import PopularityLeaderboard as PopularityLeaderboardSchema
+from app.services.fast_json import rows_json
+
+_LIST = TypeAdapter(List[PopularityLeaderboardSchema])
+_COLUMNS = (PopularityLeaderboard.id, PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)
+_FIELDS = ("id", "pokemon_id", "elo")
+
+
+def orm_path(session: Session) -> bytes:
+    rows = session.query(PopularityLeaderboard).all()
+    content = _LIST.dump_python(_LIST.validate_python(rows, from_attributes=True), mode="json")
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def fast_path(session: Session) -> bytes:
+    return rows_json(session.execute(select(*_COLUMNS)).all(), _FIELDS)
+
+
+def _best(fn, session: Session, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        session.expunge_all()
+        start = time.perf_counter()
+        fn(session)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'path':<6} {'ms':>9} {'rows/s':>12} {'speedup':>8}")
+    for count in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO popularity_leaderboard (id, pokemon_id, elo) VALUES (?, ?, ?)",
+                    [(i, i, 1000 + i % 500) for i in range(1, count + 1)],
+                )
+            with Session(engine) as session:
+                assert json.loads(orm_path(session)) == json.loads(fast_path(session))
+                orm = _best(orm_path, session, args.repeat)
+                fast = _best(fast_path, session, args.repeat)
+            engine.dispose()
+
+        print(f"{count:>8} {'orm':<6} {orm * 1000:>9.2f} {count / orm:>12,.0f} {'':>8}")
+        print(f"{count:>8} {'fast':<6} {fast * 1000:>9.2f} {count / fast:>12,.0f} {orm / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Leaderboard latency during a login storm, inline bcrypt vs the bounded hashing pool.
+
+Usage: python -m benchmarks.login_storm [--seconds 10] [--logins 64] [--readers 4] [--rounds 12]
+
+The app is served by uvicorn in this process (sync handlers) on a fresh
+temporary database. --logins threads post to /auth/token in a loop while
+--readers threads poll /popularity/top/10. The run is repeated with hashing
+inline on the request threadpool (PASSWORD_HASH_WORKERS=0, the old
+behaviour) and with the dedicated pool. The output shows leaderboard
+throughput and latency, and how many logins succeeded or got 503.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+import httpx
+import uvicorn
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE, BCRYPT_ROUNDS
+from app.database import Base, get_db
+from app.main import app
+from app.services import password_hasher as password_hasher_module
+from app.services.password_hasher import PasswordHasher
+
+
+USERS = 16
+
+
+def _serve(session_factory) -> tuple[uvicorn.Server, threading.Thread, str]:
+    def override_get_db():
+        with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}/api"
+
+
+def run(hasher: PasswordHasher, seconds: float, logins: int, readers: int) -> dict:
+    password_hasher_module.password_hasher = hasher
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+        server, thread, base_url = _serve(sessionmaker(bind=engine, autoflush=False))
+
+        with httpx.Client(base_url=base_url) as client:
+            for i in range(USERS):
+                client.post("/auth/register", json={"username": f"user{i}", "email": f"user{i}@example.com", "password": "password123"})
+
+        deadline = time.perf_counter() + seconds
+        latencies: list[float] = []
+        login_status: dict[int, int] = {}
+        lock = threading.Lock()
+
+        def login_loop(i: int):
+            with httpx.Client(base_url=base_url, timeout=60) as client:
+                while time.perf_counter() < deadline:
+                    response = client.post("/auth/token", data={"username": f"user{i % USERS}", "password": "password123"})
+                    with lock:
+                        login_status[response.status_code] = login_status.get(response.status_code, 0) + 1
+                    if response.status_code == 503:
+                        time.sleep(float(response.headers.get("Retry-After", "1")))
+
+        def read_loop():
+            with httpx.Client(base_url=base_url, timeout=60) as client:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    client.get("/popularity/top/10").raise_for_status()
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(logins)]
+        threads += [threading.Thread(target=read_loop) for _ in range(readers)]
+        for worker in threads:
+            worker.start()
+        for worker in threads:
+            worker.join()
+
+        server.should_exit = True
+        thread.join()
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "reads_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan"),
+        "logins_ok": login_status.get(200, 0),
+        "logins_503": login_status.get(503, 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--logins", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent leaderboard clients")
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS, help="bcrypt cost")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS or 1, help="hashing threads for the pool run")
+    parser.add_argument("--queue-size", type=int, default=PASSWORD_HASH_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    modes = {
+        "inline": PasswordHasher(workers=0, rounds=args.rounds),
+        "pool": PasswordHasher(workers=args.workers, queue_size=args.queue_size, rounds=args.rounds),
+    }
+    print(f"{'hashing':<8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>9} {'logins ok':>10} {'logins 503':>11}")
+    for name, hasher in modes.items():
+        result = run(hasher, args.seconds, args.logins, args.readers)
+        hasher.shutdown()
+        print(
+            f"{name:<8} {result['reads_per_second']:>9.0f} {result['p50_ms']:>8.1f} {result['p99_ms']:>9.1f} "
+            f"{result['logins_ok']:>10} {result['logins_503']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
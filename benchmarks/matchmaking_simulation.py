@@ -0,0 +1,83 @@
+"""
+Votes each matchmaking strategy needs to recover a hidden ranking.
+
+Usage: python -m benchmarks.matchmaking_simulation [--pokemon 1025] [--target 0.9] [--seeds 3]
+
+Every Pokemon gets a hidden "true" rating. Simulated voters pick the winner
+of each pair with the Elo win probability of the true ratings, and votes are
+applied with the production Elo formula. Every --check-every votes, the
+Spearman rank correlation between the learned Elo and the true ratings is
+measured. The output is the number of votes until it first reaches --target,
+averaged over --seeds runs. No database is involved.
+"""
+import argparse
+import random
+from app.services.matchmaking import MatchmakingEngine, STRATEGIES
+from app.services.ranking import calculate_new_elos, DEFAULT_ELO
+
+
+def _ranks(values: list[float]) -> list[float]:
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        # Ties share the average of their positions
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2
+        i = j + 1
+    return ranks
+
+
+def spearman(a: list[float], b: list[float]) -> float:
+    ra, rb = _ranks(a), _ranks(b)
+    mean = (len(a) - 1) / 2
+    cov = sum((x - mean) * (y - mean) for x, y in zip(ra, rb))
+    var_a = sum((x - mean) ** 2 for x in ra)
+    var_b = sum((y - mean) ** 2 for y in rb)
+    return cov / (var_a * var_b) ** 0.5 if var_a and var_b else 0.0
+
+
+def votes_to_target(strategy: str, pokemon: int, target: float, max_votes: int, check_every: int, seed: int) -> int | None:
+    rng = random.Random(seed)
+    true_ratings = [rng.gauss(DEFAULT_ELO, 200) for _ in range(pokemon)]
+    engine = MatchmakingEngine(pokemon, strategy, default_elo=DEFAULT_ELO, rng=random.Random(seed + 1))
+
+    for vote in range(1, max_votes + 1):
+        pokemon1_id, pokemon2_id = engine.pair()
+        true1, true2 = true_ratings[pokemon1_id - 1], true_ratings[pokemon2_id - 1]
+        pokemon1_won = rng.random() < 1 / (1 + 10 ** ((true2 - true1) / 400))
+        elo1, elo2 = calculate_new_elos(engine.elos[pokemon1_id], engine.elos[pokemon2_id], pokemon1_won)
+        engine.record_vote(pokemon1_id, pokemon2_id, elo1, elo2)
+
+        if vote % check_every == 0 and spearman(list(engine.elos[1:]), true_ratings) >= target:
+            return vote
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pokemon", type=int, default=1025)
+    parser.add_argument("--target", type=float, default=0.9, help="Spearman correlation to reach")
+    parser.add_argument("--max-votes", type=int, default=200_000)
+    parser.add_argument("--check-every", type=int, default=1000)
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=STRATEGIES)
+    args = parser.parse_args()
+
+    print(f"{'strategy':<12} {'votes to target':>16}")
+    for strategy in args.strategies:
+        results = [
+            votes_to_target(strategy, args.pokemon, args.target, args.max_votes, args.check_every, seed)
+            for seed in range(args.seeds)
+        ]
+        if None in results:
+            print(f"{strategy:<12} {'> ' + str(args.max_votes):>16}")
+        else:
+            print(f"{strategy:<12} {sum(results) / len(results):>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
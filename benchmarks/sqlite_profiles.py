@@ -0,0 +1,55 @@
+"""
+Commits per second for each SQLite connection profile.
+
+Usage: python -m benchmarks.sqlite_profiles [--commits 2000]
+
+Each profile gets a fresh file-backed database and performs one small
+Elo-style UPDATE per commit, which is what the vote path does. The
+"default" row is SQLite's stock rollback journal with no PRAGMAs, i.e.
+the behaviour before connection profiles existed.
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+from app.db_profiles import PROFILES, apply_connection_profile
+
+
+def run_profile(profile: str | None, commits: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        if profile is not None:
+            apply_connection_profile(engine, profile)
+
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE leaderboard (pokemon_id INTEGER PRIMARY KEY, elo INTEGER)"))
+            connection.execute(text("INSERT INTO leaderboard VALUES (1, 1000), (2, 1000)"))
+
+        with engine.connect() as connection:
+            start = time.perf_counter()
+            for i in range(commits):
+                connection.execute(
+                    text("UPDATE leaderboard SET elo = elo + :delta WHERE pokemon_id = :id"),
+                    {"delta": 1 if i % 2 else -1, "id": 1 + i % 2},
+                )
+                connection.commit()
+            elapsed = time.perf_counter() - start
+
+        engine.dispose()
+    return commits / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'commits/s':>12}")
+    for profile in [None, *PROFILES]:
+        rate = run_profile(profile, args.commits)
+        print(f"{profile or 'default':<12} {rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
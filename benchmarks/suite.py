@@ -0,0 +1,320 @@
+"""
+Hot-path micro-benchmarks for ranking, auth and Pokemon of the day, with a regression check.
+
+Usage: python -m benchmarks.suite [--iterations 300] [--repeat 3] [--only potd] [--output results.json]
+                                  [--baseline benchmarks/baseline.json] [--threshold 0.5] [--save-baseline]
+
+Every case runs in this process against a fresh file-backed SQLite
+database using the configured DB_PROFILE. The database is seeded with the
+leaderboard, the Pokemon of the day schedule and one user. Service cases
+call the functions directly. Router cases send requests to the app through
+httpx's ASGI transport on one event loop, so routing, dependencies and
+serialization are included but no socket is.
+
+"cold" cases empty the cache in front of the path before every call (auth
+cache, Pokemon of the day memo, response cache), outside the timed region.
+"warm" cases run with those caches populated.
+
+Each case reports ops/s and p50/p99 latency, from the fastest of --repeat
+runs. With --baseline (by default benchmarks/baseline.json, if it exists),
+each p50 is compared to the baseline's, scaled by a pure-Python calibration
+workload timed next to the case. A case more than --threshold slower is
+measured again (--confirm times). If it is still slower, it is reported as
+a regression and the exit status is 1. Baselines depend on the machine, so
+record one with --save-baseline on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from typing import Callable, NamedTuple, Optional
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.auth import create_access_token, get_current_user
+from app.config import DB_PROFILE, LAST_POKEMON_ID
+from app.database import Base, get_db
+from app.db_profiles import apply_connection_profile
+from app.main import app
+from app.services.auth_cache import auth_cache
+from app.services.leaderboard_index import leaderboard_index
+from app.services.matchmaking import matchmaker
+from app.services.pokemon_otd import (
+    current_pokemon_of_the_day, get_or_create_pokemon_of_the_day, potd_cache, refresh_schedule, today,
+)
+from app.services.ranking import ensure_leaderboard_indexes, seed_leaderboard, update_elo_and_save
+from app.services.response_cache import response_cache
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[object], object]
+    # Called before every timed call, untimed; its result is passed to `run`
+    prepare: Optional[Callable[[], object]] = None
+
+
+# Calls without `prepare` are timed in batches of at least this long, so
+# sub-microsecond paths aren't lost in timer resolution
+_MIN_SAMPLE_SECONDS = 50e-6
+
+
+# --- Setup ---
+
+def _seed(tmp: str):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", connect_args={"check_same_thread": False})
+    apply_connection_profile(engine, DB_PROFILE)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        ensure_leaderboard_indexes(connection)
+        seed_leaderboard(connection)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    with session_factory() as db:
+        user = models.User(username="bench", email="bench@example.com", hashed_password="unused")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        leaderboard_index.reload(db)
+        matchmaker.reload(db)
+        refresh_schedule(db)
+    return engine, session_factory, user_id
+
+
+class _Client:
+    """Blocking calls into the app on one event loop. Unlike TestClient, it doesn't run the app's lifespan."""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench/api")
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        return self._loop.run_until_complete(self._client.request(method, path, **kwargs))
+
+    def get(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self._loop.run_until_complete(self._client.aclose())
+        self._loop.close()
+
+
+def _cases(db, client: _Client, token: str) -> list[Case]:
+    rng = random.Random(0)
+    headers = {"Authorization": f"Bearer {token}"}
+    potd_day = today()
+    # Days long before the stored schedule, one per call, so each call extends
+    # it. In the past, so the rows they add don't slow down `potd_cache.load`
+    cold_days = (potd_day - timedelta(days=365 * 10 + offset) for offset in range(0, 500_000, 200))
+
+    def random_pair():
+        first, second = rng.sample(range(1, LAST_POKEMON_ID + 1), 2)
+        return first, second, rng.choice((first, second))
+
+    def forget_potd():
+        potd_cache.load(db)
+        response_cache.clear()
+
+    def battle_session():
+        return client.get("/popularity/pair-to-battle").json()
+
+    def get(path: str, **kwargs):
+        return lambda _: client.get(path, **kwargs).raise_for_status()
+
+    return [
+        # Services
+        Case("ranking.update_elo_and_save", lambda vote: update_elo_and_save(db, *vote), random_pair),
+        Case("potd.get_or_create[warm]", lambda _: get_or_create_pokemon_of_the_day(db, potd_day)),
+        Case("potd.get_or_create[cold]", lambda day: get_or_create_pokemon_of_the_day(db, day), lambda: next(cold_days)),
+        Case("potd.current[warm]", lambda _: current_pokemon_of_the_day(db)),
+        Case("potd.current[cold]", lambda _: current_pokemon_of_the_day(db), lambda: potd_cache.load(db)),
+        Case("auth.create_access_token", lambda _: create_access_token({"sub": "bench", "id": 1}, timedelta(minutes=20))),
+        Case("auth.get_current_user[warm]", lambda _: get_current_user(token, db)),
+        Case("auth.get_current_user[cold]", lambda _: get_current_user(token, db), auth_cache.clear),
+        # Routers
+        Case("GET /popularity/top/10[warm]", get("/popularity/top/10")),
+        Case("GET /popularity/top/10[cold]", get("/popularity/top/10"), response_cache.clear),
+        Case("GET /popularity/[warm]", get("/popularity/")),
+        Case("GET /popularity/[cold]", get("/popularity/"), response_cache.clear),
+        Case("GET /pokemon-otd[warm]", get("/pokemon-otd")),
+        Case("GET /pokemon-otd[cold]", get("/pokemon-otd"), forget_potd),
+        Case("GET /users/current-user[warm]", get("/users/current-user", headers=headers)),
+        Case("GET /users/current-user[cold]", get("/users/current-user", headers=headers), auth_cache.clear),
+        Case(
+            "POST /popularity/vote",
+            lambda pair: client.post(f"/popularity/vote/{pair['session_id']}/{pair['pokemon1_id']}").raise_for_status(),
+            battle_session,
+        ),
+    ]
+
+
+# --- Measurement ---
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _batch_size(case: Case, warmup: int) -> int:
+    start = time.perf_counter()
+    for _ in range(warmup):
+        case.run(None)
+    per_call = (time.perf_counter() - start) / max(warmup, 1)
+    return max(1, int(_MIN_SAMPLE_SECONDS / max(per_call, 1e-9)))
+
+
+def measure(case: Case, iterations: int, warmup: int) -> dict:
+    gc.collect()
+    if case.prepare is None:
+        batch = _batch_size(case, warmup)
+        prepare = lambda: None
+    else:
+        batch, prepare = 1, case.prepare
+        for _ in range(warmup):
+            case.run(prepare())
+
+    timings = []
+    for _ in range(iterations):
+        argument = prepare()
+        start = time.perf_counter()
+        for _ in range(batch):
+            case.run(argument)
+        timings.append((time.perf_counter() - start) / batch)
+    timings.sort()
+    return {
+        "iterations": iterations * batch,
+        "ops_per_sec": len(timings) / sum(timings),
+        "p50_ms": _percentile(timings, 0.50) * 1000,
+        "p99_ms": _percentile(timings, 0.99) * 1000,
+    }
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Milliseconds for a fixed pure-Python workload: how fast this machine is right now."""
+    def workload():
+        return sorted(str(i * 7919 % 10007) for i in range(20_000))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> dict[str, str]:
+    """
+    Cases whose p50 latency grew by more than `threshold` (a fraction) over
+    `baseline`. The median barely moves with GC pauses and scheduler noise,
+    which easily swing ops/s (a mean) by 30% between runs. Baseline latencies
+    are first scaled by how much slower or faster the calibration workload
+    ran, so a busy or throttled machine isn't reported as a regression.
+    """
+    regressions = {}
+    for name, result in results["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            continue
+        speed = result["calibration_ms"] / before["calibration_ms"]
+        change = result["p50_ms"] / (before["p50_ms"] * speed) - 1
+        if change > threshold:
+            regressions[name] = f"{name}: p50 {before['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms ({change:+.0%})"
+    return regressions
+
+
+def best_of(case: Case, iterations: int, warmup: int, repeat: int) -> dict:
+    """The run with the lowest p50 out of `repeat`; like timeit, noise only ever makes a run slower."""
+    return min((measure(case, iterations, warmup) for _ in range(max(repeat, 1))), key=lambda result: result["p50_ms"])
+
+
+def run(iterations: int, warmup: int, repeat: int = 3, selected: Callable[[str], bool] = lambda name: True) -> dict:
+    results = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "db_profile": DB_PROFILE},
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory, user_id = _seed(tmp)
+
+        def override_get_db():
+            with session_factory() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        client = _Client()
+        token = create_access_token({"sub": "bench", "id": user_id}, timedelta(hours=1))
+        try:
+            with session_factory() as db:
+                for case in _cases(db, client, token):
+                    if not selected(case.name):
+                        continue
+                    calibration_ms = calibrate()
+                    result = best_of(case, iterations, warmup, repeat)
+                    result["calibration_ms"] = min(calibration_ms, calibrate())
+                    results["cases"][case.name] = result
+                    print(f"{case.name:<34} {result['ops_per_sec']:>12,.0f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+        finally:
+            client.close()
+            app.dependency_overrides.clear()
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is kept")
+    parser.add_argument("--only", help="run the cases whose name contains this")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.5, help="allowed p50 increase, as a fraction")
+    parser.add_argument("--confirm", type=int, default=2, help="times a regressed case is measured again before failing")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args()
+
+    print(f"{'case':<34} {'ops/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+    results = run(args.iterations, args.warmup, args.repeat, lambda name: not args.only or args.only in name)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for _ in range(args.confirm):
+            if not regressions:
+                break
+            # Noise only ever slows a case down, so keep its best measurement
+            print(f"\nmeasuring {len(regressions)} case(s) again")
+            again = run(args.iterations, args.warmup, args.repeat, regressions.__contains__)
+            for name, result in again["cases"].items():
+                if result["p50_ms"] < results["cases"][name]["p50_ms"]:
+                    results["cases"][name] = result
+            regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for line in regressions.values():
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regression over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Votes per second: direct vote path vs buffered ingestion.
+
+Usage: python -m benchmarks.vote_ingestion [--votes 2000] [--no-fsync]
+
+Both paths run the router's own vote logic against a fresh file-backed
+database using the configured DB_PROFILE. "direct" applies and commits
+every vote in the request. "buffered" only validates and appends to the
+vote log; its time includes the final flush, so it measures sustained
+throughput rather than just request latency.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.config import DB_PROFILE
+from app.database import Base
+from app.db_profiles import apply_connection_profile
+from app.models import ComparisonSession
+from app.routers.popularity import _consume_vote, _buffer_vote
+from app.services import vote_buffer as vote_buffer_module
+from app.services.vote_buffer import VoteBuffer
+from app.services.writer import run_write
+
+
+def _setup(tmp: str, votes: int):
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    apply_connection_profile(engine, DB_PROFILE)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
+    with session_factory() as db:
+        db.add_all(
+            ComparisonSession(session_id=f"s{i}", pokemon1_id=1 + i % 100, pokemon2_id=101 + i % 100, expires_at=expires_at)
+            for i in range(votes)
+        )
+        db.commit()
+    return engine, session_factory
+
+
+def run_direct(votes: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory = _setup(tmp, votes)
+        start = time.perf_counter()
+        for i in range(votes):
+            with session_factory() as db:
+                run_write(db, partial(_consume_vote, session_id=f"s{i}", winner_pokemon_id=1 + i % 100))
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+    return votes / elapsed
+
+
+def run_buffered(votes: int, fsync: bool) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, session_factory = _setup(tmp, votes)
+        buffer = VoteBuffer(os.path.join(tmp, "buffer"), session_factory, max_size=votes, fsync=fsync)
+        buffer.open()
+        buffer.start()
+        vote_buffer_module.vote_buffer = buffer
+
+        start = time.perf_counter()
+        for i in range(votes):
+            with session_factory() as db:
+                session = db.query(ComparisonSession).filter_by(session_id=f"s{i}").first()
+                _buffer_vote(session, f"s{i}", 1 + i % 100)
+        buffer.stop()
+        elapsed = time.perf_counter() - start
+
+        vote_buffer_module.vote_buffer = None
+        engine.dispose()
+    return votes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--votes", type=int, default=2000)
+    parser.add_argument("--no-fsync", action="store_true", help="skip fsync on every buffered append")
+    args = parser.parse_args()
+
+    print(f"{'path':<10} {'votes/s':>10}")
+    print(f"{'direct':<10} {run_direct(args.votes):>10.0f}")
+    print(f"{'buffered':<10} {run_buffered(args.votes, fsync=not args.no_fsync):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
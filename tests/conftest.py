@@ -1,21 +1,76 @@
 import sys
 import os
+import tempfile
+from contextlib import contextmanager
 import pytest
+import pytest_asyncio
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from fastapi.testclient import TestClient
 
 # Add the project root directory to the path to import modules from app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import Base, get_db
+# The lifespan (schema checks, index loads) runs for every TestClient; keep
+# it off the real data/pokeparty.db
+os.environ.setdefault("DB_DIR", tempfile.mkdtemp())
+# No background jobs against the app database while the suite runs
+os.environ.setdefault("SESSION_REAPER_INTERVAL_SECONDS", "0")
+os.environ.setdefault("SNAPSHOT_INTERVAL_SECONDS", "0")
+# Minimum bcrypt cost; the suite hashes a password for almost every test
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from app.database import Base, get_db, get_async_db
+from app.db_profiles import apply_connection_profile
+from app.config import DB_MODE, DB_PROFILE
 from app.main import app
+from app.services.leaderboard_index import leaderboard_index
+from app.services.auth_cache import auth_cache
+from app.services.favorites import favorites_cache
+from app.services.favorite_counts import favorite_count_index
+from app.services.pokemon_otd import potd_cache
+from app.services.query_tracker import collect_request_trackers, track_engine
+
+# Run the suite against the async handlers with `DB_MODE=async pytest`
+ASYNC_DB = DB_MODE == "async"
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+if ASYNC_DB:
+    # The sync fixtures and the async app need to see the same data, so both
+    # engines point at one temporary file instead of a private :memory: DB.
+    _db_path = os.path.join(tempfile.mkdtemp(), "test.db")
+    SQLALCHEMY_DATABASE_URL = f"sqlite:///{_db_path}"
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{_db_path}", poolclass=NullPool)
+    apply_connection_profile(async_engine.sync_engine, DB_PROFILE)
+    track_engine(async_engine.sync_engine)
+    TestingAsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+else:
+    SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+apply_connection_profile(engine, DB_PROFILE)
+track_engine(engine)
+
+
+if not ASYNC_DB:
+    # pysqlite only emits BEGIN before DML, so the outermost SAVEPOINT would act as
+    # the real transaction and its RELEASE would commit. Emit BEGIN ourselves so
+    # the per-test outer transaction actually rolls everything back. The async
+    # file database commits for real, so it keeps the driver default.
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -29,30 +84,19 @@ def setup_db():
     Base.metadata.drop_all(bind=engine)
 
 
-@pytest.fixture(scope="function")
-def db_session(setup_db):
+def _transactional_session():
     """
-    Provides a session for each test within a transaction.
+    Provides a session within a transaction.
     Rolls back after the test, so the database returns to a clean state
     without the need to physically delete tables.
     """
     connection = engine.connect()
     transaction = connection.begin()
     
-    session = TestingSessionLocal(bind=connection)
-    
-    # Begin a nested transaction (SAVEPOINT).
-    # This ensures that session.commit() in tests only commits to this savepoint,
-    # not the outer transaction.
-    session.begin_nested()
-
-    # If the test calls session.commit(), we need to start a new nested transaction
-    # so that subsequent operations are also in a savepoint.
-    @event.listens_for(session, "after_transaction_end")
-    def restart_savepoint(session, transaction):
-        if transaction.nested and not transaction._parent.nested:
-            session.expire_all()
-            session.begin_nested()
+    # Join the outer transaction via SAVEPOINTs. session.commit() in tests (and
+    # session.rollback() in handlers) only act on the savepoint, never on the
+    # outer transaction, and a new savepoint is started automatically.
+    session = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     
     yield session
     
@@ -61,6 +105,29 @@ def db_session(setup_db):
     connection.close()
 
 
+def _committing_session():
+    """
+    Provides a session whose commits are visible to the async engine.
+    Tables are emptied after the test instead of rolling back.
+    """
+    session = TestingSessionLocal()
+
+    yield session
+
+    session.close()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture(scope="function")
+def db_session(setup_db):
+    if ASYNC_DB:
+        yield from _committing_session()
+    else:
+        yield from _transactional_session()
+
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """
@@ -71,8 +138,69 @@ def client(db_session):
             yield db_session
         finally:
             pass
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
     
     app.dependency_overrides[get_db] = override_get_db
+    if ASYNC_DB:
+        app.dependency_overrides[get_async_db] = override_get_async_db
     with TestClient(app) as c:
+        # Startup loaded the index from the app database; point it at the test one
+        leaderboard_index.reload(db_session)
+        favorite_count_index.reload(db_session)
+        potd_cache.load(db_session)
+        # User ids are reused once a test rolls back
+        auth_cache.clear()
+        favorites_cache.clear()
         yield c
     app.dependency_overrides.clear()
+
+
+@pytest_asyncio.fixture(scope="function")
+async def async_db_session():
+    """
+    Provides an AsyncSession on a private in-memory database for testing
+    the async service functions directly.
+    """
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    async with async_sessionmaker(bind=engine, expire_on_commit=False)() as session:
+        yield session
+
+    await engine.dispose()
+
+
+# Emitted by the per-test savepoints of the sync suite, not by the handlers
+_SAVEPOINT_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def _query_count(tracker) -> int:
+    return sum(count for statement, count in tracker.statements.items() if not statement.startswith(_SAVEPOINT_STATEMENTS))
+
+
+@pytest.fixture
+def max_queries():
+    """
+    Query budget per request: inside `with max_queries(n):` every request
+    must run at most `n` SQL statements, or the test fails with the list of
+    statements. The block yields the finished requests' QueryTrackers.
+    """
+    @contextmanager
+    def budget(limit: int):
+        with collect_request_trackers() as trackers:
+            yield trackers
+        assert trackers, "no request finished inside max_queries()"
+        for tracker in trackers:
+            assert _query_count(tracker) <= limit, (
+                f"{tracker.label} ran {_query_count(tracker)} queries, budget is {limit}:\n{tracker.describe()}"
+            )
+
+    return budget
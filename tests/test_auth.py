@@ -1,4 +1,8 @@
+import threading
 from fastapi import status
+from app.models import User
+from app.services import password_hasher as password_hasher_module
+from app.services.password_hasher import PasswordHasher
 
 def test_register_user(client):
     response = client.post(
@@ -49,3 +53,50 @@ def test_login_wrong_password(client):
         data={"username": "testuser", "password": "wrongpassword"}
     )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+def test_login_upgrades_outdated_hash(client, db_session, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(password_hasher_module, "password_hasher", PasswordHasher(rounds=5))
+    client.post(
+        "/auth/register",
+        json={"username": "testuser", "email": "test@example.com", "password": "password123"}
+    )
+    monkeypatch.setattr(password_hasher_module, "password_hasher", PasswordHasher(rounds=4))
+
+    # Act
+    response = client.post("/auth/token", data={"username": "testuser", "password": "password123"})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    db_session.expire_all()
+    hashed_password = db_session.query(User).filter_by(username="testuser").one().hashed_password
+    assert hashed_password.startswith("$2b$04$")
+    # The upgraded hash still logs in
+    response = client.post("/auth/token", data={"username": "testuser", "password": "password123"})
+    assert response.status_code == status.HTTP_200_OK
+
+def test_login_is_rejected_when_hasher_is_saturated(client, monkeypatch):
+    # Arrange
+    client.post(
+        "/auth/register",
+        json={"username": "testuser", "email": "test@example.com", "password": "password123"}
+    )
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    monkeypatch.setattr(password_hasher_module, "password_hasher", hasher)
+    release = threading.Event()
+    blocker = hasher._submit(release.wait)
+
+    # Act
+    try:
+        response = client.post("/auth/token", data={"username": "testuser", "password": "password123"})
+    finally:
+        release.set()
+        blocker.result()
+
+    # Assert
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+    assert hasher.stats()["rejected"] == 1
+    response = client.post("/auth/token", data={"username": "testuser", "password": "password123"})
+    assert response.status_code == status.HTTP_200_OK
+    hasher.shutdown()
@@ -0,0 +1,125 @@
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.services.auth_cache import AuthCache, CachedUser, ExpiringLRUCache, TokenClaims, auth_cache
+
+
+def _login(client, username="testuser", password="password123", email=None):
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": email or f"{username}@example.com", "password": password}
+    )
+    token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _user_queries(client, headers, requests=3):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        for _ in range(requests):
+            assert client.get("/users/current-user", headers=headers).status_code == status.HTTP_200_OK
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_lru_cache_evicts_least_recently_used_and_expired():
+    now = [0.0]
+    cache = ExpiringLRUCache(max_size=2, clock=lambda: now[0])
+    cache.put("a", 1, expires_at=100)
+    cache.put("b", 2, expires_at=10)
+
+    assert cache.get("a") == 1
+    cache.put("c", 3, expires_at=100)  # evicts "b", the least recently used
+
+    assert cache.get("b") is None
+    now[0] = 200
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 1, "max_size": 2, "hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_repeat_requests_skip_user_lookup(client):
+    # Arrange
+    headers = _login(client)
+
+    # Act
+    statements = _user_queries(client, headers)
+
+    # Assert
+    assert len(statements) == 1
+    stats = auth_cache.stats()
+    assert stats["tokens"]["hits"] == 2
+    assert stats["users"]["hits"] == 2
+    assert stats["users"]["size"] == 1
+
+
+def test_renamed_user_old_token_is_rejected(client):
+    # Arrange
+    headers = _login(client)
+    client.get("/users/current-user", headers=headers)  # warm the caches
+
+    # Act
+    response = client.patch("/users/update", json={"username": "renamed"}, headers=headers)
+    new_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    # Assert
+    assert client.get("/users/current-user", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.get("/users/current-user", headers=new_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["username"] == "renamed"
+
+
+def test_old_token_cannot_reach_user_who_took_the_name(client):
+    # Arrange
+    old_headers = _login(client, "alice")
+    client.get("/users/current-user", headers=old_headers)
+    client.patch("/users/update", json={"username": "alice2"}, headers=old_headers)
+
+    # Act
+    # Someone else registers the freed name
+    _login(client, "alice", email="other-alice@example.com")
+
+    # Assert
+    assert client.get("/users/current-user", headers=old_headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_deleted_user_token_is_rejected(client):
+    # Arrange
+    headers = _login(client)
+    client.get("/users/current-user", headers=headers)
+
+    # Act
+    assert client.delete("/users/me", headers=headers).status_code == status.HTTP_204_NO_CONTENT
+
+    # Assert
+    assert client.get("/users/current-user", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+    assert auth_cache.stats()["users"]["size"] == 0
+
+
+def test_profile_update_is_visible_immediately(client):
+    headers = _login(client)
+    client.get("/users/current-user", headers=headers)
+
+    client.patch("/users/update", json={"profile_pic_pokemon_id": 25}, headers=headers)
+
+    assert client.get("/users/current-user", headers=headers).json()["profile_pic_pokemon_id"] == 25
+
+
+def test_stale_read_is_not_cached_after_invalidation():
+    cache = AuthCache()
+    user = CachedUser(1, "ash", "ash@example.com", None)
+    cache.put_claims("token", TokenClaims("ash", 1, 2 ** 40))
+
+    # A reader started before the invalidation finishes after it
+    generation = cache.generation
+    cache.invalidate_user(1)
+    cache.put_user(user, generation)
+
+    assert cache.get_user(1) is None
+    assert cache.get_claims("token") is None
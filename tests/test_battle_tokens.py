@@ -0,0 +1,150 @@
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import ComparisonSession, PopularityLeaderboard
+from app.services import battle_tokens as battle_tokens_module
+from app.services import vote_buffer as vote_buffer_module
+from app.services.battle_tokens import BattleTokenSigner, InvalidBattleToken, ExpiredBattleToken, ReplayGuard
+from app.services.vote_buffer import VoteBuffer
+
+
+@pytest.fixture
+def signer(monkeypatch):
+    signer = BattleTokenSigner("test-secret", ttl_seconds=600)
+    monkeypatch.setattr(battle_tokens_module, "battle_tokens", signer)
+    return signer
+
+
+def test_token_round_trip():
+    signer = BattleTokenSigner("test-secret", ttl_seconds=600)
+
+    ticket = signer.verify(signer.issue(25, 150, now=1000), now=1500)
+
+    assert (ticket.pokemon1_id, ticket.pokemon2_id, ticket.expires_at) == (25, 150, 1600)
+
+
+def test_token_rejects_tampering_and_other_keys():
+    signer = BattleTokenSigner("test-secret")
+    token = signer.issue(1, 2)
+    tampered = ("A" if token[0] != "A" else "B") + token[1:]
+
+    with pytest.raises(InvalidBattleToken):
+        signer.verify(tampered)
+    with pytest.raises(InvalidBattleToken):
+        BattleTokenSigner("other-secret").verify(token)
+    with pytest.raises(InvalidBattleToken):
+        signer.verify("not a token!")
+
+
+def test_token_expires():
+    signer = BattleTokenSigner("test-secret", ttl_seconds=600)
+    token = signer.issue(1, 2, now=1000)
+
+    with pytest.raises(ExpiredBattleToken):
+        signer.verify(token, now=1601)
+
+
+def test_replay_guard_forgets_expired_nonces():
+    # Arrange
+    guard = ReplayGuard()
+    assert guard.claim(b"a", expires_at=100, now=0)
+    assert guard.claim(b"b", expires_at=200, now=0)
+
+    # Act / Assert
+    assert not guard.claim(b"a", expires_at=100, now=50)
+    assert guard.claim(b"c", expires_at=300, now=150)
+    # "a" expired and was pruned; its token can no longer verify anyway
+    assert len(guard) == 2
+
+
+def test_token_vote_cycle_touches_no_sessions(client, db_session, signer):
+    # Arrange
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        # Act
+        pair = client.get("/popularity/pair-to-battle").json()
+        pair_statements = list(statements)
+        response = client.post(f"/popularity/vote/{pair['session_id']}/{pair['pokemon1_id']}")
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["pokemon1_id"] == pair["pokemon1_id"]
+    assert pair_statements == []
+    assert not any("comparison_sessions" in statement for statement in statements)
+    assert db_session.query(ComparisonSession).count() == 0
+    winner = db_session.query(PopularityLeaderboard).filter_by(pokemon_id=pair["pokemon1_id"]).one()
+    assert winner.elo > 1000
+
+
+def test_token_vote_rejects_replay(client, signer):
+    pair = client.get("/popularity/pair-to-battle").json()
+    url = f"/popularity/vote/{pair['session_id']}/{pair['pokemon2_id']}"
+
+    first = client.post(url)
+    replay = client.post(url)
+
+    assert first.status_code == status.HTTP_200_OK
+    assert replay.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_token_vote_errors(client, signer):
+    # Wrong winner does not spend the token
+    token = signer.issue(1, 2)
+    assert client.post(f"/popularity/vote/{token}/3").status_code == status.HTTP_400_BAD_REQUEST
+    assert client.post(f"/popularity/vote/{token}/1").status_code == status.HTTP_200_OK
+
+    expired = signer.issue(1, 2, now=0)
+    assert client.post(f"/popularity/vote/{expired}/1").status_code == status.HTTP_410_GONE
+    assert client.post("/popularity/vote/forged-token/1").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_token_vote_batch(client, signer):
+    # Arrange
+    token = signer.issue(1, 2)
+    votes = [
+        {"session_id": token, "winner_pokemon_id": 1},
+        {"session_id": token, "winner_pokemon_id": 1},
+        {"session_id": signer.issue(3, 4), "winner_pokemon_id": 5},
+        {"session_id": signer.issue(3, 4, now=0), "winner_pokemon_id": 3},
+    ]
+
+    # Act
+    response = client.post("/popularity/votes", json=votes)
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["status"] for item in response.json()] == ["applied", "not_found", "invalid_winner", "expired"]
+
+
+def test_token_rejected_by_a_full_vote_buffer_can_be_retried(client, signer, tmp_path, monkeypatch):
+    # Arrange - a buffer with room for one vote
+    engine = create_engine(f"sqlite:///{tmp_path / 'votes.db'}")
+    Base.metadata.create_all(bind=engine)
+    buffer = VoteBuffer(str(tmp_path / "buffer"), sessionmaker(bind=engine), max_size=1, fsync=False)
+    buffer.open()
+    monkeypatch.setattr(vote_buffer_module, "vote_buffer", buffer)
+    votes = [
+        {"session_id": signer.issue(1, 2), "winner_pokemon_id": 1},
+        {"session_id": signer.issue(3, 4), "winner_pokemon_id": 3},
+    ]
+
+    # Act - the second vote is rejected, then retried once the buffer is flushed
+    first = client.post("/popularity/votes", json=votes)
+    buffer.flush()
+    retry = client.post("/popularity/votes", json=votes[1:])
+
+    # Assert
+    assert [item["status"] for item in first.json()] == ["applied", "buffer_full"]
+    assert [item["status"] for item in retry.json()] == ["applied"]
+    buffer.stop()
+    engine.dispose()
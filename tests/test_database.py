@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import create_engine, text
+from app.db_profiles import PROFILES, apply_connection_profile, get_profile
+
+
+@pytest.mark.parametrize("profile", sorted(PROFILES))
+def test_connection_profile_applies_pragmas(tmp_path, profile):
+    # Arrange
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    apply_connection_profile(engine, profile)
+    pragmas = PROFILES[profile]["pragmas"]
+    
+    # Act
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+        busy_timeout = connection.execute(text("PRAGMA busy_timeout")).scalar()
+        cache_size = connection.execute(text("PRAGMA cache_size")).scalar()
+        foreign_keys = connection.execute(text("PRAGMA foreign_keys")).scalar()
+    engine.dispose()
+    
+    # Assert - synchronous is reported as an int: 1 = NORMAL, 2 = FULL
+    assert journal_mode == "wal"
+    assert synchronous == {"NORMAL": 1, "FULL": 2}[pragmas["synchronous"]]
+    assert busy_timeout == pragmas["busy_timeout"]
+    assert cache_size == pragmas["cache_size"]
+    assert foreign_keys == 1
+
+
+def test_unknown_profile_raises():
+    with pytest.raises(ValueError):
+        get_profile("turbo")
@@ -0,0 +1,41 @@
+import orjson
+from app.main import app
+from app.services.fast_json import ndjson_lines, rows_json
+
+
+def _response_schema(openapi, path):
+    return openapi["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+
+
+def test_rows_encode_as_field_dicts():
+    rows = [(1, 25, 1000), (2, 1, 990)]
+    fields = ("id", "pokemon_id", "elo")
+
+    assert orjson.loads(rows_json(rows, fields)) == [
+        {"id": 1, "pokemon_id": 25, "elo": 1000}, {"id": 2, "pokemon_id": 1, "elo": 990}
+    ]
+    assert ndjson_lines(rows, fields) == b'{"id":1,"pokemon_id":25,"elo":1000}\n{"id":2,"pokemon_id":1,"elo":990}\n'
+
+
+def test_fast_path_routes_keep_their_response_models():
+    openapi = app.openapi()
+
+    assert _response_schema(openapi, "/popularity/")["items"]["$ref"].endswith("/PopularityLeaderboard")
+    assert _response_schema(openapi, "/popularity/page")["$ref"].endswith("/PopularityLeaderboardPage")
+    assert _response_schema(openapi, "/users/favorite-pokemons")["items"]["$ref"].endswith("/FavoritePokemon")
+    assert _response_schema(openapi, "/users/favorite-pokemons/page")["$ref"].endswith("/FavoritePokemonPage")
+
+
+def test_favorites_list_matches_schema(client):
+    # Arrange
+    client.post("/auth/register", json={"username": "ash", "email": "ash@example.com", "password": "pikachu123"})
+    token = client.post("/auth/token", data={"username": "ash", "password": "pikachu123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 25}, headers=headers)
+
+    # Act
+    response = client.get("/users/favorite-pokemons", headers=headers)
+
+    # Assert
+    assert response.headers["content-type"] == "application/json"
+    assert [set(row) for row in response.json()] == [{"id", "user_id", "pokemon_id"}]
@@ -0,0 +1,109 @@
+from fastapi import status
+from sqlalchemy import event, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from app.models import FavoriteCount
+from app.services.favorite_counts import FavoriteCountIndex, _reconcile, favorite_count_index, reconcile_favorite_counts
+from app.services.view_generations import FAVORITE_COUNTS, GenerationWatcher
+
+
+def _auth_header(client, username="testuser", password="password123"):
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password}
+    )
+    token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _stored_counts(db_session):
+    db_session.expire_all()
+    return dict(db_session.execute(select(FavoriteCount.pokemon_id, FavoriteCount.count).where(FavoriteCount.count > 0)).all())
+
+
+def test_counters_follow_every_favorites_write(client, db_session):
+    # Arrange
+    ash = _auth_header(client, "ash")
+    misty = _auth_header(client, "misty")
+    brock = _auth_header(client, "brock")
+
+    # Act
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 25}, headers=ash)
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 25}, headers=ash)  # duplicate, not counted
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [25, 120, 7]}, headers=misty)
+    client.patch("/users/favorite-pokemons", json={"add": [7, 74], "remove": [25, 999]}, headers=brock)
+    client.patch("/users/favorite-pokemons", json={"remove": [120]}, headers=misty)
+    client.request("DELETE", "/users/favorite-pokemon/", json={"pokemon_id": 25}, headers=ash)
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 74}, headers=ash)
+    client.delete("/users/me", headers=brock)
+
+    # Assert
+    expected = {7: 1, 25: 1, 74: 1}
+    assert _stored_counts(db_session) == expected
+    assert client.get("/users/favorites/top/10").json() == [
+        {"pokemon_id": pokemon_id, "count": count} for pokemon_id, count in sorted(expected.items())
+    ]
+
+
+def test_top_orders_by_count_and_runs_no_sql(client):
+    # Arrange
+    for name, pokemon_ids in (("ash", [25, 1]), ("misty", [25, 7]), ("brock", [25, 7, 74])):
+        client.put("/users/favorite-pokemons", json={"pokemon_ids": pokemon_ids}, headers=_auth_header(client, name))
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Act
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/users/favorites/top/3")
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"pokemon_id": 25, "count": 3}, {"pokemon_id": 7, "count": 2}, {"pokemon_id": 1, "count": 1}
+    ]
+    assert statements == []
+
+
+def test_reconcile_reports_and_fixes_drift(client, db_session):
+    # Arrange
+    headers = _auth_header(client)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [1, 4]}, headers=headers)
+    db_session.execute(update(FavoriteCount).where(FavoriteCount.pokemon_id == 4).values(count=5))
+    db_session.add(FavoriteCount(pokemon_id=150, count=2))
+    db_session.commit()
+
+    # Act
+    drift = _reconcile(db_session)
+    db_session.commit()
+
+    # Assert
+    assert drift == [(4, 5, 1), (150, 2, 0)]
+    assert _stored_counts(db_session) == {1: 1, 4: 1}
+    assert _reconcile(db_session, dry_run=True) == []
+    assert favorite_count_index.top(5) == [{"pokemon_id": 1, "count": 1}, {"pokemon_id": 4, "count": 1}]
+
+
+def test_server_reloads_the_counters_after_a_reconcile_elsewhere(client, db_session):
+    # Arrange - the server's index, loaded while a counter had drifted
+    headers = _auth_header(client)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [1, 4]}, headers=headers)
+    db_session.execute(update(FavoriteCount).where(FavoriteCount.pokemon_id == 4).values(count=5))
+    db_session.commit()
+    index = FavoriteCountIndex()
+    index.reload(db_session)
+    session_factory = sessionmaker(bind=db_session.get_bind())
+    watcher = GenerationWatcher(session_factory, {FAVORITE_COUNTS: index.reload})
+    watcher.check()
+
+    # Act
+    reconcile_favorite_counts(session_factory)
+    changed = watcher.check()
+
+    # Assert
+    assert changed == [FAVORITE_COUNTS]
+    assert index.top(5) == [{"pokemon_id": 1, "count": 1}, {"pokemon_id": 4, "count": 1}]
@@ -0,0 +1,120 @@
+from fastapi import status
+from sqlalchemy import create_engine, text
+from app.config import LAST_POKEMON_ID
+from app.services.favorites import ensure_unique_favorites, from_bitset, to_bitset
+
+
+def _auth_header(client, username="testuser", password="password123"):
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password}
+    )
+    token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _favorite_ids(client, headers):
+    return sorted(row["pokemon_id"] for row in client.get("/users/favorite-pokemons", headers=headers).json())
+
+
+def test_bitset_round_trip():
+    pokemon_ids = [1, 7, 8, 150, LAST_POKEMON_ID]
+
+    bits = to_bitset(pokemon_ids)
+
+    assert from_bitset(bits) == pokemon_ids
+    assert bits.bit_length() <= (LAST_POKEMON_ID // 8 + 1) * 8
+    assert from_bitset(to_bitset([25, 1]) & to_bitset([1, 4, 25])) == [1, 25]
+
+
+def test_adding_a_favorite_twice_keeps_one_row(client):
+    # Arrange
+    headers = _auth_header(client)
+    first = client.post("/users/favorite-pokemon", json={"pokemon_id": 25}, headers=headers)
+
+    # Act
+    second = client.post("/users/favorite-pokemon", json={"pokemon_id": 25}, headers=headers)
+
+    # Assert
+    assert second.status_code == status.HTTP_201_CREATED
+    assert second.json() == first.json()
+    assert _favorite_ids(client, headers) == [25]
+
+
+def test_bulk_put_and_patch(client):
+    # Arrange
+    headers = _auth_header(client)
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 3}, headers=headers)
+
+    # Act
+    put = client.put("/users/favorite-pokemons", json={"pokemon_ids": [150, 1, 25, 1]}, headers=headers)
+    patch = client.patch(
+        "/users/favorite-pokemons", json={"add": [7, 94], "remove": [150, 94, 9]}, headers=headers
+    )
+
+    # Assert
+    assert put.json() == {"pokemon_ids": [1, 25, 150]}
+    assert patch.json() == {"pokemon_ids": [1, 7, 25]}
+    assert _favorite_ids(client, headers) == [1, 7, 25]
+
+
+def test_bulk_edit_rejects_unknown_pokemon(client):
+    headers = _auth_header(client)
+
+    response = client.put("/users/favorite-pokemons", json={"pokemon_ids": [1, LAST_POKEMON_ID + 1]}, headers=headers)
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_favorites_in_common_follow_edits(client):
+    # Arrange
+    ash = _auth_header(client, "ash")
+    misty = _auth_header(client, "misty")
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [1, 25, 120, 121]}, headers=ash)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [7, 120, 121, 25]}, headers=misty)
+    before = client.get("/users/favorite-pokemons/in-common/misty", headers=ash).json()
+
+    # Act
+    client.patch("/users/favorite-pokemons", json={"remove": [121]}, headers=misty)
+    after = client.get("/users/favorite-pokemons/in-common/ash", headers=misty).json()
+
+    # Assert
+    assert before == {"count": 3}
+    assert after == {"count": 2}
+    assert client.get("/users/favorite-pokemons/in-common/brock", headers=ash).status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_favorites_in_common_do_not_reveal_the_other_users_favorites(client):
+    # Arrange - a user who favorites every Pokemon
+    ash = _auth_header(client, "ash")
+    misty = _auth_header(client, "misty")
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": list(range(1, LAST_POKEMON_ID + 1))}, headers=ash)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [7, 120, 121]}, headers=misty)
+
+    # Act
+    response = client.get("/users/favorite-pokemons/in-common/misty", headers=ash)
+
+    # Assert
+    assert response.json() == {"count": 3}
+
+
+def test_ensure_unique_favorites_drops_duplicates():
+    # Arrange: a database from before the unique index
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE favorite_pokemons (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, pokemon_id INTEGER NOT NULL)"
+        ))
+        connection.execute(text("INSERT INTO favorite_pokemons (user_id, pokemon_id) VALUES (1, 25), (1, 25), (2, 25), (1, 4)"))
+
+    # Act
+    with engine.begin() as connection:
+        ensure_unique_favorites(connection)
+        ensure_unique_favorites(connection)
+
+    # Assert
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, user_id, pokemon_id FROM favorite_pokemons ORDER BY id")).all()
+        indexes = [row.name for row in connection.execute(text("PRAGMA index_list(favorite_pokemons)"))]
+    assert rows == [(1, 1, 25), (3, 2, 25), (4, 1, 4)]
+    assert "ux_favorite_pokemons_user_pokemon" in indexes
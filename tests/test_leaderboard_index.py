@@ -0,0 +1,121 @@
+import pytest
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.models import PopularityLeaderboard
+from app.services.leaderboard_index import LeaderboardIndex, leaderboard_index
+from app.services.ranking import apply_elo_update
+
+
+def _seed(db_session, elos):
+    for pokemon_id, elo in elos.items():
+        db_session.add(PopularityLeaderboard(pokemon_id=pokemon_id, elo=elo))
+    db_session.commit()
+
+
+def test_index_orders_by_elo_then_pokemon_id():
+    # Arrange
+    index = LeaderboardIndex()
+    index.loaded = True
+    index.apply([(1, 10, 1100), (2, 20, 1200), (3, 30, 1100), (4, 40, 900)])
+
+    # Act
+    top = index.top(3)
+    rank = index.rank(30, neighbors=1)
+
+    # Assert
+    assert [entry["pokemon_id"] for entry in top] == [20, 10, 30]
+    assert rank["rank"] == 3
+    assert rank["total"] == 4
+    assert rank["percentile"] == pytest.approx(33.33)
+    assert [entry["pokemon_id"] for entry in rank["above"]] == [10]
+    assert [entry["pokemon_id"] for entry in rank["below"]] == [40]
+
+
+def test_index_apply_moves_and_removes_rows():
+    index = LeaderboardIndex()
+    index.loaded = True
+    index.apply([(1, 10, 1000), (2, 20, 1100)])
+
+    index.apply([(1, 10, 1200), (2, 20, None)])
+
+    assert index.get(20) is None
+    assert index.top(5) == [{"id": 1, "pokemon_id": 10, "elo": 1200}]
+
+
+def test_rank_endpoint(client, db_session):
+    # Arrange
+    _seed(db_session, {1: 1300, 2: 1200, 3: 1100, 4: 1000, 5: 900})
+
+    # Act
+    response = client.get("/popularity/3/rank?neighbors=2")
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["pokemon_id"] == 3
+    assert data["rank"] == 3
+    assert data["total"] == 5
+    assert data["percentile"] == 50.0
+    assert [entry["pokemon_id"] for entry in data["above"]] == [1, 2]
+    assert [entry["pokemon_id"] for entry in data["below"]] == [4, 5]
+
+
+def test_rank_endpoint_not_found(client):
+    response = client.get("/popularity/9999/rank")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_reads_do_not_query_the_database(client, db_session):
+    # Arrange
+    _seed(db_session, {1: 1100, 2: 1000})
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        # Act
+        responses = [
+            client.get("/popularity/top/2"),
+            client.get("/popularity/1"),
+            client.get("/popularity/2/rank"),
+        ]
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    # Assert
+    assert all(r.status_code == status.HTTP_200_OK for r in responses)
+    assert statements == []
+
+
+def test_vote_moves_pokemon_in_index(client, db_session):
+    # Arrange
+    _seed(db_session, {1: 1000, 2: 1100})
+    assert leaderboard_index.rank(1)["rank"] == 2
+    pair = client.get("/popularity/pair-to-battle").json()
+
+    # Act
+    client.post(f"/popularity/vote/{pair['session_id']}/{pair['pokemon1_id']}")
+
+    # Assert
+    db_session.expire_all()
+    winner = db_session.query(PopularityLeaderboard).filter_by(pokemon_id=pair["pokemon1_id"]).one()
+    assert leaderboard_index.get(pair["pokemon1_id"])["elo"] == winner.elo
+    assert client.get("/popularity/top/1").json()[0]["elo"] >= winner.elo
+
+
+def test_rolled_back_vote_does_not_reach_index(client, db_session):
+    # Arrange
+    _seed(db_session, {1: 1000, 2: 1000})
+    nested = db_session.begin_nested()
+
+    # Act
+    apply_elo_update(db_session, 1, 2, 1)
+    nested.rollback()
+    db_session.commit()
+
+    # Assert
+    assert leaderboard_index.get(1)["elo"] == 1000
+    assert leaderboard_index.get(2)["elo"] == 1000
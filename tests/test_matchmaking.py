@@ -0,0 +1,75 @@
+import random
+import pytest
+from app.services.matchmaking import FenwickTree, MatchmakingEngine, matchmaker
+from app.services.ranking import apply_elo_update
+from app.models import PopularityLeaderboard
+
+
+def test_fenwick_tree_weighted_find():
+    tree = FenwickTree(4)
+    for index, weight in enumerate([1.0, 0.0, 3.0, 1.0], start=1):
+        tree.add(index, weight)
+
+    assert tree.total() == 5.0
+    assert tree.find(0.5) == 1
+    assert tree.find(1.5) == 3
+    assert tree.find(3.9) == 3
+    assert tree.find(4.5) == 4
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        MatchmakingEngine(10, "best")
+
+
+def test_pairs_are_distinct_and_in_range():
+    for strategy in ("uniform", "undervoted", "close", "balanced"):
+        engine = MatchmakingEngine(20, strategy, elo_window=3, rng=random.Random(1))
+        for _ in range(200):
+            pokemon1_id, pokemon2_id = engine.pair()
+            assert pokemon1_id != pokemon2_id
+            assert 1 <= pokemon1_id <= 20 and 1 <= pokemon2_id <= 20
+
+
+def test_undervoted_favors_pokemon_with_fewer_votes():
+    # Arrange - everyone but Pokemon 10 already has 99 votes
+    engine = MatchmakingEngine(10, "undervoted", rng=random.Random(7))
+    for _ in range(99):
+        for pokemon_id in range(1, 10, 2):
+            engine.record_vote(pokemon_id, pokemon_id + 1 if pokemon_id + 1 < 10 else 1, 1000, 1000)
+
+    # Act
+    picks = [pokemon_id for _ in range(1000) for pokemon_id in engine.pair()]
+
+    # Assert - weight 1 vs 0.1 each, so 10 is the first pick about half the time
+    assert picks.count(10) > 350
+
+
+def test_close_picks_from_the_elo_window():
+    # Arrange - Elo strictly increasing with the id
+    engine = MatchmakingEngine(100, "close", elo_window=2, rng=random.Random(3))
+    engine.reset({pokemon_id: 1000 + 10 * pokemon_id for pokemon_id in range(1, 101)})
+
+    # Act / Assert
+    for _ in range(500):
+        pokemon1_id, pokemon2_id = engine.pair()
+        assert abs(pokemon1_id - pokemon2_id) <= 2
+
+
+def test_committed_votes_reach_matchmaker(db_session):
+    # Arrange
+    db_session.add_all([PopularityLeaderboard(pokemon_id=1, elo=1000), PopularityLeaderboard(pokemon_id=2, elo=1000)])
+    db_session.commit()
+    matchmaker.reload(db_session)
+
+    # Act - one vote rolled back, one committed
+    nested = db_session.begin_nested()
+    apply_elo_update(db_session, 1, 2, 2)
+    nested.rollback()
+    new_elos = apply_elo_update(db_session, 1, 2, 1)
+    assert matchmaker.votes[1] == 0
+    db_session.commit()
+
+    # Assert
+    assert (matchmaker.votes[1], matchmaker.votes[2]) == (1, 1)
+    assert (matchmaker.elos[1], matchmaker.elos[2]) == new_elos
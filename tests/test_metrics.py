@@ -0,0 +1,81 @@
+from fastapi import status
+from sqlalchemy import create_engine, text
+from app.services.metrics import (
+    MetricsRegistry,
+    http_request_duration,
+    http_requests,
+    instrument_engine,
+    sql_statement_duration,
+    statement_labels,
+)
+
+
+def test_histogram_renders_cumulative_buckets():
+    # Arrange
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+
+    # Act
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(('/a "quoted"',), value)
+
+    # Assert
+    assert registry.render().splitlines() == [
+        "# HELP pokeparty_latency_seconds Latency.",
+        "# TYPE pokeparty_latency_seconds histogram",
+        'pokeparty_latency_seconds_bucket{route="/a \\"quoted\\"",le="0.1"} 2',
+        'pokeparty_latency_seconds_bucket{route="/a \\"quoted\\"",le="1.0"} 3',
+        'pokeparty_latency_seconds_bucket{route="/a \\"quoted\\"",le="+Inf"} 4',
+        'pokeparty_latency_seconds_sum{route="/a \\"quoted\\""} 3.65',
+        'pokeparty_latency_seconds_count{route="/a \\"quoted\\""} 4',
+    ]
+
+
+def test_stats_gauges_flatten_nested_stats_and_skip_stopped_components():
+    registry = MetricsRegistry()
+    registry.stats("cache", lambda: {"tokens": {"hits": 3, "hit_rate": 0.75}, "mode": "lru"})
+    registry.stats("stopped", lambda: None)
+
+    lines = [line for line in registry.render().splitlines() if not line.startswith("#")]
+
+    assert lines == ["pokeparty_cache_tokens_hits 3", "pokeparty_cache_tokens_hit_rate 0.75"]
+
+
+def test_requests_are_recorded_by_route_template(client):
+    # Arrange
+    found = ("GET", "/popularity/top/{n}", 200)
+    missing = ("GET", "/popularity/{pokemon_id}", 404)
+    before = (http_requests.value(found), http_requests.value(missing), http_request_duration.count(found[:2]))
+
+    # Act
+    client.get("/popularity/top/1")
+    client.get("/popularity/top/2")
+    client.get("/popularity/99999")
+    response = client.get("/metrics")
+
+    # Assert
+    after = (http_requests.value(found), http_requests.value(missing), http_request_duration.count(found[:2]))
+    assert [b - a for a, b in zip(before, after)] == [2, 1, 2]
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'pokeparty_http_requests_total{method="GET",route="/popularity/top/{n}",status="200"}' in response.text
+    assert 'pokeparty_threadpool_threads{state="in_use"}' in response.text
+
+
+def test_statements_are_timed_by_operation_and_table():
+    # Arrange
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test")
+    instrument_engine(engine, "test")  # listeners are only added once
+    before = sql_statement_duration.count(("INSERT", "metrics_probe"))
+
+    # Act
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE metrics_probe (id INTEGER)"))
+        connection.execute(text("INSERT INTO metrics_probe (id) VALUES (1)"))
+        connection.execute(text("INSERT INTO metrics_probe (id) VALUES (2)"))
+
+    # Assert
+    assert sql_statement_duration.count(("INSERT", "metrics_probe")) - before == 2
+    assert statement_labels('  UPDATE "users" SET email=?') == ("UPDATE", "users")
+    assert statement_labels("BEGIN") == ("BEGIN", "")
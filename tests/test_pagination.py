@@ -0,0 +1,97 @@
+import json
+import pytest
+from fastapi import status
+from app.models import PopularityLeaderboard
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def _auth_header(client, username="testuser", password="password123"):
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password}
+    )
+    token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _seed_leaderboard(db_session):
+    # Ties on Elo are ordered by pokemon_id
+    elos = {1: 1000, 2: 1100, 3: 1000, 4: 900, 5: 1100, 6: 1000, 7: 950}
+    db_session.add_all(PopularityLeaderboard(pokemon_id=pokemon_id, elo=elo) for pokemon_id, elo in elos.items())
+    db_session.commit()
+    return [2, 5, 1, 3, 6, 7, 4]
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor(-5, 42), 2) == (-5, 42)
+    assert decode_cursor(None, 2) is None
+    for cursor in ("!!!", encode_cursor(1), "bm90IGEga2V5"):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(cursor, 2)
+
+
+def test_leaderboard_pages_walk_rank_order(client, db_session):
+    # Arrange
+    expected = _seed_leaderboard(db_session)
+
+    # Act
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+        body = client.get("/popularity/page", params=params).json()
+        seen += [row["pokemon_id"] for row in body["items"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    # Assert
+    assert seen == expected
+    assert pages == 3
+
+
+def test_leaderboard_page_rejects_invalid_cursor_and_limit(client):
+    assert client.get("/popularity/page", params={"cursor": "!!!"}).status_code == status.HTTP_400_BAD_REQUEST
+    assert client.get("/popularity/page", params={"limit": 0}).status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_leaderboard_stream_is_ndjson_in_rank_order(client, db_session):
+    # Arrange
+    expected = _seed_leaderboard(db_session)
+
+    # Act
+    response = client.get("/popularity/stream")
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["pokemon_id"] for row in rows] == expected
+    assert set(rows[0]) == {"id", "pokemon_id", "elo"}
+
+
+def test_favorites_pages_and_stream(client):
+    # Arrange
+    headers = _auth_header(client)
+    for pokemon_id in (25, 1, 150, 7, 94):
+        client.post("/users/favorite-pokemon", json={"pokemon_id": pokemon_id}, headers=headers)
+    # Another user's favorites never show up
+    other = _auth_header(client, "otheruser")
+    client.post("/users/favorite-pokemon", json={"pokemon_id": 3}, headers=other)
+
+    # Act
+    first = client.get("/users/favorite-pokemons/page", params={"limit": 2}, headers=headers).json()
+    rest = client.get(
+        "/users/favorite-pokemons/page", params={"limit": 10, "cursor": first["next_cursor"]}, headers=headers
+    ).json()
+    stream = client.get("/users/favorite-pokemons/stream", headers=headers)
+
+    # Assert
+    assert [row["pokemon_id"] for row in first["items"]] == [25, 1]
+    assert [row["pokemon_id"] for row in rest["items"]] == [150, 7, 94]
+    assert rest["next_cursor"] is None
+    assert [json.loads(line)["pokemon_id"] for line in stream.text.splitlines()] == [25, 1, 150, 7, 94]
+
+
+def test_favorites_page_requires_auth(client):
+    assert client.get("/users/favorite-pokemons/page").status_code == status.HTTP_401_UNAUTHORIZED
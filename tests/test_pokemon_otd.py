@@ -1,13 +1,24 @@
 import pytest
-from datetime import date
-from app.services.pokemon_otd import get_or_create_pokemon_of_the_day
+from datetime import date, datetime, timedelta, timezone
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.services.pokemon_otd import (
+    get_or_create_pokemon_of_the_day,
+    get_or_create_pokemon_of_the_day_async,
+    today as potd_today,
+    plan_schedule,
+    extend_schedule,
+    PotdCache,
+    UnknownTimezone,
+)
 from app.models import pokemon_of_the_day
 from app.config import LAST_POKEMON_ID
 
 
 def test_get_or_create_pokemon_of_the_day_creates_new(db_session):
     # Arrange
-    today = date.today().isoformat()
+    today = potd_today().isoformat()
     
     # Act
     potd = get_or_create_pokemon_of_the_day(db_session)
@@ -29,7 +40,7 @@ def test_get_or_create_pokemon_of_the_day_returns_existing(db_session):
     # Arrange
     from datetime import timedelta
     # Use a past date to avoid collision with other tests running today
-    past_date = (date.today() - timedelta(days=30)).isoformat()
+    past_date = (potd_today() - timedelta(days=30)).isoformat()
     existing_potd = pokemon_of_the_day(day_date=past_date, pokemon_id=25)  # Pikachu
     db_session.add(existing_potd)
     db_session.commit()
@@ -39,7 +50,7 @@ def test_get_or_create_pokemon_of_the_day_returns_existing(db_session):
     
     # Assert - today's POTD should exist and be valid
     assert potd is not None
-    assert potd.day_date == date.today().isoformat()
+    assert potd.day_date == potd_today().isoformat()
     assert 1 <= potd.pokemon_id <= LAST_POKEMON_ID
 
 
@@ -58,7 +69,7 @@ def test_get_or_create_pokemon_of_the_day_thread_safe(db_session):
     # Arrange
     from datetime import timedelta
     # Use a specific past date to avoid collision with other tests
-    specific_date = (date.today() - timedelta(days=60)).isoformat()
+    specific_date = (potd_today() - timedelta(days=60)).isoformat()
     
     # Create POTD in database for that date
     potd1 = pokemon_of_the_day(day_date=specific_date, pokemon_id=50)
@@ -83,8 +94,8 @@ def test_different_days_have_different_potd(db_session):
     from datetime import date, timedelta
     
     # Arrange
-    today = date.today().isoformat()
-    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    today = potd_today().isoformat()
+    yesterday = (potd_today() - timedelta(days=1)).isoformat()
     
     # Stwórz POTD dla wczoraj
     yesterday_potd = pokemon_of_the_day(day_date=yesterday, pokemon_id=1)
@@ -96,4 +107,104 @@ def test_different_days_have_different_potd(db_session):
     
     # Assert - can be different
     # (although statistically they can be the same)
-    assert yesterday_potd.day_date != today_potd.day_date
\ No newline at end of file
+    assert yesterday_potd.day_date != today_potd.day_date
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_pokemon_of_the_day_async_idempotent(async_db_session):
+    # Act
+    potd1 = await get_or_create_pokemon_of_the_day_async(async_db_session)
+    potd2 = await get_or_create_pokemon_of_the_day_async(async_db_session)
+    
+    # Assert
+    assert potd1.day_date == potd_today().isoformat()
+    assert 1 <= potd1.pokemon_id <= LAST_POKEMON_ID
+    assert potd1.pokemon_id == potd2.pokemon_id
+
+
+def test_schedule_is_deterministic_and_never_repeats_within_window():
+    # Arrange
+    start = date(2025, 1, 1)
+
+    # Act
+    schedule = plan_schedule({}, start, days=1000, window=365)
+    again = plan_schedule({}, start, days=1000, window=365)
+
+    # Assert
+    assert schedule == again
+    picks = [schedule[start + timedelta(days=offset)] for offset in range(1000)]
+    for offset in range(len(picks)):
+        assert picks[offset] not in picks[max(offset - 364, 0):offset]
+    assert all(1 <= pokemon_id <= LAST_POKEMON_ID for pokemon_id in picks)
+
+
+def test_schedule_avoids_existing_recent_days():
+    # Arrange
+    start = date(2025, 1, 1)
+    # Pokemon 1..10 were shown on the ten days before the new range
+    existing = {start - timedelta(days=day): day for day in range(1, 11)}
+
+    # Act
+    schedule = plan_schedule(existing, start, days=30, window=40, last_pokemon_id=50)
+
+    # Assert
+    assert not set(schedule.values()) & set(range(1, 11))
+
+
+def test_extend_schedule_keeps_existing_rows(db_session):
+    # Arrange
+    start = date(2030, 1, 1)
+    db_session.add(pokemon_of_the_day(day_date="2030-01-02", pokemon_id=25))
+    db_session.commit()
+
+    # Act
+    inserted = extend_schedule(db_session, start, days=10)
+    again = extend_schedule(db_session, start, days=10)
+
+    # Assert
+    assert (inserted, again) == (9, 0)
+    assert db_session.query(pokemon_of_the_day).filter_by(day_date="2030-01-02").one().pokemon_id == 25
+
+
+def test_cache_resolves_day_per_timezone_and_expires_at_midnight():
+    # Arrange
+    cache = PotdCache(default_timezone="UTC")
+    cache._schedule = {"2025-06-01": 1, "2025-06-02": 2}
+    just_before_midnight = datetime(2025, 6, 1, 23, 59, tzinfo=timezone.utc).timestamp()
+
+    # Act / Assert
+    assert cache.current(now=just_before_midnight) == ("2025-06-01", 1)
+    # Already June 2nd in Warsaw (UTC+2)
+    assert cache.current("Europe/Warsaw", now=just_before_midnight) == ("2025-06-02", 2)
+    assert cache.current(now=just_before_midnight + 120) == ("2025-06-02", 2)
+    with pytest.raises(UnknownTimezone):
+        cache.current("Mars/Olympus_Mons", now=just_before_midnight)
+
+
+def test_pokemon_otd_endpoint_is_served_from_cache(client):
+    # Arrange
+    first = client.get("/pokemon-otd").json()["pokemon_of_the_day"]
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Act
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        again = client.get("/pokemon-otd").json()["pokemon_of_the_day"]
+        other_tz = client.get("/pokemon-otd", params={"tz": "Pacific/Kiritimati"}).json()["pokemon_of_the_day"]
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    # Assert
+    assert first == again
+    assert first["day_date"] == potd_today().isoformat()
+    assert other_tz["day_date"] == potd_today("Pacific/Kiritimati").isoformat()
+    assert statements == []
+
+
+def test_pokemon_otd_rejects_unknown_timezone(client):
+    response = client.get("/pokemon-otd", params={"tz": "Not/AZone"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
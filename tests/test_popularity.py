@@ -1,7 +1,18 @@
+import threading
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi import status
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from app.config import PAIRS_TO_BATTLE_MAX_COUNT, VOTES_BATCH_MAX_SIZE
+from app.database import Base
+from app.db_profiles import apply_connection_profile
 from app.models import PopularityLeaderboard, ComparisonSession
+from app.routers import popularity as popularity_module
+from app.services.writer import run_write
 
 
 def test_get_all_popularity(client, db_session):
@@ -193,3 +204,137 @@ def test_vote_updates_elo(client, db_session):
     
     # One should have more ELO, the other less
     assert p1.elo != 1000 or p2.elo != 1000
+
+
+def test_get_pairs_to_battle(client, db_session):
+    # Arrange
+    inserts = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO comparison_sessions"):
+            inserts.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        # Act
+        response = client.get("/popularity/pairs-to-battle?count=5")
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert len(data) == 5
+    assert len({frozenset((pair["pokemon1_id"], pair["pokemon2_id"])) for pair in data}) == 5
+    assert all(pair["pokemon1_id"] != pair["pokemon2_id"] for pair in data)
+    # All sessions written by one bulk statement
+    assert len(inserts) == 1
+    session_ids = {pair["session_id"] for pair in data}
+    assert db_session.query(ComparisonSession).filter(ComparisonSession.session_id.in_(session_ids)).count() == 5
+
+
+def test_get_pairs_to_battle_count_is_capped(client):
+    assert client.get(f"/popularity/pairs-to-battle?count={PAIRS_TO_BATTLE_MAX_COUNT + 1}").status_code == 422
+    assert client.get("/popularity/pairs-to-battle?count=0").status_code == 422
+
+
+def test_vote_batch_reports_each_item(client, db_session):
+    # Arrange
+    pairs = client.get("/popularity/pairs-to-battle?count=3").json()
+    db_session.add(ComparisonSession(
+        session_id="expired-session",
+        pokemon1_id=1,
+        pokemon2_id=2,
+        expires_at=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(minutes=1)
+    ))
+    db_session.commit()
+    votes = [
+        {"session_id": pairs[0]["session_id"], "winner_pokemon_id": pairs[0]["pokemon1_id"]},
+        {"session_id": pairs[1]["session_id"], "winner_pokemon_id": 9999},
+        {"session_id": "expired-session", "winner_pokemon_id": 1},
+        {"session_id": "unknown-session", "winner_pokemon_id": 1},
+        {"session_id": pairs[2]["session_id"], "winner_pokemon_id": pairs[2]["pokemon2_id"]},
+        # Second vote on a session in the same batch
+        {"session_id": pairs[0]["session_id"], "winner_pokemon_id": pairs[0]["pokemon1_id"]},
+    ]
+    
+    # Act
+    response = client.post("/popularity/votes", json=votes)
+    
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["status"] for item in response.json()] == [
+        "applied", "invalid_winner", "expired", "not_found", "applied", "not_found"
+    ]
+    # Consumed and expired sessions are gone; the invalid vote keeps its session
+    remaining = {row.session_id for row in db_session.query(ComparisonSession)}
+    assert remaining == {pairs[1]["session_id"]}
+    winner = db_session.query(PopularityLeaderboard).filter_by(pokemon_id=pairs[0]["pokemon1_id"]).one()
+    assert winner.elo > 1000
+
+
+def test_vote_batch_applies_votes_in_order(client, db_session):
+    # Arrange - two battles between the same Pokemon
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
+    for session_id in ("first", "second"):
+        db_session.add(ComparisonSession(session_id=session_id, pokemon1_id=1, pokemon2_id=2, expires_at=expires_at))
+    db_session.commit()
+    
+    # Act
+    response = client.post("/popularity/votes", json=[
+        {"session_id": "first", "winner_pokemon_id": 1},
+        {"session_id": "second", "winner_pokemon_id": 2},
+    ])
+    
+    # Assert - same result as two single votes in a row
+    assert response.status_code == status.HTTP_200_OK
+    elos = {row.pokemon_id: row.elo for row in db_session.query(PopularityLeaderboard)}
+    assert (elos[1], elos[2]) == (997, 1003)
+
+
+def test_vote_batch_size_is_capped(client):
+    too_many = [{"session_id": "s", "winner_pokemon_id": 1}] * (VOTES_BATCH_MAX_SIZE + 1)
+    assert client.post("/popularity/votes", json=too_many).status_code == 422
+    assert client.post("/popularity/votes", json=[]).status_code == 422
+
+
+def test_concurrent_batches_apply_a_session_once(tmp_path, monkeypatch):
+    # Arrange - a file database, and both batches vote on the same session
+    engine = create_engine(f"sqlite:///{tmp_path / 'votes.db'}", pool_size=2)
+    apply_connection_profile(engine, "throughput")
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(bind=engine)
+    with SessionFactory() as db:
+        db.add(ComparisonSession(
+            session_id="shared", pokemon1_id=1, pokemon2_id=2,
+            expires_at=datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=10),
+        ))
+        db.commit()
+
+    # Without the write lock, both batches would see the session before either commits
+    both_checked = threading.Barrier(2, timeout=1)
+    check_votes = popularity_module._check_votes
+
+    def check_votes_together(sessions, votes):
+        try:
+            both_checked.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return check_votes(sessions, votes)
+
+    monkeypatch.setattr(popularity_module, "_check_votes", check_votes_together)
+
+    def vote_batch(_):
+        with SessionFactory() as db:
+            return run_write(db, partial(popularity_module._consume_votes, votes=[("shared", 1)]))[0]["status"]
+
+    # Act
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        statuses = sorted(pool.map(vote_batch, range(2)))
+
+    # Assert - one vote moved Elo, once
+    with SessionFactory() as db:
+        elos = {row.pokemon_id: row.elo for row in db.query(PopularityLeaderboard)}
+    engine.dispose()
+    assert statuses == ["applied", "not_found"]
+    assert elos == {1: 1024, 2: 976}
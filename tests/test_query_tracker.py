@@ -0,0 +1,143 @@
+import logging
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, text
+from app.services import query_tracker
+from app.services.query_tracker import redact, track_engine, track_queries
+
+
+def _auth_header(client, username="testuser", password="password123"):
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password}
+    )
+    token = client.post("/auth/token", data={"username": username, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def tracked_engine():
+    engine = create_engine("sqlite://")
+    track_engine(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE accounts (id INTEGER PRIMARY KEY, email TEXT)"))
+    return engine
+
+
+def test_redact_keeps_shape_but_drops_values():
+    assert redact(("ash@example.com", 25, None)) == ("<str>", "<int>", "NULL")
+    assert redact({"email": "ash@example.com"}) == {"email": "<str>"}
+    assert redact([("a", 1), ("b", 2)]) == "<2 parameter sets>"
+
+
+def test_tracker_counts_and_finds_repeated_statements(tracked_engine):
+    # Act
+    with track_queries("loop") as tracker, tracked_engine.connect() as connection:
+        for account_id in range(6):
+            connection.execute(text("SELECT email FROM accounts WHERE id = :id"), {"id": account_id})
+        connection.execute(text("SELECT count(*) FROM accounts"))
+
+    # Assert
+    assert tracker.count == 7
+    assert tracker.duration > 0
+    assert tracker.repeated(5) == {"SELECT email FROM accounts WHERE id = ?": 6}
+    assert tracker.repeated(0) == {}
+
+
+def test_slow_queries_are_logged_with_redacted_parameters(tracked_engine, monkeypatch, caplog):
+    # Arrange
+    monkeypatch.setattr(query_tracker, "SLOW_QUERY_MS", 1e-9)
+
+    # Act
+    with caplog.at_level(logging.WARNING, logger=query_tracker.__name__), tracked_engine.begin() as connection:
+        connection.execute(text("INSERT INTO accounts (email) VALUES (:email)"), {"email": "ash@example.com"})
+
+    # Assert
+    message = caplog.records[-1].getMessage()
+    assert message.startswith("Slow query")
+    assert "INSERT INTO accounts" in message and "('<str>',)" in message
+    assert "ash@example.com" not in message
+
+
+def test_requests_report_their_queries_in_server_timing(client):
+    response = client.get("/users/favorites/top/3")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert 'desc="0 queries"' in response.headers["server-timing"]
+
+
+# --- Query budgets ---
+
+def test_update_user_checks_uniqueness_once_and_skips_the_reload(client, max_queries):
+    # Arrange
+    headers = _auth_header(client)
+    client.get("/users/current-user", headers=headers)  # caches the user
+
+    # Act
+    with max_queries(2):
+        response = client.patch("/users/update", json={"username": "ashketchum", "email": "ash@example.com"}, headers=headers)
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["username"] == "ashketchum"
+    assert response.json()["access_token"]
+
+
+def test_update_user_rejects_taken_username_and_email(client):
+    _auth_header(client, "misty")
+    headers = _auth_header(client, "ash")
+
+    username = client.patch("/users/update", json={"username": "misty", "email": "misty@example.com"}, headers=headers)
+    email = client.patch("/users/update", json={"email": "misty@example.com"}, headers=headers)
+    own = client.patch("/users/update", json={"username": "ash", "email": "ash@example.com"}, headers=headers)
+
+    assert username.json()["detail"] == "Username already taken"
+    assert email.json()["detail"] == "Email already registered"
+    assert own.status_code == status.HTTP_200_OK
+
+
+def test_delete_user_does_not_load_favorites(client, max_queries):
+    # Arrange
+    headers = _auth_header(client)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": list(range(1, 51))}, headers=headers)
+
+    # Act
+    with max_queries(3):
+        response = client.delete("/users/me", headers=headers)
+
+    # Assert
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+def test_favorite_reads_are_one_query(client, max_queries):
+    # Arrange
+    headers = _auth_header(client)
+    client.put("/users/favorite-pokemons", json={"pokemon_ids": [1, 4, 7]}, headers=headers)
+    client.get("/users/current-user", headers=headers)
+
+    # Act
+    with max_queries(1) as trackers:
+        client.get("/users/favorite-pokemons", headers=headers)
+        client.get("/users/favorite-pokemons/page", headers=headers)
+        client.get("/popularity/top/10")
+
+    # Assert
+    assert [tracker.label for tracker in trackers] == [
+        "GET /users/favorite-pokemons", "GET /users/favorite-pokemons/page", "GET /popularity/top/{n}"
+    ]
+
+
+def test_vote_batch_runs_the_same_statements_for_any_size(client, max_queries, caplog):
+    # Arrange
+    pairs = client.get("/popularity/pairs-to-battle?count=20").json()
+    votes = [{"session_id": pair["session_id"], "winner_pokemon_id": pair["pokemon1_id"]} for pair in pairs]
+
+    # Act
+    with caplog.at_level(logging.WARNING, logger=query_tracker.__name__), max_queries(6) as trackers:
+        response = client.post("/popularity/votes", json=votes)
+
+    # Assert - sessions, ensure rows, Elos, upsert, vote log, session delete; no N+1 warning
+    assert [item["status"] for item in response.json()] == ["applied"] * 20
+    assert trackers[0].repeated() == {}
+    assert not [record for record in caplog.records if "N+1" in record.getMessage()]
@@ -1,6 +1,23 @@
+import random
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app.config import LAST_POKEMON_ID
+from app.database import Base
+from app.db_profiles import apply_connection_profile
 from app.models import PopularityLeaderboard
-from app.services.ranking import update_elo_and_save
+from app.services.ranking import (
+    apply_elo_update,
+    apply_elo_updates,
+    calculate_new_elos,
+    ensure_unique_leaderboard,
+    seed_leaderboard,
+    update_elo_and_save,
+)
+from app.services.writer import run_write_async
 
 
 def test_update_elo_and_save_pokemon1_wins(db_session):
@@ -124,4 +141,150 @@ def test_update_elo_invalid_winner_id(db_session):
     
     # Act & Assert - should raise ValueError
     with pytest.raises(ValueError):
-        update_elo_and_save(db_session, pokemon1_id=p1_id, pokemon2_id=p2_id, winner_pokemon_id=999)
\ No newline at end of file
+        update_elo_and_save(db_session, pokemon1_id=p1_id, pokemon2_id=p2_id, winner_pokemon_id=999)
+
+@pytest.mark.asyncio
+async def test_async_vote_path_applies_elo_update(async_db_session):
+    # Arrange
+    p1_id, p2_id = 2011, 2012
+    async_db_session.add(PopularityLeaderboard(pokemon_id=p1_id, elo=1000))
+    await async_db_session.commit()
+    
+    # Act - what the async vote handlers run; pokemon2 is missing and should be created on the fly
+    await run_write_async(async_db_session, partial(apply_elo_update, pokemon1_id=p1_id, pokemon2_id=p2_id, winner_pokemon_id=p2_id))
+    
+    # Assert
+    rows = (await async_db_session.execute(
+        select(PopularityLeaderboard).order_by(PopularityLeaderboard.pokemon_id)
+    )).scalars().all()
+    assert [row.pokemon_id for row in rows] == [p1_id, p2_id]
+    assert rows[0].elo < 1000
+    assert rows[1].elo > 1000
+    
+    with pytest.raises(ValueError):
+        await run_write_async(async_db_session, partial(apply_elo_update, pokemon1_id=p1_id, pokemon2_id=p2_id, winner_pokemon_id=999))
+
+
+def test_sql_elo_update_matches_reference_formula(db_session):
+    # Arrange
+    cases = [(1000, 1000, True), (1400, 600, True), (1400, 600, False), (1234, 1100, False)]
+    for i, (elo1, elo2, pokemon1_won) in enumerate(cases):
+        p1_id, p2_id = 2200 + 2 * i, 2201 + 2 * i
+        db_session.add(PopularityLeaderboard(pokemon_id=p1_id, elo=elo1))
+        db_session.add(PopularityLeaderboard(pokemon_id=p2_id, elo=elo2))
+        db_session.commit()
+        
+        # Act
+        new_elos = apply_elo_update(db_session, p1_id, p2_id, p1_id if pokemon1_won else p2_id)
+        
+        # Assert
+        assert new_elos == calculate_new_elos(elo1, elo2, pokemon1_won)
+
+
+def test_batch_elo_update_matches_one_vote_at_a_time(db_session):
+    # Arrange - the same 50 votes on two copies of five Pokemon (2400.. and 2500..)
+    rng = random.Random(7)
+    for pokemon_id in range(5):
+        elo = rng.randint(800, 1400)
+        db_session.add(PopularityLeaderboard(pokemon_id=2400 + pokemon_id, elo=elo))
+        db_session.add(PopularityLeaderboard(pokemon_id=2500 + pokemon_id, elo=elo))
+    db_session.commit()
+    votes = []
+    for _ in range(50):
+        pokemon1_id, pokemon2_id = rng.sample(range(5), 2)
+        votes.append((pokemon1_id, pokemon2_id, rng.choice([pokemon1_id, pokemon2_id])))
+
+    # Act
+    expected = [apply_elo_update(db_session, 2400 + p1, 2400 + p2, 2400 + winner) for p1, p2, winner in votes]
+    batched = apply_elo_updates(db_session, [(2500 + p1, 2500 + p2, 2500 + winner) for p1, p2, winner in votes])
+    # A Pokemon without a row gets one, like apply_elo_update
+    apply_elo_updates(db_session, [(2600, 2601, 2600)])
+    db_session.commit()
+
+    # Assert
+    assert batched == expected
+    elos = dict(db_session.execute(select(PopularityLeaderboard.pokemon_id, PopularityLeaderboard.elo)).all())
+    assert [elos[2400 + pokemon_id] for pokemon_id in range(5)] == [elos[2500 + pokemon_id] for pokemon_id in range(5)]
+    assert (elos[2600], elos[2601]) == calculate_new_elos(1000, 1000, True)
+    with pytest.raises(ValueError):
+        apply_elo_updates(db_session, [(2400, 2401, 2402)])
+
+
+def test_pokemon_id_is_unique(db_session):
+    db_session.add(PopularityLeaderboard(pokemon_id=2300, elo=1000))
+    db_session.add(PopularityLeaderboard(pokemon_id=2300, elo=1000))
+    with pytest.raises(IntegrityError):
+        db_session.commit()
+
+
+def test_seed_leaderboard_is_idempotent(db_session):
+    # Arrange - one Pokemon already has votes
+    db_session.add(PopularityLeaderboard(pokemon_id=25, elo=1500))
+    db_session.commit()
+    
+    # Act
+    seed_leaderboard(db_session.connection())
+    seed_leaderboard(db_session.connection())
+    
+    # Assert
+    assert db_session.query(PopularityLeaderboard).count() == LAST_POKEMON_ID
+    assert db_session.query(PopularityLeaderboard).filter_by(pokemon_id=25).one().elo == 1500
+
+
+def test_ensure_unique_leaderboard_dedupes_legacy_table(tmp_path):
+    # Arrange - the pre-UNIQUE schema with a duplicated row
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE popularity_leaderboard (id INTEGER PRIMARY KEY, pokemon_id INTEGER NOT NULL, elo INTEGER NOT NULL)"
+        ))
+        connection.execute(text("CREATE INDEX ix_popularity_leaderboard_pokemon_id ON popularity_leaderboard (pokemon_id)"))
+        connection.execute(text("INSERT INTO popularity_leaderboard (pokemon_id, elo) VALUES (1, 1100), (2, 900), (1, 1000)"))
+    
+    # Act
+    with engine.begin() as connection:
+        ensure_unique_leaderboard(connection)
+        seed_leaderboard(connection)
+    
+    # Assert - the oldest row survives and the index is now unique
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT elo FROM popularity_leaderboard WHERE pokemon_id = 1")).scalars().all() == [1100]
+        assert connection.execute(text("SELECT COUNT(*) FROM popularity_leaderboard")).scalar() == LAST_POKEMON_ID
+        with pytest.raises(IntegrityError):
+            connection.execute(text("INSERT INTO popularity_leaderboard (pokemon_id, elo) VALUES (2, 1000)"))
+    engine.dispose()
+
+
+def test_concurrent_votes_conserve_elo(tmp_path):
+    # Arrange - a file database shared by many worker threads
+    engine = create_engine(f"sqlite:///{tmp_path / 'concurrent.db'}", pool_size=4)
+    apply_connection_profile(engine, "throughput")
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(bind=engine)
+    pokemon_ids = list(range(1, 21))
+    with engine.begin() as connection:
+        connection.execute(PopularityLeaderboard.__table__.insert(), [
+            {"pokemon_id": pokemon_id, "elo": 1000} for pokemon_id in pokemon_ids
+        ])
+    
+    rng = random.Random(42)
+    votes = []
+    for _ in range(2000):
+        pokemon1_id, pokemon2_id = rng.sample(pokemon_ids, 2)
+        votes.append((pokemon1_id, pokemon2_id, rng.choice([pokemon1_id, pokemon2_id])))
+    
+    def cast_vote(vote):
+        with SessionFactory() as db:
+            update_elo_and_save(db, *vote)
+    
+    # Act
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(cast_vote, votes))
+    
+    # Assert - Elo only moves between Pokemon, so no update may be lost
+    with engine.connect() as connection:
+        elos = connection.execute(text("SELECT elo FROM popularity_leaderboard")).scalars().all()
+    engine.dispose()
+    assert len(elos) == len(pokemon_ids)
+    assert sum(elos) == 1000 * len(pokemon_ids)
+    assert len(set(elos)) > 1
@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from functools import partial
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import PopularityLeaderboard, Vote
+from app.services.leaderboard_index import LeaderboardIndex
+from app.services.ranking import apply_elo_update, calculate_elo_delta, calculate_new_elos, DEFAULT_ELO
+from app.services.recompute import (
+    _MAX_GAP,
+    _VOTE_DTYPE,
+    _swap_leaderboard,
+    fit_bradley_terry,
+    load_votes,
+    recompute_leaderboard,
+    replay_elo,
+)
+from app.services.view_generations import LEADERBOARD, GenerationWatcher
+from app.services.writer import run_write
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'votes.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _random_votes(count, size, seed=0):
+    rng = np.random.default_rng(seed)
+    votes = np.empty(count, dtype=_VOTE_DTYPE)
+    votes["pokemon1_id"] = rng.integers(1, size + 1, count)
+    votes["pokemon2_id"] = (votes["pokemon1_id"] + rng.integers(1, size, count) - 1) % size + 1
+    votes["pokemon1_won"] = rng.random(count) < 0.5
+    return votes
+
+
+def _cast_votes(session_factory, votes):
+    with session_factory() as db:
+        for pokemon1_id, pokemon2_id, pokemon1_won in votes:
+            apply_elo_update(db, pokemon1_id, pokemon2_id, pokemon1_id if pokemon1_won else pokemon2_id)
+        db.commit()
+
+
+def _elos(session_factory):
+    with session_factory() as db:
+        return {row.pokemon_id: row.elo for row in db.query(PopularityLeaderboard)}
+
+
+def test_votes_are_logged(session_factory):
+    _cast_votes(session_factory, [(3, 7, False)])
+
+    with session_factory() as db:
+        vote = db.query(Vote).one()
+    assert (vote.pokemon1_id, vote.pokemon2_id, vote.pokemon1_won) == (3, 7, False)
+    assert vote.created_at > 0
+
+
+def test_replay_elo_matches_the_production_formula():
+    # Arrange
+    votes = _random_votes(5000, size=20)
+    expected = [DEFAULT_ELO] * 21
+    for pokemon1_id, pokemon2_id, pokemon1_won in votes.tolist():
+        expected[pokemon1_id], expected[pokemon2_id] = calculate_new_elos(
+            expected[pokemon1_id], expected[pokemon2_id], pokemon1_won
+        )
+
+    # Act
+    elos = replay_elo(votes, size=20)
+
+    # Assert
+    assert elos[1:].tolist() == expected[1:]
+
+
+@pytest.mark.parametrize("elo1, elo2", [(9500, 100), (100, 9500), (20000, 1000), (1000, 20000), (7000, 0), (0, 7000)])
+@pytest.mark.parametrize("pokemon1_won", [True, False])
+def test_replay_elo_matches_the_production_formula_at_huge_gaps(elo1, elo2, pokemon1_won):
+    # Arrange
+    votes = np.array([(1, 2, pokemon1_won)], dtype=_VOTE_DTYPE)
+
+    # Act
+    elos = replay_elo(votes, size=2, start=np.array([0, elo1, elo2]))
+
+    # Assert
+    assert tuple(elos[1:].tolist()) == calculate_new_elos(elo1, elo2, pokemon1_won)
+
+
+def test_delta_is_constant_beyond_the_table():
+    for won in (True, False):
+        assert calculate_elo_delta(0, _MAX_GAP, won) == calculate_elo_delta(0, 10 * _MAX_GAP, won)
+        assert calculate_elo_delta(_MAX_GAP, 0, won) == calculate_elo_delta(10 * _MAX_GAP, 0, won)
+
+
+def test_bradley_terry_recovers_the_order():
+    # Arrange - the lower id always wins; Pokemon 5 never plays
+    votes = np.array(
+        [(i, j, True) for i in range(1, 5) for j in range(i + 1, 5) for _ in range(10)],
+        dtype=_VOTE_DTYPE,
+    )
+
+    # Act
+    elos = fit_bradley_terry(votes, size=5)
+
+    # Assert
+    assert elos[1] > elos[2] > elos[3] > elos[4]
+    assert elos[5] == DEFAULT_ELO
+
+
+def test_recompute_rebuilds_a_corrupted_leaderboard(session_factory):
+    # Arrange
+    _cast_votes(session_factory, _random_votes(300, size=10).tolist())
+    expected = _elos(session_factory)
+    with session_factory() as db:
+        db.query(PopularityLeaderboard).update({"elo": 0})
+        db.commit()
+
+    # Act
+    result = recompute_leaderboard(session_factory, "elo", size=10)
+
+    # Assert
+    assert result["votes"] == 300
+    assert _elos(session_factory) == expected
+
+
+def test_swap_replays_votes_logged_after_the_read(session_factory):
+    # Arrange - the recompute read 200 votes, then 50 more arrived
+    votes = _random_votes(250, size=10).tolist()
+    _cast_votes(session_factory, votes[:200])
+    with session_factory() as db:
+        logged, last_vote_id = load_votes(db.connection())
+    _cast_votes(session_factory, votes[200:])
+    expected = _elos(session_factory)
+
+    # Act
+    with session_factory() as db:
+        tail = run_write(db, partial(
+            _swap_leaderboard, elos=replay_elo(logged, size=10), last_vote_id=last_vote_id, k_factor=48
+        ))
+
+    # Assert
+    assert tail == 50
+    assert _elos(session_factory) == expected
+
+
+def test_server_reloads_the_leaderboard_after_a_recompute_elsewhere(session_factory):
+    # Arrange - the server's index, loaded before the recompute
+    _cast_votes(session_factory, _random_votes(300, size=10).tolist())
+    expected = _elos(session_factory)
+    with session_factory() as db:
+        db.query(PopularityLeaderboard).update({"elo": 0})
+        db.commit()
+    index = LeaderboardIndex()
+    watcher = GenerationWatcher(session_factory, {LEADERBOARD: index.reload})
+    with session_factory() as db:
+        index.reload(db)
+    watcher.check()
+
+    # Act
+    recompute_leaderboard(session_factory, "elo", size=10)
+    changed = watcher.check()
+
+    # Assert
+    assert changed == [LEADERBOARD]
+    assert watcher.check() == []
+    assert {row["pokemon_id"]: row["elo"] for row in index.top(10)} == expected
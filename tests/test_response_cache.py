@@ -0,0 +1,121 @@
+import gzip
+import brotli
+from fastapi import status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.models import PopularityLeaderboard
+from app.services.response_cache import ResponseCache, encode_body, _etag_matches
+
+
+def _record_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    return statements, record
+
+
+def test_encode_body_compresses_large_payloads_only():
+    small = encode_body(b'{"a":1}')
+    large = encode_body(b'{"pokemon_id":1,"elo":1000},' * 100)
+
+    assert small.gzip is None and small.br is None
+    assert gzip.decompress(large.gzip) == large.identity
+    assert brotli.decompress(large.br) == large.identity
+    assert encode_body(large.identity).etag == large.etag
+
+
+def test_etag_matching_accepts_every_encoding_variant():
+    assert _etag_matches('"abc"', "abc")
+    assert _etag_matches('"other", "abc-gzip"', "abc")
+    assert _etag_matches('W/"abc-br"', "abc")
+    assert _etag_matches("*", "abc")
+    assert not _etag_matches('"abcd"', "abc")
+    assert not _etag_matches(None, "abc")
+
+
+def test_cache_rebuilds_when_version_changes():
+    cache = ResponseCache()
+    builds = []
+
+    def get(version):
+        body = cache.get("key", version)
+        if body is None:
+            builds.append(version)
+            body = cache.put("key", version, b"[%d]" % version)
+        return body
+
+    assert get(1) == get(1)
+    assert get(2).identity == b"[2]"
+    assert builds == [1, 2]
+
+
+def test_top_n_returns_304_without_sql(client, db_session):
+    # Arrange
+    db_session.add(PopularityLeaderboard(pokemon_id=1, elo=1100))
+    db_session.add(PopularityLeaderboard(pokemon_id=2, elo=1000))
+    db_session.commit()
+    first = client.get("/popularity/top/2")
+    etag = first.headers["ETag"]
+    statements, record = _record_statements()
+
+    # Act
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/popularity/top/2", headers={"If-None-Match": etag})
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    # Assert
+    assert first.status_code == status.HTTP_200_OK
+    assert first.headers["Cache-Control"].startswith("public, max-age=")
+    assert [row["pokemon_id"] for row in first.json()] == [1, 2]
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert statements == []
+
+
+def test_elo_change_invalidates_cached_response(client, db_session):
+    # Arrange
+    row = PopularityLeaderboard(pokemon_id=1, elo=1000)
+    db_session.add(row)
+    db_session.commit()
+    etag = client.get("/popularity/").headers["ETag"]
+
+    # Act
+    row.elo = 1200
+    db_session.commit()
+    response = client.get("/popularity/", headers={"If-None-Match": etag})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert response.json()[0]["elo"] == 1200
+
+
+def test_large_responses_are_served_compressed(client, db_session):
+    # Arrange
+    db_session.add_all(PopularityLeaderboard(pokemon_id=pokemon_id, elo=1000) for pokemon_id in range(1, 101))
+    db_session.commit()
+
+    # Act
+    br = client.get("/popularity/", headers={"Accept-Encoding": "br"})
+    gz = client.get("/popularity/", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("/popularity/", headers={"Accept-Encoding": "identity"})
+
+    # Assert
+    assert br.headers["Content-Encoding"] == "br"
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in plain.headers
+    assert br.json() == gz.json() == plain.json()
+    assert len({br.headers["ETag"], gz.headers["ETag"], plain.headers["ETag"]}) == 3
+
+
+def test_pokemon_otd_supports_conditional_requests(client):
+    first = client.get("/pokemon-otd")
+
+    response = client.get("/pokemon-otd", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert 0 <= int(first.headers["Cache-Control"].rsplit("=", 1)[1]) <= 86400
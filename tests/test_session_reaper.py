@@ -0,0 +1,72 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import ComparisonSession
+from app.services.session_reaper import SessionReaper, ensure_session_indexes
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _add_sessions(session_factory, count, expires_in, prefix):
+    expires_at = datetime.now(timezone.utc) + expires_in
+    with session_factory() as db:
+        for i in range(count):
+            db.add(ComparisonSession(session_id=f"{prefix}{i}", pokemon1_id=1, pokemon2_id=2, expires_at=expires_at))
+        db.commit()
+
+
+def test_reap_deletes_only_expired_sessions_in_batches(session_factory):
+    # Arrange
+    _add_sessions(session_factory, 25, timedelta(minutes=-1), "old")
+    _add_sessions(session_factory, 5, timedelta(minutes=10), "live")
+    reaper = SessionReaper(session_factory, batch_size=10)
+    
+    # Act
+    reaped = reaper.reap()
+    
+    # Assert
+    assert reaped == 25
+    assert reaper.stats() == {"runs": 1, "rows_reaped": 25, "table_size": 5}
+    with session_factory() as db:
+        remaining = {row.session_id for row in db.query(ComparisonSession)}
+    assert remaining == {f"live{i}" for i in range(5)}
+
+
+def test_reaper_thread_runs_until_stopped(session_factory):
+    # Arrange
+    _add_sessions(session_factory, 3, timedelta(minutes=-1), "old")
+    reaper = SessionReaper(session_factory, interval_seconds=60)
+    
+    # Act - the first run happens right after start
+    reaper.start()
+    reaper.stop()
+    
+    # Assert
+    assert reaper.runs == 1
+    assert reaper.rows_reaped == 3
+
+
+def test_expires_at_index_added_to_existing_database(tmp_path):
+    # Arrange - a database created before the index existed
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_comparison_sessions_expires_at")
+    
+    # Act
+    with engine.begin() as connection:
+        ensure_session_indexes(connection)
+        ensure_session_indexes(connection)
+    
+    # Assert
+    indexes = {index["name"] for index in inspect(engine).get_indexes("comparison_sessions")}
+    assert "ix_comparison_sessions_expires_at" in indexes
+    engine.dispose()
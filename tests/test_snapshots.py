@@ -0,0 +1,118 @@
+import pytest
+from datetime import datetime, timezone
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import LeaderboardSnapshot, PopularityLeaderboard
+from app.services.snapshots import SnapshotJob, compact_snapshots, take_snapshot, unpack
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'snapshots.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _seed(db, elos):
+    for pokemon_id, elo in elos.items():
+        db.add(PopularityLeaderboard(pokemon_id=pokemon_id, elo=elo))
+    db.commit()
+
+
+def test_snapshot_packs_elo_and_rank(db_session):
+    # Arrange
+    _seed(db_session, {1: 1000, 2: 1200, 3: 1100})
+
+    # Act
+    snapshot = take_snapshot(db_session, now=1000, size=4)
+
+    # Assert - one int16 per Pokemon; Pokemon 4 is not on the leaderboard
+    assert len(snapshot.elos) == 8
+    assert unpack(snapshot.elos) == [1000, 1200, 1100, 0]
+    assert unpack(snapshot.ranks) == [3, 1, 2, 0]
+
+
+def test_compaction_downsamples_hourly_daily_weekly(session_factory):
+    # Arrange - hourly snapshots for the last 30 days
+    now = 30 * DAY
+    with session_factory() as db:
+        for taken_at in range(0, now, HOUR):
+            db.add(LeaderboardSnapshot(taken_at=taken_at, resolution="hourly", elos=b"", ranks=b""))
+        db.commit()
+
+        # Act
+        compact_snapshots(db, now, hourly_retention_hours=48, daily_retention_days=14)
+        db.commit()
+
+        # Assert
+        counts = {
+            resolution: db.query(LeaderboardSnapshot).filter_by(resolution=resolution).count()
+            for resolution in ("hourly", "daily", "weekly")
+        }
+    assert counts["hourly"] == 48
+    # Days 16..27 stay daily (day 28-29 are hourly, days before 16 are weekly)
+    assert counts["daily"] == 12
+    # One per ISO week among days 0..15
+    weeks = {datetime.fromtimestamp(day * DAY, timezone.utc).isocalendar()[:2] for day in range(16)}
+    assert counts["weekly"] == len(weeks)
+
+
+def test_periodic_compaction_thins_like_a_single_pass(session_factory):
+    # Arrange - one hourly snapshot per hour for 30 days, compacted after each
+    now = 30 * DAY
+    with session_factory() as db:
+        for taken_at in range(0, now, HOUR):
+            db.add(LeaderboardSnapshot(taken_at=taken_at, resolution="hourly", elos=b"", ranks=b""))
+            db.flush()
+
+            # Act
+            compact_snapshots(db, taken_at + HOUR, hourly_retention_hours=48, daily_retention_days=14)
+        db.commit()
+
+        # Assert - same result as compacting the whole history once
+        counts = {
+            resolution: db.query(LeaderboardSnapshot).filter_by(resolution=resolution).count()
+            for resolution in ("hourly", "daily", "weekly")
+        }
+    weeks = {datetime.fromtimestamp(day * DAY, timezone.utc).isocalendar()[:2] for day in range(16)}
+    assert counts == {"hourly": 48, "daily": 12, "weekly": len(weeks)}
+
+
+def test_snapshot_job_takes_one_snapshot_per_interval(session_factory):
+    with session_factory() as db:
+        _seed(db, {1: 1000})
+    job = SnapshotJob(session_factory, interval_seconds=HOUR)
+
+    assert job.run_once(now=10 * HOUR + 5)
+    assert not job.run_once(now=10 * HOUR + 1800)
+    assert job.run_once(now=11 * HOUR)
+    assert job.snapshots == 2
+
+
+def test_history_endpoint(client, db_session):
+    # Arrange - two snapshots, Pokemon 2 overtakes Pokemon 1
+    _seed(db_session, {1: 1100, 2: 1000})
+    take_snapshot(db_session, now=1_700_000_000)
+    db_session.query(PopularityLeaderboard).filter_by(pokemon_id=2).update({"elo": 1200})
+    take_snapshot(db_session, now=1_700_003_600)
+    db_session.commit()
+
+    # Act
+    response = client.get("/popularity/2/history")
+    since = client.get("/popularity/2/history", params={"since": "2023-11-14T23:00:00Z"})
+
+    # Assert
+    assert response.status_code == status.HTTP_200_OK
+    points = response.json()["points"]
+    assert [(point["elo"], point["rank"]) for point in points] == [(1000, 2), (1200, 1)]
+    assert len(since.json()["points"]) == 1
+
+
+def test_history_unknown_pokemon(client):
+    assert client.get("/popularity/9999/history").status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+from fastapi import status
+from sqlalchemy import create_engine, delete, func, inspect, select
+from app.config import LAST_POKEMON_ID
+from app.models import PopularityLeaderboard
+from app.services import ranking as ranking_module
+from app.services import startup as startup_module
+from app.services.startup import get_startup, prepare_schema, schema_fingerprint, warm_pool
+
+
+def _user_version(engine):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def test_schema_is_prepared_once_per_fingerprint(tmp_path, monkeypatch):
+    # Arrange
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    ran = []
+
+    # Act
+    first = prepare_schema(engine)
+    second = prepare_schema(engine)
+    monkeypatch.setattr(startup_module, "_MIGRATIONS", startup_module._MIGRATIONS + (ran.append,))
+    after_new_migration = prepare_schema(engine)
+
+    # Assert
+    assert (first, second, after_new_migration) == (True, False, True)
+    assert len(ran) == 1
+    assert _user_version(engine) == schema_fingerprint(engine)
+    assert "favorite_counts" in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(PopularityLeaderboard)) == LAST_POKEMON_ID
+
+
+def test_leaderboard_is_seeded_on_every_start(tmp_path, monkeypatch):
+    # Arrange - a prepared database that lost rows, then a higher LAST_POKEMON_ID
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    prepare_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(delete(PopularityLeaderboard).where(PopularityLeaderboard.pokemon_id <= 10))
+    monkeypatch.setattr(ranking_module, "LAST_POKEMON_ID", LAST_POKEMON_ID + 5)
+
+    # Act
+    ran = prepare_schema(engine)
+
+    # Assert - the migrations are skipped, the seed is not
+    assert not ran
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(PopularityLeaderboard)) == LAST_POKEMON_ID + 5
+
+
+def test_warm_pool_leaves_connections_in_the_pool(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=3, max_overflow=0)
+
+    warm_pool(engine)
+
+    assert engine.pool.checkedin() == 3
+    assert engine.pool.checkedout() == 0
+
+
+def test_health_ready_reports_the_startup_breakdown(client, monkeypatch):
+    # Act
+    ready = client.get("/health/ready")
+    monkeypatch.setattr(get_startup(), "state", "stopping")
+    stopping = client.get("/health/ready")
+
+    # Assert
+    assert ready.status_code == status.HTTP_200_OK
+    assert ready.json()["status"] == "ready"
+    assert {"import_seconds", "schema_seconds", "load_seconds", "total_seconds"} <= ready.json()["startup"].keys()
+    assert stopping.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert stopping.json()["status"] == "stopping"
+
+
+def test_importing_the_app_does_not_load_crypto():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print(sorted({m.split('.')[0] for m in sys.modules} & {'jose', 'passlib', 'cryptography'}))"],
+        cwd=root, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+    assert loaded == "[]"
@@ -0,0 +1,186 @@
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import ComparisonSession, PopularityLeaderboard, VoteBufferCheckpoint
+from app.services import vote_buffer as vote_buffer_module
+from app.services.vote_buffer import VoteBuffer, VoteBufferFull, SessionAlreadyVoted
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'votes.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _add_sessions(session_factory, count):
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=10)
+    with session_factory() as db:
+        for i in range(count):
+            db.add(ComparisonSession(session_id=f"s{i}", pokemon1_id=1, pokemon2_id=2, expires_at=expires_at))
+        db.commit()
+
+
+def _elos(session_factory):
+    with session_factory() as db:
+        return {row.pokemon_id: row.elo for row in db.query(PopularityLeaderboard)}
+
+
+def _segments(directory):
+    return [name for name in os.listdir(directory) if name.startswith("segment-")]
+
+
+def test_flush_applies_votes_in_one_batch(tmp_path, session_factory):
+    # Arrange
+    _add_sessions(session_factory, 3)
+    buffer = VoteBuffer(str(tmp_path / "buffer"), session_factory, fsync=False)
+    buffer.open()
+    
+    # Act
+    for i in range(3):
+        buffer.append(f"s{i}", 1, 2, winner_pokemon_id=1)
+    applied = buffer.flush()
+    
+    # Assert
+    assert applied == 3
+    assert buffer.flushes == 1
+    elos = _elos(session_factory)
+    assert elos[1] > 1000 and elos[2] < 1000
+    with session_factory() as db:
+        assert db.query(ComparisonSession).count() == 0
+        assert db.get(VoteBufferCheckpoint, 1).last_seq == 3
+    # Only the fresh, empty segment remains
+    assert len(_segments(buffer.directory)) == 1
+    buffer.stop()
+
+
+def test_replay_after_crash_applies_each_vote_once(tmp_path, session_factory):
+    # Arrange - two votes are logged, the process dies before flushing
+    _add_sessions(session_factory, 2)
+    directory = str(tmp_path / "buffer")
+    crashed = VoteBuffer(directory, session_factory, fsync=False)
+    crashed.open()
+    crashed.append("s0", 1, 2, winner_pokemon_id=2)
+    crashed.append("s1", 1, 2, winner_pokemon_id=2)
+    with open(crashed._segments[-1][0], "a") as segment:
+        segment.write('{"seq": 3, "session_')  # torn write
+    
+    # Act
+    recovered = VoteBuffer(directory, session_factory, fsync=False)
+    replayed = recovered.open(replay=True)
+    elos_after_replay = _elos(session_factory)
+    recovered.stop()
+    
+    again = VoteBuffer(directory, session_factory, fsync=False)
+    replayed_again = again.open(replay=True)
+    again.stop()
+    
+    # Assert
+    assert replayed == 2
+    assert replayed_again == 0
+    assert elos_after_replay[2] > 1000
+    assert _elos(session_factory) == elos_after_replay
+
+
+def test_append_rejects_double_vote_and_full_buffer(tmp_path, session_factory):
+    buffer = VoteBuffer(str(tmp_path / "buffer"), session_factory, max_size=2, fsync=False)
+    buffer.open()
+    
+    buffer.append("s0", 1, 2, winner_pokemon_id=1)
+    with pytest.raises(SessionAlreadyVoted):
+        buffer.append("s0", 1, 2, winner_pokemon_id=2)
+    buffer.append("s1", 1, 2, winner_pokemon_id=1)
+    with pytest.raises(VoteBufferFull):
+        buffer.append("s2", 1, 2, winner_pokemon_id=1)
+    
+    assert buffer.pending == 2
+    buffer.stop()
+
+
+def test_flush_ignores_votes_on_consumed_sessions(tmp_path, session_factory):
+    # Arrange - only s0 exists; s1 was already consumed elsewhere
+    _add_sessions(session_factory, 1)
+    buffer = VoteBuffer(str(tmp_path / "buffer"), session_factory, fsync=False)
+    buffer.open()
+    buffer.append("s0", 1, 2, winner_pokemon_id=1)
+    buffer.append("s1", 1, 2, winner_pokemon_id=1)
+    
+    # Act
+    buffer.flush()
+    
+    # Assert - one vote worth of Elo moved
+    assert _elos(session_factory) == {1: 1024, 2: 976}
+    buffer.stop()
+
+
+def test_flush_applies_sessionless_token_votes(tmp_path, session_factory):
+    # Arrange - battle token votes carry no session to consume
+    buffer = VoteBuffer(str(tmp_path / "buffer"), session_factory, fsync=False)
+    buffer.open()
+    buffer.append(None, 1, 2, winner_pokemon_id=1)
+    buffer.append(None, 1, 2, winner_pokemon_id=2)
+    
+    # Act
+    applied = buffer.flush()
+    
+    # Assert
+    assert applied == 2
+    assert _elos(session_factory) == {1: 997, 2: 1003}
+    buffer.stop()
+
+
+def test_vote_endpoint_buffers_vote(client, db_session, tmp_path, session_factory, monkeypatch):
+    # Arrange
+    buffer = VoteBuffer(str(tmp_path / "buffer"), session_factory, fsync=False)
+    buffer.open()
+    monkeypatch.setattr(vote_buffer_module, "vote_buffer", buffer)
+    pair = client.get("/popularity/pair-to-battle").json()
+    
+    # Act
+    response = client.post(f"/popularity/vote/{pair['session_id']}/{pair['pokemon1_id']}")
+    duplicate = client.post(f"/popularity/vote/{pair['session_id']}/{pair['pokemon1_id']}")
+    
+    # Assert - accepted into the buffer; the session is consumed by the flusher
+    assert response.status_code == status.HTTP_200_OK
+    assert duplicate.status_code == status.HTTP_404_NOT_FOUND
+    assert buffer.pending == 1
+    assert db_session.query(ComparisonSession).filter_by(session_id=pair["session_id"]).count() == 1
+    buffer.stop()
+
+
+def test_votes_after_a_failed_flush_and_retry_survive_a_restart(tmp_path, session_factory, monkeypatch):
+    # Arrange - a flush fails and is retried without votes in between
+    _add_sessions(session_factory, 2)
+    directory = str(tmp_path / "buffer")
+    buffer = VoteBuffer(directory, session_factory, fsync=False)
+    buffer.open()
+    buffer.append("s0", 1, 2, winner_pokemon_id=1)
+    apply = buffer._apply
+
+    def failing_apply(votes):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(buffer, "_apply", failing_apply)
+    assert buffer.flush() == 0
+    monkeypatch.setattr(buffer, "_apply", apply)
+    assert buffer.flush() == 1
+
+    # Act - a vote goes to the open segment, then the process dies
+    buffer.append("s1", 1, 2, winner_pokemon_id=2)
+    assert os.path.exists(buffer._segments[-1][0])
+    buffer._file.close()
+
+    recovered = VoteBuffer(directory, session_factory, fsync=False)
+    replayed = recovered.open(replay=True)
+    recovered.stop()
+
+    # Assert
+    assert replayed == 1
+    with session_factory() as db:
+        assert db.get(VoteBufferCheckpoint, 1).last_seq == 2
+        assert db.query(ComparisonSession).count() == 0
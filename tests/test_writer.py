@@ -0,0 +1,125 @@
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import Base
+from app.models import PopularityLeaderboard
+from app.services import writer as writer_module
+from app.services.commit_hooks import call_after_commit
+from app.services.writer import WriteQueue, create_writer_engine, run_write
+
+
+@pytest.fixture
+def write_queue(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'writer.db'}"
+    Base.metadata.create_all(bind=create_engine(database_url))
+    queue = WriteQueue(create_writer_engine(database_url), max_delay_ms=50)
+    queue.start()
+    yield queue
+    queue.stop()
+
+
+def _insert_row(db: Session, pokemon_id: int) -> int:
+    row = PopularityLeaderboard(pokemon_id=pokemon_id, elo=1000)
+    db.add(row)
+    db.flush()
+    return row.id
+
+
+def _fail(db: Session):
+    db.add(PopularityLeaderboard(pokemon_id=999, elo=1000))
+    db.flush()
+    raise HTTPException(status_code=400, detail="bad op")
+
+
+def _count_rows(db: Session) -> int:
+    return db.query(PopularityLeaderboard).count()
+
+
+def test_write_queue_groups_ops_into_one_commit(write_queue):
+    # Act - submit without waiting so all ops land in the same batch
+    futures = [write_queue.submit(lambda db, i=i: _insert_row(db, i)) for i in range(1, 11)]
+    ids = [future.result() for future in futures]
+    
+    # Assert
+    assert len(set(ids)) == 10
+    assert write_queue.commits == 1
+    assert write_queue.ops == 10
+
+
+def test_write_queue_isolates_failing_op(write_queue):
+    # Act
+    ok_before = write_queue.submit(lambda db: _insert_row(db, 1))
+    failing = write_queue.submit(_fail)
+    ok_after = write_queue.submit(lambda db: _insert_row(db, 2))
+    
+    # Assert - the failing op is reported to its caller only and rolled back
+    assert ok_before.result() is not None
+    assert ok_after.result() is not None
+    with pytest.raises(HTTPException):
+        failing.result()
+    assert write_queue.submit(_count_rows).result() == 2
+
+
+def test_write_queue_concurrent_submitters(write_queue):
+    # Act
+    threads = [
+        threading.Thread(target=lambda i=i: write_queue.submit(lambda db: _insert_row(db, i)).result())
+        for i in range(1, 51)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    # Assert
+    assert write_queue.submit(_count_rows).result() == 50
+    assert write_queue.commits < 50
+
+
+def test_run_write_uses_running_writer(write_queue, db_session, monkeypatch):
+    # Arrange
+    monkeypatch.setattr(writer_module, "writer", write_queue)
+    
+    # Act
+    run_write(db_session, lambda db: _insert_row(db, 7))
+    
+    # Assert - the row went to the writer's database, not the request session's
+    assert write_queue.submit(_count_rows).result() == 1
+    assert db_session.query(PopularityLeaderboard).count() == 0
+
+
+def test_submit_requires_running_writer(tmp_path):
+    queue = WriteQueue(create_writer_engine(f"sqlite:///{tmp_path / 'idle.db'}"))
+    with pytest.raises(RuntimeError):
+        queue.submit(_count_rows)
+
+
+class _FailingCommitSession(Session):
+    def commit(self):
+        raise RuntimeError("disk I/O error")
+
+
+def test_after_commit_callbacks_wait_for_the_group_commit(tmp_path):
+    # Arrange - a writer whose group commit fails
+    database_url = f"sqlite:///{tmp_path / 'writer.db'}"
+    Base.metadata.create_all(bind=create_engine(database_url))
+    engine = create_writer_engine(database_url)
+    queue = WriteQueue(engine)
+    queue._session_factory = sessionmaker(bind=engine, class_=_FailingCommitSession)
+    queue.start()
+    applied = []
+
+    def op(db: Session):
+        _insert_row(db, 1)
+        call_after_commit(db, lambda: applied.append(1))
+
+    # Act
+    future = queue.submit(op)
+    with pytest.raises(RuntimeError):
+        future.result()
+    queue.stop()
+
+    # Assert - the SAVEPOINT was released, but nothing was committed
+    assert applied == []